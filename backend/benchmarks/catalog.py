@@ -0,0 +1,86 @@
+"""
+Synthetic catalog seeding for benchmarks.
+
+Generates deterministic artist documents with ``resources/generate_catalog.py``
+(so the genre mix, places and discography shape follow the real datasets)
+and bulk-loads them into a benchmark database.
+"""
+import random
+import time
+from typing import Dict, Iterator, List
+
+from indexes import ensure_indexes
+from resources.generate_catalog import generate_artists as _generate, load_model
+from services.artist_documents import prepare_artist_document
+from services.facets import rebuild_facet_counts
+from services.tracks import rebuild_tracks
+
+# Learned once from the real datasets in resources/.
+MODEL = load_model()
+
+# (city, location string, latitude, longitude) for the most common places.
+CITIES = [
+    (city, f"{city}, {country}", lat, lon)
+    for city, country, lat, lon in MODEL.top_places(20)
+]
+
+GENRES = [genre for genre, _ in MODEL.genres.most_common()]
+
+
+def generate_artists(count: int, seed: int = 42) -> Iterator[Dict]:
+    """Yield ``count`` deterministic synthetic artist documents."""
+    return _generate(MODEL, count, seed=seed)
+
+
+def _reservoir_add(sample: List[str], seen: int, value: str, rng: random.Random,
+                   size: int = 1000) -> None:
+    """Keep a uniform random sample of ``size`` values from a stream."""
+    if len(sample) < size:
+        sample.append(value)
+        return
+    slot = rng.randrange(seen)
+    if slot < size:
+        sample[slot] = value
+
+
+def seed_catalog(db, count: int, seed: int = 42, batch_size: int = 5000) -> Dict:
+    """
+    Replace the ``artists`` collection with ``count`` synthetic artists and
+    build the declared indexes once the data is loaded.
+
+    Returns:
+        Seeding stats plus a uniform sample of artist names and album titles
+        the benchmark scenarios can look up.
+    """
+    collection = db.artists
+    collection.drop()
+
+    started = time.perf_counter()
+    sample_rng = random.Random(seed + 1)
+    names: List[str] = []
+    titles: List[str] = []
+    with_albums = 0
+    batch: List[Dict] = []
+    for index, artist in enumerate(generate_artists(count, seed)):
+        batch.append(prepare_artist_document(artist))
+        _reservoir_add(names, index + 1, artist["name"], sample_rng)
+        if artist["albums"]:
+            with_albums += 1
+            _reservoir_add(titles, with_albums, artist["albums"][0]["title"], sample_rng)
+        if len(batch) >= batch_size:
+            collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+    loaded = time.perf_counter()
+    ensure_indexes(db, background=False)
+    rebuild_facet_counts(db)
+    rebuild_tracks(db)
+
+    return {
+        "count": count,
+        "seconds": time.perf_counter() - started,
+        "index_seconds": time.perf_counter() - loaded,
+        "names": names,
+        "titles": titles,
+    }
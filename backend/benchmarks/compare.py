@@ -0,0 +1,63 @@
+"""
+Compare two benchmark result files produced by ``benchmarks.run``.
+
+Usage::
+
+    python -m benchmarks.compare benchmarks/results/OLD.jsonl benchmarks/results/NEW.jsonl
+
+Rows are matched by catalog size and scenario; the latest row wins when a
+file holds several runs. Changes in throughput and p50/p99 latency are
+printed as percentages (positive throughput and negative latency are
+improvements).
+"""
+import argparse
+import json
+from pathlib import Path
+from typing import Dict, Tuple
+
+
+def load_results(path: Path) -> Dict[Tuple[int, str], Dict]:
+    rows = {}
+    with path.open(encoding="utf-8") as results:
+        for line in results:
+            if line.strip():
+                row = json.loads(line)
+                rows[(row["size"], row["scenario"])] = row
+    return rows
+
+
+def _change(old, new) -> str:
+    if not old or new is None:
+        return "n/a"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def compare(baseline: Path, candidate: Path) -> None:
+    old_rows = load_results(baseline)
+    new_rows = load_results(candidate)
+    print(f"{'size':>9}  {'scenario':<28} {'req/s':>9} {'change':>8} "
+          f"{'p50 ms':>9} {'change':>8} {'p99 ms':>9} {'change':>8}")
+    for key in sorted(set(old_rows) & set(new_rows)):
+        old, new = old_rows[key], new_rows[key]
+        if key[1] == "seed":
+            print(f"{key[0]:>9}  {'seed':<28} {new['docs_per_s']:>9.1f} "
+                  f"{_change(old['docs_per_s'], new['docs_per_s']):>8}")
+            continue
+        print(f"{key[0]:>9}  {key[1]:<28} {new['throughput_rps']:>9.1f} "
+              f"{_change(old['throughput_rps'], new['throughput_rps']):>8} "
+              f"{new['p50_ms']:>9.2f} {_change(old['p50_ms'], new['p50_ms']):>8} "
+              f"{new['p99_ms']:>9.2f} {_change(old['p99_ms'], new['p99_ms']):>8}")
+    for key in sorted(set(new_rows) - set(old_rows)):
+        print(f"{key[0]:>9}  {key[1]:<28} (new)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("baseline", type=Path)
+    parser.add_argument("candidate", type=Path)
+    args = parser.parse_args(argv)
+    compare(args.baseline, args.candidate)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,372 @@
+"""
+Reproducible benchmark suite for every API endpoint.
+
+For each catalog size the suite seeds a local MongoDB database with
+synthetic artists, starts the API (and the local geocoder/cloud stand-ins
+from ``benchmarks.stubs``) as subprocesses, then drives every route with
+concurrent clients for a fixed duration. Throughput, latency percentiles and
+server memory are appended as JSON lines so runs can be compared over time
+with ``python -m benchmarks.compare``.
+
+Usage (from the ``backend`` directory, with MongoDB running)::
+
+    python -m benchmarks.run --sizes 10000 100000 1000000 --concurrency 32
+    python -m benchmarks.run --sizes 10000 --scenarios artist_by_name artists_radius
+
+The benchmark database (``--database``, default ``cfyby_bench``) is dropped
+and re-seeded for every size; the application database is never touched.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+from urllib.parse import quote
+
+import httpx
+from pymongo import MongoClient
+
+from benchmarks.catalog import CITIES, GENRES, seed_catalog
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+class Scenario(NamedTuple):
+    """One benchmarked request pattern."""
+    name: str
+    method: str
+    path: Callable[[random.Random, Dict], str]
+    body: Optional[Callable[[random.Random, Dict, int], Dict]] = None
+    # Skip the scenario above this catalog size (unbounded result sets).
+    max_size: Optional[int] = None
+
+
+def _city(rng):
+    return rng.choice(CITIES)
+
+
+def _name(rng, sample):
+    return rng.choice(sample["names"])
+
+
+def _misspelled(rng, name):
+    """The name with one letter replaced."""
+    position = rng.randrange(len(name))
+    return name[:position] + rng.choice("abcdefghijklmnopqrstuvwxyz") + name[position + 1:]
+
+
+def _title(rng, sample):
+    return rng.choice(sample["titles"] or ["missing"])
+
+
+def _radius_path(rng):
+    _, _, latitude, longitude = _city(rng)
+    return (f"/artists?genre={rng.choice(GENRES)}&latitude={latitude}"
+            f"&longitude={longitude}&radius=50")
+
+
+def _new_artist(rng, sample, counter):
+    return {
+        "genre": rng.choice(GENRES),
+        "name": f"Benchmark Artist {os.getpid()}-{counter}-{rng.random():.12f}",
+        "location": _city(rng)[1],
+        "summary": "Registered during a benchmark run.",
+        "image": "https://example.com/benchmark.jpg",
+    }
+
+
+def _new_album(rng, sample, counter):
+    return {
+        "title": f"Benchmark Album {counter}-{rng.random():.12f}",
+        "year": str(rng.randint(1960, 2025)),
+        "rating": None,
+        "tracks": [{"title": f"Track {n}", "duration": "3:30"} for n in range(8)],
+    }
+
+
+def _name_batch(rng, sample, counter):
+    return {"names": [_name(rng, sample) for _ in range(50)]}
+
+
+SCENARIOS: List[Scenario] = [
+    Scenario("artists_all", "GET", lambda r, s: "/artists", max_size=10_000),
+    Scenario("artists_genre", "GET",
+             lambda r, s: f"/artists?genre={quote(r.choice(GENRES))}", max_size=100_000),
+    Scenario("artists_genre_country", "GET",
+             lambda r, s: f"/artists?genre={quote(r.choice(GENRES))}&country={quote(_city(r)[1].split(', ')[-1])}",
+             max_size=100_000),
+    Scenario("artists_radius", "GET", lambda r, s: _radius_path(r), max_size=100_000),
+    Scenario("artists_radius_geocoded", "GET",
+             lambda r, s: f"/artists?genre={quote(r.choice(GENRES))}&location={quote(_city(r)[0])}&radius=50",
+             max_size=100_000),
+    Scenario("artists_by_genre", "GET",
+             lambda r, s: f"/artists/genre?genre={quote(r.choice(GENRES))}&n=20"),
+    Scenario("artists_by_genre_location", "GET",
+             lambda r, s: f"/artists/location?genre={quote(r.choice(GENRES))}&location={quote(_city(r)[0])}&n=20"),
+    Scenario("local_audio", "GET", lambda r, s: "/local/audio"),
+    Scenario("local_audio_list_fields", "GET",
+             lambda r, s: "/local/audio?fields=name,genre,location,image"),
+    Scenario("facets", "GET", lambda r, s: "/facets"),
+    Scenario("facets_genre", "GET", lambda r, s: f"/facets?genre={quote(r.choice(GENRES))}"),
+    Scenario("artist_by_name", "GET", lambda r, s: f"/artists/{quote(_name(r, s))}"),
+    Scenario("artists_batch", "POST", lambda r, s: "/artists/batch", _name_batch),
+    Scenario("autocomplete", "GET",
+             lambda r, s: f"/autocomplete?q={quote(_name(r, s)[:r.randint(1, 4)])}"),
+    Scenario("artists_fuzzy", "GET",
+             lambda r, s: f"/artists/fuzzy?q={quote(_misspelled(r, _name(r, s)))}"),
+    Scenario("tracks_search", "GET",
+             lambda r, s: f"/tracks/search?q={quote(_title(r, s).split()[0])}"),
+    Scenario("albums_by_runtime", "GET",
+             lambda r, s: f"/albums?max_minutes={r.choice((30, 40, 50))}"),
+    Scenario("artist_description", "GET", lambda r, s: f"/artists/{quote(_name(r, s))}/description"),
+    Scenario("artist_image", "GET", lambda r, s: f"/artists/{quote(_name(r, s))}/image"),
+    Scenario("artist_albums", "GET", lambda r, s: f"/artists/{quote(_name(r, s))}/albums"),
+    Scenario("album_description", "GET", lambda r, s: f"/albums/{quote(_title(r, s))}/description"),
+    Scenario("cloud_artists", "GET", lambda r, s: f"/cloud/artists?genre={quote(r.choice(GENRES))}"),
+    Scenario("federated_artists", "GET",
+             lambda r, s: f"/federated/artists?genre={quote(r.choice(GENRES))}", max_size=100_000),
+    Scenario("register_artist", "POST", lambda r, s: "/artists/register", _new_artist),
+    Scenario("register_discography", "POST",
+             lambda r, s: f"/artists/register/discography?artist_name={quote(_name(r, s))}",
+             _new_album),
+]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _process_tree(pid: int) -> List[int]:
+    """The process and all of its descendants (Linux only)."""
+    pids = [pid]
+    for task in Path(f"/proc/{pid}/task").glob("*"):
+        try:
+            children = (task / "children").read_text().split()
+        except OSError:
+            continue
+        for child in children:
+            pids.extend(_process_tree(int(child)))
+    return pids
+
+
+def _memory_mb(pid: int) -> Dict[str, Optional[float]]:
+    """Resident and peak resident memory summed over the server's processes."""
+    rss = peak = 0
+    found = False
+    for member in _process_tree(pid):
+        try:
+            status = Path(f"/proc/{member}/status").read_text()
+        except OSError:
+            continue
+        found = True
+        for line in status.splitlines():
+            if line.startswith("VmRSS:"):
+                rss += int(line.split()[1])
+            elif line.startswith("VmHWM:"):
+                peak += int(line.split()[1])
+    if not found:
+        return {"rss_mb": None, "peak_rss_mb": None}
+    return {"rss_mb": round(rss / 1024, 1), "peak_rss_mb": round(peak / 1024, 1)}
+
+
+def _start_server(module: str, port: int, env: Dict[str, str], workers: int = 1):
+    if module == "main:app":
+        # The API runs the way it is deployed, through serve.py.
+        env = dict(env, WEB_HOST="127.0.0.1", WEB_PORT=str(port), WEB_WORKERS=str(workers))
+        command = [sys.executable, "serve.py"]
+        # Wait for warmup (indexes, search indexes) so it is not benchmarked.
+        probe = "/ready"
+    else:
+        command = [sys.executable, "-m", "uvicorn", module, "--host", "127.0.0.1",
+                   "--port", str(port), "--log-level", "warning"]
+        probe = "/docs"
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{module} exited with code {process.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}{probe}", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"{module} did not start within 60s")
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def _drive(base_url: str, scenario: Scenario, sample: Dict, concurrency: int,
+                 duration: float, seed: int) -> Dict:
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    counter = [0]
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        deadline = time.perf_counter() + duration
+
+        async def worker(worker_id: int):
+            rng = random.Random(seed * 1000 + worker_id)
+            while time.perf_counter() < deadline:
+                counter[0] += 1
+                path = scenario.path(rng, sample)
+                body = scenario.body(rng, sample, counter[0]) if scenario.body else None
+                started = time.perf_counter()
+                try:
+                    response = await client.request(scenario.method, path, json=body)
+                    await response.aread()
+                    statuses[response.status_code] += 1
+                except httpx.HTTPError:
+                    statuses["error"] += 1
+                latencies.append(time.perf_counter() - started)
+
+        began = time.perf_counter()
+        await asyncio.gather(*(worker(index) for index in range(concurrency)))
+        elapsed = time.perf_counter() - began
+
+    latencies.sort()
+    errors = sum(count for status, count in statuses.items()
+                 if status == "error" or int(status) >= 500)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": {str(status): count for status, count in statuses.items()},
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 3),
+        "p90_ms": round(_percentile(latencies, 0.90) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+    }
+
+
+def run(args) -> Path:
+    RESULTS_DIR.mkdir(exist_ok=True)
+    run_id = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{run_id}.jsonl"
+    metadata = {
+        "run_id": run_id,
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "concurrency": args.concurrency,
+        "duration_s": args.duration,
+        "workers": args.workers,
+        "seed": args.seed,
+    }
+
+    scenarios = [scenario for scenario in SCENARIOS
+                 if not args.scenarios or scenario.name in args.scenarios]
+    mongo = MongoClient(args.mongo_url)
+    db = mongo[args.database]
+
+    stub_port = _free_port()
+    stub = _start_server("benchmarks.stubs:app", stub_port, dict(os.environ))
+    env = dict(
+        os.environ,
+        MONGO_URL=args.mongo_url,
+        MONGO_DB=args.database,
+        AWS_URL=f"http://127.0.0.1:{stub_port}",
+        AWS_TOKEN="benchmark-token",
+        GEOCODER_DOMAIN=f"127.0.0.1:{stub_port}",
+        GEOCODER_SCHEME="http",
+    )
+
+    try:
+        with output.open("a", encoding="utf-8") as results:
+            for size in args.sizes:
+                print(f"Seeding {size} artists into '{args.database}'...")
+                sample = seed_catalog(db, size, seed=args.seed)
+                seed_row = dict(metadata, size=size, scenario="seed",
+                                seconds=round(sample["seconds"], 3),
+                                index_seconds=round(sample["index_seconds"], 3),
+                                docs_per_s=round(size / sample["seconds"], 1))
+                results.write(json.dumps(seed_row) + "\n")
+
+                port = _free_port()
+                api = _start_server("main:app", port, env, workers=args.workers)
+                try:
+                    base_url = f"http://127.0.0.1:{port}"
+                    for scenario in scenarios:
+                        if scenario.max_size and size > scenario.max_size:
+                            print(f"  {scenario.name:<28} skipped at size {size}")
+                            continue
+                        if args.warmup:
+                            asyncio.run(_drive(base_url, scenario, sample, args.concurrency,
+                                               args.warmup, args.seed))
+                        stats = asyncio.run(_drive(base_url, scenario, sample, args.concurrency,
+                                                   args.duration, args.seed))
+                        row = dict(metadata, size=size, scenario=scenario.name, **stats,
+                                   **_memory_mb(api.pid))
+                        results.write(json.dumps(row) + "\n")
+                        results.flush()
+                        print(f"  {scenario.name:<28} {row['throughput_rps']:>9.1f} req/s  "
+                              f"p50 {row['p50_ms']:>8.2f} ms  p99 {row['p99_ms']:>8.2f} ms  "
+                              f"errors {row['errors']}")
+                finally:
+                    api.terminate()
+                    api.wait(timeout=30)
+    finally:
+        stub.terminate()
+        stub.wait(timeout=30)
+        if not args.keep_data:
+            mongo.drop_database(args.database)
+
+    print(f"Results written to {output}")
+    return output
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every CFYBY API endpoint.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000],
+                        help="Catalog sizes to seed and benchmark")
+    parser.add_argument("--scenarios", nargs="*", default=None,
+                        help=f"Subset of scenarios: {', '.join(s.name for s in SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0,
+                        help="Measured seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=2.0,
+                        help="Unmeasured warmup seconds per scenario")
+    parser.add_argument("--workers", type=int, default=1, help="API worker processes")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mongo-url", default=os.getenv("MONGO_URL", "mongodb://localhost:27017/"))
+    parser.add_argument("--database", default="cfyby_bench")
+    parser.add_argument("--output", default=None, help="JSON lines file to append results to")
+    parser.add_argument("--keep-data", action="store_true",
+                        help="Keep the benchmark database after the run")
+    run(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Local stand-ins for the geocoder and the cloud service.
+
+Serves a Nominatim-compatible ``/search`` endpoint and a cloud-service
+``/artists`` endpoint from one small app, so benchmarks never touch the
+network. Point the API at it with::
+
+    GEOCODER_DOMAIN=127.0.0.1:<port> GEOCODER_SCHEME=http
+    AWS_URL=http://127.0.0.1:<port> AWS_TOKEN=bench
+
+Run with ``uvicorn benchmarks.stubs:app --port <port>``. ``STUB_LATENCY_MS``
+adds an artificial delay to every response to mimic the real services.
+"""
+import asyncio
+import hashlib
+import os
+
+from fastapi import FastAPI, Header, HTTPException
+
+from benchmarks.catalog import CITIES
+
+STUB_LATENCY_MS = float(os.getenv("STUB_LATENCY_MS", "0"))
+
+app = FastAPI(title="CFYBY benchmark stubs")
+
+_KNOWN_PLACES = {city.lower(): (lat, lon) for city, _, lat, lon in CITIES}
+
+
+async def _delay():
+    if STUB_LATENCY_MS > 0:
+        await asyncio.sleep(STUB_LATENCY_MS / 1000)
+
+
+def _coordinates_for(query: str):
+    """Known cities resolve exactly; anything else hashes to a stable point."""
+    city = query.split(",")[0].strip().lower()
+    if city in _KNOWN_PLACES:
+        return _KNOWN_PLACES[city]
+    digest = hashlib.sha1(query.lower().encode("utf-8")).digest()
+    lat = (int.from_bytes(digest[:4], "big") / 2**32) * 120 - 60
+    lon = (int.from_bytes(digest[4:8], "big") / 2**32) * 360 - 180
+    return lat, lon
+
+
+@app.get("/search")
+async def nominatim_search(q: str):
+    """Nominatim-compatible geocoding response."""
+    await _delay()
+    lat, lon = _coordinates_for(q)
+    return [{
+        "place_id": 1,
+        "lat": str(lat),
+        "lon": str(lon),
+        "display_name": q,
+        "boundingbox": [str(lat - 0.1), str(lat + 0.1), str(lon - 0.1), str(lon + 0.1)],
+    }]
+
+
+@app.get("/artists")
+async def cloud_artists(
+    genre: str = None,
+    country: str = None,
+    city: str = None,
+    authorization: str = Header(default=""),
+):
+    """Cloud-service-compatible artist listing."""
+    if not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Missing token")
+    await _delay()
+    results = [
+        {"name": f"Cloud Artist {index}", "genre": genre or "rock",
+         "country": country or "United States", "city": city or "Seattle"}
+        for index in range(25)
+    ]
+    return {"results": results}
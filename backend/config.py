@@ -16,6 +16,10 @@ class Config:
 
     # MongoDB configuration
     MONGO_URL = os.getenv("MONGO_URL", "mongodb://mongodb:27017/")
+    MONGO_DB = os.getenv("MONGO_DB", "cfyby")
+    # Connection pool per worker process (total = workers x pool size)
+    MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+    MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
 
     # Cloud service configuration
     AWS_URL = os.getenv("AWS_URL", "")
@@ -24,6 +28,110 @@ class Config:
     # HTTP client configuration
     HTTP_TIMEOUT = int(os.getenv("HTTP_TIMEOUT", "30"))
     HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+    # Keep-alive connections per upstream host in each worker's HTTP session
+    HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "10"))
+
+    # Server processes started by serve.py (0 = one per available CPU)
+    WEB_HOST = os.getenv("WEB_HOST", "0.0.0.0")
+    WEB_PORT = int(os.getenv("WEB_PORT", "8000"))
+    WEB_WORKERS = int(os.getenv("WEB_WORKERS", "0"))
+    # Recycle a worker after this many requests (0 = never), plus up to
+    # WEB_MAX_REQUESTS_JITTER more so workers do not all restart together
+    WEB_MAX_REQUESTS = int(os.getenv("WEB_MAX_REQUESTS", "0"))
+    WEB_MAX_REQUESTS_JITTER = int(os.getenv("WEB_MAX_REQUESTS_JITTER", "0"))
+    # Seconds a stopping worker may spend finishing in-flight requests
+    WEB_GRACEFUL_TIMEOUT = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+    # Directory where workers share metrics so /metrics sums every worker
+    # (serve.py uses a fresh temporary directory when this is empty and it
+    # runs more than one worker), and how often each worker writes it
+    METRICS_DIR = os.getenv("METRICS_DIR", "")
+    METRICS_WRITE_SECONDS = float(os.getenv("METRICS_WRITE_SECONDS", "5"))
+
+    # Geocoder configuration (defaults to the public Nominatim service)
+    GEOCODER_DOMAIN = os.getenv("GEOCODER_DOMAIN", "")
+    GEOCODER_SCHEME = os.getenv("GEOCODER_SCHEME", "https")
+
+    # Federated search configuration (milliseconds)
+    FEDERATED_DEADLINE_MS = int(os.getenv("FEDERATED_DEADLINE_MS", "2000"))
+    FEDERATED_MAX_DEADLINE_MS = int(os.getenv("FEDERATED_MAX_DEADLINE_MS", "10000"))
+
+    # Query diagnostics (slow-query log with explain capture)
+    QUERY_DIAGNOSTICS = os.getenv("QUERY_DIAGNOSTICS", "false").lower() in ("1", "true", "yes")
+    SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+
+    # Index management at startup: "background" (don't delay readiness),
+    # "foreground" (ready only once indexes exist) or "off"
+    INDEX_BUILD = os.getenv("INDEX_BUILD", "background").lower()
+
+    # A worker whose startup warmup fails retries it in the background,
+    # waiting this long first and doubling the wait up to the maximum
+    WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "1"))
+    WARMUP_RETRY_MAX_SECONDS = float(os.getenv("WARMUP_RETRY_MAX_SECONDS", "30"))
+
+    # How long each worker serves /facets from memory before re-reading the
+    # materialized counts (registrations in the same worker invalidate it)
+    FACETS_CACHE_SECONDS = float(os.getenv("FACETS_CACHE_SECONDS", "30"))
+
+    # Response compression: bodies smaller than this are sent as is
+    COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+
+    # Per-worker cache of hot GET responses (0 disables it), kept with their
+    # compressed variants so popular queries are compressed once
+    RESPONSE_CACHE_SECONDS = float(os.getenv("RESPONSE_CACHE_SECONDS", "0"))
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512"))
+    RESPONSE_CACHE_PATHS = tuple(
+        path.strip()
+        for path in os.getenv(
+            "RESPONSE_CACHE_PATHS", "/artists,/artists/genre,/artists/location,/local/audio,/facets"
+        ).split(",")
+        if path.strip()
+    )
+
+    # Most names and ids accepted by one POST /artists/batch request
+    BATCH_MAX_ARTISTS = int(os.getenv("BATCH_MAX_ARTISTS", "100"))
+
+    # Suggestions kept per prefix by /autocomplete
+    AUTOCOMPLETE_TOP_K = int(os.getenv("AUTOCOMPLETE_TOP_K", "10"))
+
+    # Minimum trigram similarity (0-1) for fuzzy artist name matches
+    FUZZY_MIN_SIMILARITY = float(os.getenv("FUZZY_MIN_SIMILARITY", "0.3"))
+
+    # Serve the genre, location, name and radius endpoints from an in-process
+    # catalog snapshot loaded at startup instead of querying MongoDB
+    CATALOG_SNAPSHOT = os.getenv("CATALOG_SNAPSHOT", "false").lower() in ("1", "true", "yes")
+
+    # Binary catalog file (see services/catalog_file.py) to load the catalog
+    # snapshot from instead of MongoDB; "" to always read the database
+    CATALOG_FILE = os.getenv("CATALOG_FILE", "")
+
+    # Albums per bucket for registered discographies (see
+    # services/album_buckets.py); keep it fixed once buckets exist
+    ALBUM_BUCKET_SIZE = int(os.getenv("ALBUM_BUCKET_SIZE", "50"))
+
+    # How long the result of a POST sent with an Idempotency-Key is kept for
+    # retries to replay
+    IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+
+    # Per-client token-bucket rate limits (see utils/rate_limit.py). Each
+    # budget is "rate:burst": tokens refilled per second and the bucket size;
+    # 0 leaves it unlimited. Clients are keyed by X-API-Key when it is one of
+    # RATE_LIMIT_API_KEYS (comma-separated), else by address. Buckets are per
+    # worker process: with N serve.py workers a client can get N x each budget.
+    RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "false").lower() in ("1", "true", "yes")
+    RATE_LIMIT_DEFAULT = os.getenv("RATE_LIMIT_DEFAULT", "50:100")
+    RATE_LIMIT_RADIUS = os.getenv("RATE_LIMIT_RADIUS", "2:5")
+    RATE_LIMIT_CLOUD = os.getenv("RATE_LIMIT_CLOUD", "1:5")
+    RATE_LIMIT_REGISTER = os.getenv("RATE_LIMIT_REGISTER", "0.2:10")
+    RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "100000"))
+    RATE_LIMIT_API_KEYS = frozenset(
+        key.strip() for key in os.getenv("RATE_LIMIT_API_KEYS", "").split(",") if key.strip()
+    )
+
+    # How often each worker checks the catalog changelog for other workers'
+    # writes to invalidate (0 disables it), and whether to also follow it
+    # through a change stream when MongoDB runs as a replica set
+    CATALOG_POLL_SECONDS = float(os.getenv("CATALOG_POLL_SECONDS", "1"))
+    CATALOG_CHANGE_STREAM = os.getenv("CATALOG_CHANGE_STREAM", "true").lower() in ("1", "true", "yes")
 
     @classmethod
     def validate(cls):
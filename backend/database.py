@@ -1,8 +1,79 @@
-from pymongo import MongoClient
+import os
+import threading
+
+import pymongo
+
 from config import Config
+from utils.metrics import MongoCommandMetrics
+from utils.query_diagnostics import diagnostics
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the shared MongoClient, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                client = pymongo.MongoClient(
+                    Config.MONGO_URL,
+                    maxPoolSize=Config.MONGO_MAX_POOL_SIZE,
+                    minPoolSize=Config.MONGO_MIN_POOL_SIZE,
+                    event_listeners=[MongoCommandMetrics(), diagnostics],
+                )
+                diagnostics.attach_client(client)
+                _client = client
+    return _client
+
+
+def get_database():
+    """Return the application database."""
+    return get_client()[Config.MONGO_DB]
+
+
+def close_client():
+    """Close the shared MongoClient; the next use creates a new one."""
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        client.close()
+
+
+def _forget_client_after_fork():
+    """
+    Drop a client inherited from the parent process.
+
+    MongoClient is not fork-safe: the child must not use (or close, which
+    would talk to the server over the parent's sockets) the parent's pools,
+    so it simply forgets them and connects again on first use.
+    """
+    global _client, _client_lock
+    _client = None
+    _client_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_client_after_fork)
+
+
+class LazyDatabase:
+    """
+    Stand-in for the pymongo Database that connects on first use.
+
+    Importing this module (and so ``main``) does not create a client; the
+    app lifespan connects eagerly, and scripts or tests connect on their
+    first query.
+    """
+
+    def __getattr__(self, name):
+        return getattr(get_database(), name)
+
+    def __getitem__(self, name):
+        return get_database()[name]
 
-# Initialize the MongoDB client
-client = MongoClient(Config.MONGO_URL)
 
 # Get the database
-db = client.cfyby
+db = LazyDatabase()
@@ -0,0 +1,341 @@
+"""
+Declarative index management.
+
+``INDEXES`` is the single source of truth for the indexes every collection
+should have. ``ensure_indexes`` creates whatever is missing (safe to run any
+number of times), ``index_drift`` compares the declaration with what the
+database actually has, and ``backfill_derived_fields`` fills in the indexed
+fields for documents written before they existed.
+
+The app applies the spec at startup (see ``Config.INDEX_BUILD``) and
+``seed_db.py`` after seeding. Unique indexes are built one at a time: one
+that existing documents violate (duplicate artist names stored before the
+``name_normalized`` index was unique, say) is skipped and its conflicting
+values logged, so it never blocks the other indexes or startup; writers
+check for it with ``unique_artist_names`` and look duplicates up themselves
+until it exists. Resolve the duplicates, then apply the spec again. To check or apply it by hand, from the
+``backend`` directory::
+
+    python indexes.py --check
+    python indexes.py --backfill
+"""
+import argparse
+import logging
+import sys
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from pymongo import IndexModel, UpdateOne
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from config import Config
+from services.album_buckets import ALBUM_BUCKET_COLLECTION
+from services.artist_documents import ACCUMULATED_FIELDS, DERIVED_VERSION, derived_fields
+
+logger = logging.getLogger(__name__)
+
+
+class IndexSpec(NamedTuple):
+    """One declared index: its name, key pattern and creation options."""
+
+    name: str
+    keys: Tuple[Tuple[str, Any], ...]
+    options: Optional[Dict[str, Any]] = None
+
+
+INDEXES: Dict[str, List[IndexSpec]] = {
+    "artists": [
+        # Genre with the parsed location fields (see utils.locations); each
+        # clause of the free-text location $or gets an index of its own.
+        IndexSpec("genre_country_city", (("genre", 1), ("country", 1), ("city", 1))),
+        IndexSpec("genre_region", (("genre", 1), ("region", 1))),
+        IndexSpec("genre_city", (("genre", 1), ("city", 1))),
+        # The same lookups without a genre.
+        IndexSpec("country_city", (("country", 1), ("city", 1))),
+        IndexSpec("region", (("region", 1),)),
+        IndexSpec("city", (("city", 1),)),
+        # Exact name lookups on every /artists/{name} route; unique, so
+        # registration needs no duplicate check and cannot race one.
+        IndexSpec("name_normalized", (("name_normalized", 1),), {"unique": True}),
+        # /albums/{title}/description
+        IndexSpec("album_titles_normalized", (("album_titles_normalized", 1),)),
+        # /albums runtime ranges
+        IndexSpec("album_runtime", (("albums.runtime_seconds", 1),)),
+        # Radius searches
+        IndexSpec("geo", (("geo", "2dsphere"),)),
+        # Finding documents whose derived fields are out of date.
+        IndexSpec("derived_version", (("derived_version", 1),)),
+    ],
+    # The flattened tracks (see services/tracks.py) behind /tracks/search.
+    "tracks": [
+        # Exact and prefix title matches, sorted by title then artist.
+        IndexSpec("title_artist", (("title_normalized", 1), ("artist", 1))),
+        # Titles containing every word of the query.
+        IndexSpec("title_words", (("title_words", 1),)),
+    ],
+    # Registered albums (see services/album_buckets.py).
+    ALBUM_BUCKET_COLLECTION: [
+        # One bucket per artist and number; appends upsert on it.
+        IndexSpec("artist_bucket", (("artist_id", 1), ("bucket", 1)), {"unique": True}),
+        # /albums/{title}/description
+        IndexSpec("album_titles_normalized", (("album_titles_normalized", 1),)),
+        # /albums runtime ranges
+        IndexSpec("album_runtime", (("albums.runtime_seconds", 1),)),
+    ],
+    # Stored results of POSTs sent with an Idempotency-Key (see services/idempotency.py).
+    "idempotency_keys": [
+        IndexSpec("created_at_ttl", (("created_at", 1),),
+                  {"expireAfterSeconds": Config.IDEMPOTENCY_TTL_SECONDS}),
+    ],
+}
+
+# Index options that make two indexes on the same keys behave differently.
+COMPARED_OPTIONS = ("unique", "expireAfterSeconds")
+
+
+def _key_pattern(keys) -> List[Tuple[str, Any]]:
+    # The server reports numeric directions as floats or ints depending on version.
+    return [(field, int(direction) if isinstance(direction, (int, float)) else direction)
+            for field, direction in keys]
+
+
+def _options(options: Dict[str, Any]) -> Dict[str, Any]:
+    return {name: options[name] for name in COMPARED_OPTIONS if options.get(name)}
+
+
+def index_drift(db, spec: Dict[str, List[IndexSpec]] = INDEXES) -> Dict[str, Dict[str, List[str]]]:
+    """
+    Compare the declared indexes with the ones in the database.
+
+    Args:
+        db: pymongo Database
+        spec: Declared indexes per collection
+
+    Returns:
+        Per collection, the declared indexes that are ``missing``, the ones
+        that exist under the same name with different keys or options
+        (``mismatched``, see ``COMPARED_OPTIONS``),
+        and the ones that exist but are not declared (``unexpected``).
+        Collections without drift are omitted.
+    """
+    drift = {}
+    for collection, declared in spec.items():
+        actual = {
+            name: (_key_pattern(info["key"]), _options(info))
+            for name, info in db[collection].index_information().items()
+            if name != "_id_"
+        }
+        report = {"missing": [], "mismatched": [], "unexpected": []}
+        for index in declared:
+            if index.name not in actual:
+                report["missing"].append(index.name)
+            elif actual[index.name] != (_key_pattern(index.keys), _options(index.options or {})):
+                report["mismatched"].append(index.name)
+        declared_names = {index.name for index in declared}
+        report["unexpected"] = sorted(name for name in actual if name not in declared_names)
+        if any(report.values()):
+            drift[collection] = report
+    return drift
+
+
+def ensure_indexes(
+    db, background: bool = True, spec: Dict[str, List[IndexSpec]] = INDEXES
+) -> Dict[str, List[str]]:
+    """
+    Create every declared index that does not exist yet.
+
+    Mismatched indexes are reported but never dropped automatically, since
+    rebuilding a large index should be a deliberate operation. A unique
+    index that existing documents violate is skipped and its duplicated
+    values logged (see ``duplicate_keys``); the other indexes are still built.
+
+    Args:
+        db: pymongo Database
+        background: Build without blocking other operations on servers that
+            still honour the option (MongoDB 4.2+ always builds this way)
+        spec: Declared indexes per collection
+
+    Returns:
+        Names of the indexes created, per collection
+    """
+    created = {}
+    drift = index_drift(db, spec)
+    for collection, declared in spec.items():
+        missing = set(drift.get(collection, {}).get("missing", []))
+        models = [
+            (index, IndexModel(list(index.keys), name=index.name, background=background,
+                               **(index.options or {})))
+            for index in declared if index.name in missing
+        ]
+        # Non-unique indexes are built together, in one pass over the collection.
+        shared = [model for index, model in models if not (index.options or {}).get("unique")]
+        if shared:
+            logger.info(f"Creating indexes on {collection}: "
+                        f"{', '.join(sorted(model.document['name'] for model in shared))}")
+            created[collection] = db[collection].create_indexes(shared)
+        for index, model in models:
+            if not (index.options or {}).get("unique"):
+                continue
+            logger.info(f"Creating unique index {index.name} on {collection}")
+            try:
+                created.setdefault(collection, []).extend(db[collection].create_indexes([model]))
+            except OperationFailure as e:
+                if not isinstance(e, DuplicateKeyError) and e.code != 11000:
+                    raise
+                conflicts = duplicate_keys(db, collection, index)
+                logger.error(f"Unique index {index.name} on {collection} not built; "
+                             f"values held by more than one document: {', '.join(map(str, conflicts))}")
+        mismatched = drift.get(collection, {}).get("mismatched", [])
+        if mismatched:
+            logger.warning(f"Indexes on {collection} differ from the spec: {', '.join(mismatched)}")
+    return created
+
+
+# Most duplicated values ``duplicate_keys`` reports per index.
+DUPLICATES_REPORTED = 100
+
+
+def duplicate_keys(db, collection: str, index: IndexSpec,
+                   limit: int = DUPLICATES_REPORTED) -> List[Any]:
+    """
+    Values of ``index``'s keys held by more than one document.
+
+    Args:
+        db: pymongo Database
+        collection: Collection name
+        index: A declared (unique) index
+        limit: Most values returned
+
+    Returns:
+        The duplicated values (a dict of field to value for compound keys),
+        most duplicated first
+    """
+    fields = [field for field, _ in index.keys]
+    group_id = f"${fields[0]}" if len(fields) == 1 else {field.replace(".", "_"): f"${field}" for field in fields}
+    pipeline = [
+        {"$group": {"_id": group_id, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$sort": {"count": -1, "_id": 1}},
+        {"$limit": limit},
+    ]
+    return [row["_id"] for row in db[collection].aggregate(pipeline, allowDiskUse=True)]
+
+
+class UniqueIndexCheck:
+    """
+    Whether a declared unique index exists in the database.
+
+    Writers that rely on the index to reject duplicates check it first: it
+    can be missing while a background build runs, with ``INDEX_BUILD=off``,
+    or when existing duplicates blocked it. Once seen, the index is assumed
+    to stay, so later checks cost nothing.
+    """
+
+    def __init__(self, collection: str, name: str):
+        self.collection = collection
+        self.name = name
+        self.confirmed = False
+
+    def exists(self, db) -> bool:
+        if not self.confirmed:
+            info = db[self.collection].index_information().get(self.name)
+            self.confirmed = bool(info and info.get("unique"))
+        return self.confirmed
+
+
+# Artist names are unique once normalized.
+unique_artist_names = UniqueIndexCheck("artists", "name_normalized")
+
+
+def backfill_derived_fields(db, batch_size: int = 1000) -> int:
+    """
+    Set the derived (indexed) artist fields on documents that lack them or
+    were written under an older ``DERIVED_VERSION``.
+
+    Args:
+        db: pymongo Database
+        batch_size: Updates sent per bulk write
+
+    Returns:
+        Number of documents updated
+    """
+    cursor = db.artists.find(
+        {"derived_version": {"$ne": DERIVED_VERSION}},
+        {"name": 1, "albums": 1, "coordinates": 1,
+         "location": 1, "city": 1, "region": 1, "country": 1},
+    )
+    updated = 0
+    batch = []
+    for document in cursor:
+        fields = derived_fields(document)
+        # These also cover the album buckets, so they are added to, not replaced.
+        accumulated = {field: {"$each": fields.pop(field)} for field in ACCUMULATED_FIELDS}
+        batch.append(UpdateOne({"_id": document["_id"]}, {"$set": fields, "$addToSet": accumulated}))
+        if len(batch) >= batch_size:
+            updated += db.artists.bulk_write(batch, ordered=False).modified_count
+            batch = []
+    if batch:
+        updated += db.artists.bulk_write(batch, ordered=False).modified_count
+    return updated
+
+
+def apply_index_spec(db, background: bool = True) -> Dict[str, List[str]]:
+    """
+    Backfill derived fields, then create any missing indexes.
+
+    Args:
+        db: pymongo Database
+        background: See ``ensure_indexes``
+
+    Returns:
+        Names of the indexes created, per collection
+    """
+    backfilled = backfill_derived_fields(db)
+    if backfilled:
+        logger.info(f"Backfilled derived fields on {backfilled} artists")
+    return ensure_indexes(db, background=background)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Apply or check the declared indexes.")
+    parser.add_argument("--check", action="store_true",
+                        help="Only report drift; exit with status 1 if there is any")
+    parser.add_argument("--backfill", action="store_true",
+                        help="Fill in derived fields on existing documents first")
+    parser.add_argument("--foreground", action="store_true",
+                        help="Build indexes in the foreground")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    from database import db
+
+    if args.check:
+        drift = index_drift(db)
+        for collection, report in drift.items():
+            for kind, names in report.items():
+                if names:
+                    print(f"{collection}: {kind}: {', '.join(names)}")
+        for collection, declared in INDEXES.items():
+            for index in declared:
+                if (index.options or {}).get("unique") \
+                        and index.name in drift.get(collection, {}).get("missing", []):
+                    conflicts = duplicate_keys(db, collection, index)
+                    if conflicts:
+                        print(f"{collection}: {index.name} is blocked by duplicates: "
+                              f"{', '.join(map(str, conflicts))}")
+        if not drift:
+            print("Indexes match the spec.")
+        return 1 if drift else 0
+
+    if args.backfill:
+        created = apply_index_spec(db, background=not args.foreground)
+    else:
+        created = ensure_indexes(db, background=not args.foreground)
+    for collection, names in created.items():
+        print(f"{collection}: created {', '.join(names)}")
+    if not created:
+        print("All declared indexes already exist.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
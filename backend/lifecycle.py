@@ -0,0 +1,258 @@
+"""
+Process-wide resources managed by the FastAPI lifespan.
+
+On startup the app connects to MongoDB, runs a few warmup queries so the
+first real request does not pay for connection setup, applies the declared
+indexes (see ``indexes.py``), materialized facet counts (see
+``services/facets.py``) and flattened tracks (``services/tracks.py``), and
+only then reports ready on ``/ready``; a failed warmup is retried with
+backoff on a background thread. The autocomplete and fuzzy name
+indexes, and the catalog snapshot when ``CATALOG_SNAPSHOT`` is on, are built
+on a background thread, after the worker starts following the catalog
+changelog (``services/catalog_changes.py``). The shared HTTP session for
+upstream calls is created here and closed on shutdown. Boot timings are
+exported as ``cfyby_boot_seconds``.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import Config
+from database import close_client, get_database
+from indexes import apply_index_spec, index_drift
+from services.autocomplete import autocomplete
+from services.catalog_changes import change_listener
+from services.facets import ensure_facet_counts
+from services.fuzzy import fuzzy_names
+from services.snapshot import catalog_snapshot
+from services.tracks import ensure_tracks
+from utils.metrics import BOOT_SECONDS, shared_metrics
+
+logger = logging.getLogger(__name__)
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+class Readiness:
+    """Whether this worker has finished startup and may receive traffic."""
+
+    def __init__(self):
+        self.ready = False
+        self.reason = "starting"
+
+    def mark_ready(self) -> None:
+        self.ready = True
+        self.reason = "ready"
+
+    def mark_not_ready(self, reason: str) -> None:
+        self.ready = False
+        self.reason = reason
+
+
+readiness = Readiness()
+
+
+def get_http_session() -> Optional[requests.Session]:
+    """
+    Return the shared HTTP session.
+
+    None outside the app lifespan (scripts, tests driving the app without
+    starting it), where clients fall back to one connection per request.
+    """
+    return _session
+
+
+def open_http_session() -> requests.Session:
+    """Create the shared HTTP session if it does not exist yet."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=Config.HTTP_POOL_SIZE,
+                                  pool_maxsize=Config.HTTP_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
+def close_http_session() -> None:
+    """Close the shared HTTP session."""
+    global _session
+    with _session_lock:
+        session, _session = _session, None
+    if session is not None:
+        session.close()
+
+
+def _reset_after_fork() -> None:
+    """
+    Give a forked worker its own session, readiness and warmup retry state.
+
+    The parent's session shares sockets with the parent, so the child drops
+    it without closing it; the worker's lifespan opens a new one.
+    """
+    global _session, _session_lock, readiness, warmup_retry
+    _session = None
+    _session_lock = threading.Lock()
+    readiness = Readiness()
+    warmup_retry = WarmupRetry()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def warm_up() -> None:
+    """Open a Mongo connection and touch the collections requests read first."""
+    db = get_database()
+    db.command("ping")
+    db.artists.find_one({}, {"_id": 1})
+
+
+def prepare_collections(db, background: bool = True) -> None:
+    """Apply the index spec, then build the facet counts and tracks if they are missing."""
+    apply_index_spec(db, background=background)
+    ensure_facet_counts(db)
+    ensure_tracks(db)
+
+
+def _prepare_collections_in_background(db) -> threading.Thread:
+    """Prepare collections on a daemon thread so a long build does not delay startup."""
+    def run():
+        try:
+            prepare_collections(db, background=True)
+        except Exception as e:
+            logger.error(f"Preparing collections failed: {e}")
+
+    thread = threading.Thread(target=run, name="prepare-collections", daemon=True)
+    thread.start()
+    return thread
+
+
+def _load_search_indexes_in_background(db) -> threading.Thread:
+    """
+    Build the autocomplete and fuzzy name indexes, and the catalog snapshot
+    when enabled, without delaying readiness.
+    """
+    loaders = [("autocomplete indexes", autocomplete), ("fuzzy name index", fuzzy_names)]
+    if Config.CATALOG_SNAPSHOT:
+        loaders.append(("catalog snapshot", catalog_snapshot))
+
+    def run():
+        for label, loader in loaders:
+            try:
+                loader.ensure_loaded(db)
+            except Exception as e:
+                logger.error(f"Building the {label} failed: {e}")
+
+    thread = threading.Thread(target=run, name="search-indexes", daemon=True)
+    thread.start()
+    return thread
+
+
+def apply_indexes() -> None:
+    """Prepare indexes and derived collections according to ``Config.INDEX_BUILD``."""
+    db = get_database()
+    if Config.INDEX_BUILD == "foreground":
+        prepare_collections(db, background=False)
+    elif Config.INDEX_BUILD == "background":
+        _prepare_collections_in_background(db)
+    else:
+        drift = index_drift(db)
+        if drift:
+            logger.warning(f"Index drift (INDEX_BUILD=off, not applied): {drift}")
+
+
+def _start_worker() -> None:
+    """Warm up, apply indexes, follow the changelog and start the search index builds."""
+    warm_up()
+    apply_indexes()
+    change_listener.start(get_database())
+    _load_search_indexes_in_background(get_database())
+
+
+class WarmupRetry:
+    """
+    Retries a failed startup warmup on a daemon thread until it succeeds.
+
+    Waits ``Config.WARMUP_RETRY_SECONDS`` before the first retry and doubles
+    the wait up to ``Config.WARMUP_RETRY_MAX_SECONDS``, so a worker that
+    booted during a database outage joins the rotation once it is back.
+    """
+
+    def __init__(self):
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="warmup-retry", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread = None
+
+    def _run(self) -> None:
+        delay = Config.WARMUP_RETRY_SECONDS
+        attempt = 1
+        while not self._stopped.wait(delay):
+            attempt += 1
+            try:
+                _start_worker()
+            except Exception as e:
+                logger.error(f"Startup warmup attempt {attempt} failed: {e}")
+                readiness.mark_not_ready(f"warmup failed: {e}")
+                delay = min(delay * 2, Config.WARMUP_RETRY_MAX_SECONDS)
+                continue
+            if not self._stopped.is_set():
+                readiness.mark_ready()
+                logger.info(f"Worker ready after {attempt} warmup attempts")
+            return
+
+
+warmup_retry = WarmupRetry()
+
+
+def startup() -> None:
+    """
+    Connect and warm up, then mark the worker ready.
+
+    A failed warmup leaves the worker running but not ready, so the load
+    balancer keeps it out of rotation instead of it crash-looping while the
+    database is unavailable; ``warmup_retry`` keeps trying in the background
+    and marks the worker ready once a warmup succeeds.
+    """
+    started = time.perf_counter()
+    shared_metrics.start(Config.METRICS_DIR, Config.METRICS_WRITE_SECONDS)
+    open_http_session()
+    try:
+        _start_worker()
+    except Exception as e:
+        logger.error(f"Startup warmup failed: {e}")
+        readiness.mark_not_ready(f"warmup failed: {e}")
+        warmup_retry.start()
+        return
+    finally:
+        BOOT_SECONDS.set(time.perf_counter() - started, "startup")
+    readiness.mark_ready()
+    logger.info(f"Worker ready in {time.perf_counter() - started:.3f}s")
+
+
+def shutdown() -> None:
+    """Stop taking traffic and release the shared clients."""
+    readiness.mark_not_ready("shutting down")
+    warmup_retry.stop()
+    change_listener.stop()
+    close_http_session()
+    close_client()
+    shared_metrics.stop()
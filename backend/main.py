@@ -1,23 +1,37 @@
 # main.py
-import json
+import time
+
+_import_started = time.perf_counter()
+
 import logging
-import os
-from codecs import namereplace_errors
-from gzip import READ
-import re
+from contextlib import asynccontextmanager
+from urllib.parse import quote
 
-import uvicorn
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel, field_validator
 from bson import ObjectId
-from typing import Optional, List
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from typing import Dict, Optional, List, Union
 
 # Import database
+from config import Config
 from database import db
-
-from utils.geolocation import geocode_location, haversine_distance
+from indexes import unique_artist_names
+import lifecycle
+
+from utils.compression import CompressionMiddleware
+from utils.durations import parse_duration
+from utils.fast_json import FastJSONResponse, find_documents
+from utils.geolocation import EARTH_RADIUS_MI, geocode_location, haversine_distance
+from utils.locations import location_filter
+from utils.metrics import BOOT_SECONDS, MetricsMiddleware, render_metrics
+from utils.query_diagnostics import diagnostics
+from utils.rate_limit import RateLimitMiddleware
+from utils.response_cache import ResponseCacheMiddleware
+from utils.text import normalize_text
 
 # Import cloud service client
 from services.cloud_service_client import (
@@ -27,6 +41,35 @@ from services.cloud_service_client import (
     CloudServiceError,
     CloudServiceTimeoutError,
 )
+from services.album_buckets import (
+    DuplicateAlbum,
+    album_page,
+    albums_by_runtime,
+    append_album,
+    attach_albums,
+    find_bucketed_album,
+)
+from services.artist_documents import (
+    PUBLIC_PROJECTION,
+    normalize_album,
+    prepare_artist_document,
+    public_document,
+    public_projection,
+    response_projection,
+)
+from services.autocomplete import SUGGESTION_TYPES, autocomplete
+from services.catalog_changes import publish_change
+from services.facets import facet_cache, record_artist_added
+from services.federated_search import (
+    CLOUD_SOURCE,
+    LOCAL_SOURCE,
+    extract_cloud_results,
+    federated_search,
+)
+from services.fuzzy import fuzzy_names
+from services.idempotency import IdempotencyKeyReused, store_response, stored_response
+from services.snapshot import catalog_snapshot
+from services.tracks import MATCH_TYPES, record_album_added, search_tracks
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -40,11 +83,57 @@ def serialize_doc(doc):
         doc['_id'] = str(doc['_id'])
     return doc
 
+def artist_projection(fields: Optional[str], expand: Optional[str]):
+    """
+    Translates the fields/expand query parameters into a Mongo projection,
+    so fields that were not asked for are never read or sent.
+    """
+    try:
+        return response_projection(fields, expand)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def find_artists(query: Dict, projection: Dict, limit: int = 0,
+                 max_time_ms: Optional[int] = None) -> List[Dict]:
+    """
+    Artists matching query, with their bucketed albums when the projection
+    includes albums.
+    """
+    artists = find_documents(db.artists, query, projection, limit=limit, max_time_ms=max_time_ms)
+    return attach_albums(db, artists, projection)
+
+
+def did_you_mean(name: str) -> Dict[str, str]:
+    """
+    An X-Did-You-Mean header with the closest artist names, percent-encoded
+    and comma separated, for 404s on misspelled names.
+    """
+    matches = fuzzy_names.search(name, limit=3)
+    if not matches:
+        return {}
+    return {"X-Did-You-Mean": ",".join(quote(match["name"], safe=" ") for match in matches)}
+
+
+def use_snapshot() -> bool:
+    """Whether reads can be served from the in-process catalog snapshot."""
+    return Config.CATALOG_SNAPSHOT and catalog_snapshot.loaded
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Connect and warm up before serving; release shared clients on exit."""
+    await run_in_threadpool(lifecycle.startup)
+    yield
+    await run_in_threadpool(lifecycle.shutdown)
+
+
 # Create the FastAPI app instance
 app = FastAPI(
     title="Curated For You, By You API",
     description="Simple backend requests",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 origins = [
@@ -54,6 +143,12 @@ origins = [
     "http://localhost:5173",
 ]
 
+# Innermost, so cached entries never hold per-origin CORS headers.
+app.add_middleware(ResponseCacheMiddleware)
+
+# Inside CORS, so browsers can read 429 responses.
+app.add_middleware(RateLimitMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -62,28 +157,41 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
+
 
 @app.get("/artists/genre")
-def get_artists_by_genre(genre: str, n: int):
+def get_artists_by_genre(
+    genre: str, n: int, fields: Optional[str] = None, expand: Optional[str] = None
+):
     """
     Returns an array of N artists based on a genre
     """
-    artists = db.artists.find({"genre": genre.lower()}).limit(n)
-    output_list = [serialize_doc(artist) for artist in artists]
-    return {"results": output_list}
+    projection = artist_projection(fields, expand)
+    query = {"genre": genre.lower()}
+    if use_snapshot():
+        artists = catalog_snapshot.find(query, projection, limit=n)
+    else:
+        artists = find_artists(query, projection, limit=n)
+    return FastJSONResponse({"results": artists})
 
 
 @app.get("/artists/location")
-def get_artists_by_genre_location(genre: str, location: str, n: int):
+def get_artists_by_genre_location(
+    genre: str, location: str, n: int, fields: Optional[str] = None, expand: Optional[str] = None
+):
     """
     Returns an array of N artists based on a genre and city
     """
-    artists = db.artists.find({
-        "genre": genre.lower(),
-        "location": {"$regex": location, "$options": "i"}
-    }).limit(n)
-    output_list = [serialize_doc(artist) for artist in artists]
-    return {"results": output_list}
+    projection = artist_projection(fields, expand)
+    query = {"genre": genre.lower()}
+    query.update(location_filter(location=location))
+    if use_snapshot():
+        artists = catalog_snapshot.find(query, projection, limit=n)
+    else:
+        artists = find_artists(query, projection, limit=n)
+    return FastJSONResponse({"results": artists})
 
 
 @app.get("/")
@@ -104,10 +212,46 @@ def get_root():
     }
 
 
+@app.get("/ready")
+def get_ready():
+    """
+    Readiness probe: 200 once startup warmup has finished, 503 before that,
+    after a failed warmup and during shutdown.
+    """
+    if not lifecycle.readiness.ready:
+        return JSONResponse(
+            status_code=503, content={"status": "not ready", "reason": lifecycle.readiness.reason}
+        )
+    return {"status": "ready"}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Exposes request, Mongo, geocoder, cloud service and cache metrics in the
+    Prometheus text format.
+    """
+    return PlainTextResponse(
+        render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/debug/queries")
+def get_query_diagnostics():
+    """
+    Returns every recorded Mongo query shape with its timings. Slow shapes are
+    explained and flagged when they use a COLLSCAN or an in-memory SORT.
+    Only available when QUERY_DIAGNOSTICS is enabled.
+    """
+    if not diagnostics.enabled:
+        raise HTTPException(status_code=404, detail="Query diagnostics are disabled.")
+    return diagnostics.report()
+
+
 @app.get("/local/audio")
-def get_audio_db():
-    artists = db.artists.find().limit(200)
-    return {"results": [serialize_doc(artist) for artist in artists]}
+def get_audio_db(fields: Optional[str] = None, expand: Optional[str] = None):
+    artists = find_artists({}, artist_projection(fields, expand), limit=200)
+    return FastJSONResponse({"results": artists})
 
 
 @app.get("/artists")
@@ -118,11 +262,14 @@ def get_artists(
     location: str = None,
     latitude: Optional[float] = None,
     longitude: Optional[float] = None,
-    radius: Optional[float] = None
+    radius: Optional[float] = None,
+    fields: Optional[str] = None,
+    expand: Optional[str] = None,
 ):
+    projection = artist_projection(fields, expand)
     query = {}
     if genre:
-        query["genre"] = {"$regex": f"^{genre}$", "$options": "i"}
+        query["genre"] = genre.lower()
     
     use_radius_filtering = radius is not None and radius > 0
     search_lat = latitude
@@ -139,26 +286,48 @@ def get_artists(
     
     if use_radius_filtering and (search_lat is None or search_lon is None):
         use_radius_filtering = False
+
+    if use_snapshot():
+        if use_radius_filtering:
+            results = catalog_snapshot.near(
+                query, search_lat, search_lon, radius,
+                fallback=location_filter(location=location) if location else None,
+                projection=projection,
+            )
+        else:
+            query.update(location_filter(country, city, location))
+            results = catalog_snapshot.find(query, projection)
+        if not results and location is not None:
+            raise HTTPException(status_code=404, detail=f"Location '{location}' not found.")
+        return FastJSONResponse({"results": results})
     
-    if not use_radius_filtering:
-        and_query = []
-        if country:
-            and_query.append({"location": {"$regex": country, "$options": "i"}})
-        if city:
-            and_query.append({"location": {"$regex": city, "$options": "i"}})
+    if use_radius_filtering:
+        # Let the geo index narrow the candidates; exact distances follow below.
+        within_radius = {"geo": {"$geoWithin": {
+            "$centerSphere": [[search_lon, search_lat], radius / EARTH_RADIUS_MI]
+        }}}
         if location:
-            and_query.append({"location": {"$regex": location, "$options": "i"}})
-        
-        if and_query:
-            query["$and"] = and_query
+            # Artists without coordinates still match on their location string.
+            query["$or"] = [
+                within_radius,
+                {"geo": {"$exists": False}, **location_filter(location=location)},
+            ]
+        else:
+            query.update(within_radius)
+    else:
+        query.update(location_filter(country, city, location))
     
-    artists = db.artists.find(query)
-    all_artists = [serialize_doc(artist) for artist in artists]
+    # Distances need the coordinates even when the client did not ask for them.
+    includes = any(value for key, value in projection.items() if key != "_id")
+    add_coordinates = use_radius_filtering and includes and "coordinates" not in projection
+    if add_coordinates:
+        projection = dict(projection, coordinates=1)
+    all_artists = find_artists(query, projection)
     
     if use_radius_filtering:
         results = []
         for artist in all_artists:
-            coords = artist.get("coordinates")
+            coords = artist.pop("coordinates", None) if add_coordinates else artist.get("coordinates")
             if coords and "latitude" in coords and "longitude" in coords:
                 artist_lat = coords["latitude"]
                 artist_lon = coords["longitude"]
@@ -167,9 +336,8 @@ def get_artists(
                     artist["distance_mi"] = round(distance, 2)
                     results.append(artist)
             else:
-                artist_location = artist.get("location", "")
-                if location and location.lower() in artist_location.lower():
-                    results.append(artist)
+                # Only fetched when it matched the location fields instead.
+                results.append(artist)
         
         results.sort(key=lambda x: x.get("distance_mi", float("inf")))
     else:
@@ -180,20 +348,131 @@ def get_artists(
             status_code=404, detail=f"Location '{location}' not found."
         )
 
-    return {"results": results}
+    return FastJSONResponse({"results": results})
+
+
+@app.get("/facets")
+def get_facets(genre: str = None, country: str = None, city: str = None):
+    """
+    Distinct genres, countries and cities with artist counts, each narrowed
+    by the other filters, served from the materialized facet counts.
+    """
+    return facet_cache.facets(db, genre=genre, country=country, city=city)
+
+
+class ArtistBatchRequest(BaseModel):
+    names: List[str] = []
+    ids: List[str] = []
+    fields: Optional[List[str]] = None
+
+
+@app.post("/artists/batch")
+def get_artists_batch(batch: ArtistBatchRequest):
+    """
+    Resolves many artists by name and/or id in one indexed query. Results are
+    keyed by the name or id as requested, with null for the ones not found
+    (also listed under "not_found"). "fields" limits the returned fields.
+    """
+    requested = len(batch.names) + len(batch.ids)
+    if requested == 0:
+        raise HTTPException(status_code=400, detail="No names or ids were provided!")
+    if requested > Config.BATCH_MAX_ARTISTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {Config.BATCH_MAX_ARTISTS} names and ids can be requested at once.",
+        )
+
+    names = {name: normalize_text(name) for name in batch.names}
+    ids = {artist_id: ObjectId(artist_id) for artist_id in batch.ids if ObjectId.is_valid(artist_id)}
+    clauses = []
+    if names:
+        clauses.append({"name_normalized": {"$in": sorted(set(names.values()))}})
+    if ids:
+        clauses.append({"_id": {"$in": list(ids.values())}})
+
+    # name_normalized is needed to match documents back to the requested names.
+    projection = dict(public_projection(batch.fields))
+    if batch.fields is None:
+        del projection["name_normalized"]
+    else:
+        projection["name_normalized"] = 1
+    by_name, by_id = {}, {}
+    if clauses:
+        query = clauses[0] if len(clauses) == 1 else {"$or": clauses}
+        for artist in find_artists(query, projection):
+            by_name.setdefault(artist.pop("name_normalized", None), artist)
+            by_id[artist["_id"]] = artist
+
+    results = {name: by_name.get(normalized) for name, normalized in names.items()}
+    results.update({artist_id: by_id.get(ids.get(artist_id)) for artist_id in batch.ids})
+    not_found = [key for key, artist in results.items() if artist is None]
+    return FastJSONResponse({"results": results, "not_found": not_found})
+
+
+@app.get("/autocomplete")
+def get_autocomplete(q: str, type: str = "artist", limit: Optional[int] = None):
+    """
+    Suggests artist names, locations or genres starting with q, most popular
+    first, from an in-memory prefix index. Empty while the worker is still
+    building its indexes at startup.
+    """
+    if type not in SUGGESTION_TYPES:
+        raise HTTPException(
+            status_code=400, detail=f"type must be one of: {', '.join(SUGGESTION_TYPES)}"
+        )
+    return {"query": q, "type": type, "suggestions": autocomplete.suggest(q, type, limit)}
+
+
+@app.get("/tracks/search")
+def get_tracks_search(q: str, match: Optional[str] = None, limit: int = 20):
+    """
+    Finds tracks by title in the flattened tracks collection, with the artist
+    and album each belongs to. Exact title matches come first, then titles
+    starting with q, then titles containing all of its words; match=exact,
+    prefix or text uses only one kind.
+    """
+    if match is not None and match not in MATCH_TYPES:
+        raise HTTPException(
+            status_code=400, detail=f"match must be one of: {', '.join(MATCH_TYPES)}"
+        )
+    if not 1 <= limit <= 100:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 100")
+    return FastJSONResponse({"query": q, "results": search_tracks(db, q, match, limit)})
+
+
+@app.get("/artists/fuzzy")
+def get_fuzzy_artists(q: str, limit: int = 5):
+    """
+    Artist names similar to q, for misspelled names, with trigram similarity
+    scores from 0 to 1, best first. Empty while the worker is still building
+    its index at startup.
+    """
+    if not 1 <= limit <= 50:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 50")
+    return {"query": q, "matches": fuzzy_names.search(q, limit)}
 
 
 @app.get("/artists/{name}")
-def get_artist_info(name: str = None):
+def get_artist_info(name: str = None, fields: Optional[str] = None, expand: Optional[str] = None):
     if name is None:
         raise HTTPException(status_code=400, detail=f"A name was not provided!")
     
-    artist = db.artists.find_one({"name": {"$regex": f"^{re.escape(name)}$", "$options": "i"}})
+    projection = artist_projection(fields, expand)
+    if use_snapshot():
+        artist = catalog_snapshot.find_by_name(name, projection)
+    else:
+        artist = db.artists.find_one({"name_normalized": normalize_text(name)}, projection)
+        if artist:
+            attach_albums(db, [artist], projection)
     
     if artist:
         return serialize_doc(artist)
 
-    raise HTTPException(status_code=404, detail=f"No artist found with name '{name}'!")
+    raise HTTPException(
+        status_code=404,
+        detail=f"No artist found with name '{name}'!",
+        headers=did_you_mean(name),
+    )
 
 
 @app.get("/artists/{name}/description")
@@ -201,7 +480,7 @@ def get_artist_description(name: str):
     if name is None:
         raise HTTPException(status_code=400, detail=f"A name was not provided!")
 
-    artist = db.artists.find_one({"name": {"$regex": f"^{re.escape(name)}$", "$options": "i"}})
+    artist = db.artists.find_one({"name_normalized": normalize_text(name)}, {"summary": 1, "_id": 0})
 
     if artist:
         return {"summary": artist.get("summary", "No summary available")}
@@ -214,7 +493,7 @@ def get_artist_image(name: str):
     if name is None:
         raise HTTPException(status_code=400, detail=f"A name was not provided!")
 
-    artist = db.artists.find_one({"name": {"$regex": f"^{re.escape(name)}$", "$options": "i"}})
+    artist = db.artists.find_one({"name_normalized": normalize_text(name)}, {"image": 1, "_id": 0})
 
     if artist:
         return {"image": artist.get("image", None)}
@@ -223,30 +502,88 @@ def get_artist_image(name: str):
 
 
 @app.get("/artists/{name}/albums")
-def get_artist_albums(name: str):
+def get_artist_albums(name: str, offset: int = 0, limit: Optional[int] = None):
+    """
+    The artist's albums, in the order they were added. offset and limit page
+    through them; only the album buckets a page overlaps are read.
+    """
     if name is None:
         raise HTTPException(status_code=400, detail=f"A name was not provided!")
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="offset must not be negative")
+    if limit is not None and not 1 <= limit <= 200:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 200")
 
-    artist = db.artists.find_one({"name": {"$regex": f"^{re.escape(name)}$", "$options": "i"}})
+    artist = db.artists.find_one(
+        {"name_normalized": normalize_text(name)}, {"albums": 1, "bucketed_albums": 1}
+    )
 
     if artist:
-        return {"albums": artist.get("albums", [])}
+        return FastJSONResponse({"albums": album_page(db, artist, offset, limit)})
 
     raise HTTPException(status_code=404, detail=f"No artist found with name '{name}'!")
 
 
+@app.get("/albums")
+def get_albums_by_runtime(
+    min_minutes: Optional[float] = None, max_minutes: Optional[float] = None, limit: int = 50
+):
+    """
+    Albums whose total runtime is within [min_minutes, max_minutes], e.g.
+    max_minutes=40 for albums of at most 40 minutes. Runtimes are stored
+    precomputed on each album, so this is an indexed range query.
+    """
+    if min_minutes is None and max_minutes is None:
+        raise HTTPException(status_code=400, detail="Give min_minutes, max_minutes or both")
+    if not 1 <= limit <= 200:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 200")
+    runtime = {}
+    if min_minutes is not None:
+        runtime["$gte"] = min_minutes * 60
+    if max_minutes is not None:
+        runtime["$lte"] = max_minutes * 60
+    albums = db.artists.aggregate([
+        # $elemMatch keeps both bounds on the same album, and on the index.
+        {"$match": {"albums": {"$elemMatch": {"runtime_seconds": runtime}}}},
+        {"$unwind": "$albums"},
+        {"$match": {"albums.runtime_seconds": runtime}},
+        {"$limit": limit},
+        {"$project": {
+            "_id": 0,
+            "artist": "$name",
+            "artist_id": "$_id",
+            "title": "$albums.title",
+            "year": "$albums.year",
+            "runtime_seconds": "$albums.runtime_seconds",
+            "track_count": "$albums.track_count",
+        }},
+    ])
+    albums = list(albums)
+    if len(albums) < limit:
+        albums.extend(albums_by_runtime(db, runtime, limit - len(albums)))
+    return FastJSONResponse({"albums": albums})
+
+
 @app.get("/albums/{title}/description")
 def get_album_description(title: str):
     if title is None:
         raise HTTPException(status_code=400, detail=f"An album title was not provided!")
 
-    artist = db.artists.find_one({"albums.title": {"$regex": f"^{re.escape(title)}$", "$options": "i"}})
+    normalized_title = normalize_text(title)
+    artist = db.artists.find_one(
+        {"album_titles_normalized": normalized_title}, {"albums": 1, "_id": 0}
+    )
     
     if artist:
         for album in artist.get("albums", []):
-            if album.get("title", "").strip().lower() == title.strip().lower():
+            if normalize_text(album.get("title")) == normalized_title:
                 return album
 
+    # Registered albums live in the album buckets.
+    album = find_bucketed_album(db, title)
+    if album is not None:
+        return album
+
     raise HTTPException(
         status_code=404, detail=f"No album title found with name '{title}'!"
     )
@@ -258,7 +595,7 @@ async def get_cloud_artists(genre: str = None, country: str = None, city: str =
     Example endpoint that fetches artist data from the cloud service.
     """
     try:
-        client = CloudServiceClient()
+        client = CloudServiceClient(session=lifecycle.get_http_session())
         params = {}
         if genre:
             params["genre"] = genre
@@ -305,6 +642,54 @@ async def get_cloud_artists(genre: str = None, country: str = None, city: str =
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+@app.get("/federated/artists")
+async def get_federated_artists(
+    genre: str = None,
+    country: str = None,
+    city: str = None,
+    deadline_ms: Optional[int] = None,
+):
+    """
+    Searches the local database and the cloud service concurrently and merges
+    the results, deduplicated by normalized artist name. Sources that miss the
+    deadline are left out and the response is flagged as partial.
+    """
+    deadline_ms = deadline_ms if deadline_ms and deadline_ms > 0 else Config.FEDERATED_DEADLINE_MS
+    deadline_ms = min(deadline_ms, Config.FEDERATED_MAX_DEADLINE_MS)
+    deadline = deadline_ms / 1000
+
+    query = {}
+    if genre:
+        query["genre"] = genre.lower()
+    query.update(location_filter(country, city))
+
+    params = {}
+    if genre:
+        params["genre"] = genre
+    if country:
+        params["country"] = country
+    if city:
+        params["city"] = city
+
+    # Both sources give up at the deadline too, so calls the response no
+    # longer waits for do not keep the federated pool's threads busy.
+    def local_query():
+        artists = find_artists(query, PUBLIC_PROJECTION, max_time_ms=deadline_ms)
+        return [serialize_doc(artist) for artist in artists]
+
+    def cloud_query():
+        # No retries: a retried request could never finish inside the deadline.
+        client = CloudServiceClient(
+            timeout=deadline, max_retries=0, session=lifecycle.get_http_session()
+        )
+        return extract_cloud_results(client.get("/artists", params=params))
+
+    logger.info(f"Federated artist search with params {params} and deadline {deadline:.3f}s")
+    return await federated_search(
+        {LOCAL_SOURCE: local_query, CLOUD_SOURCE: cloud_query}, deadline
+    )
+
+
 class RegisteredArtist(BaseModel):
     genre: str
     name: str
@@ -313,9 +698,40 @@ class RegisteredArtist(BaseModel):
     image: Optional[str] = None
 
 
+def replayed_response(key: Optional[str], endpoint: str, request: Dict) -> Optional[Dict]:
+    """The stored result for a retried request, or None; 422 if the key was reused."""
+    try:
+        return stored_response(db, key, endpoint, request)
+    except IdempotencyKeyReused:
+        raise HTTPException(
+            status_code=422, detail="Idempotency-Key was already used for a different request"
+        )
+
+
+def announce_change(kind: str, artist: Dict) -> None:
+    """
+    Publish a committed write to the other workers' changelog.
+
+    The write (and its idempotent response) is already stored, so a failure
+    here is logged instead of failing the request; the other workers miss
+    this change until their next reload.
+    """
+    try:
+        publish_change(db, kind, artist)
+    except PyMongoError as e:
+        logger.error(f"Could not publish {kind} for '{artist.get('name')}' to the catalog changelog: {e}")
+
+
 @app.post("/artists/register")
-async def register_artist(artist: RegisteredArtist):
+def register_artist(
+    artist: RegisteredArtist, idempotency_key: Optional[str] = Header(None, max_length=255)
+):
     """register your own artist profile and write to our database"""
+    request = artist.model_dump()
+    replayed = replayed_response(idempotency_key, "register", request)
+    if replayed is not None:
+        return replayed
+
     normalized_input = {
         "genre": artist.genre.strip().lower(),
         "name": artist.name.strip(),
@@ -325,21 +741,46 @@ async def register_artist(artist: RegisteredArtist):
         "albums": []
     }
 
-    existing_artist = db.artists.find_one({"name": {"$regex": f"^{re.escape(normalized_input['name'])}$", "$options": "i"}})
-    if existing_artist:
+    document = prepare_artist_document(normalized_input)
+    # The unique name_normalized index rejects duplicates, even concurrent
+    # ones. Until it exists (still building, INDEX_BUILD=off, or blocked by
+    # stored duplicates) names are looked up first.
+    duplicate = not unique_artist_names.exists(db) and db.artists.find_one(
+        {"name_normalized": document["name_normalized"]}, {"_id": 1}
+    ) is not None
+    if not duplicate:
+        try:
+            db.artists.insert_one(document)
+        except DuplicateKeyError:
+            duplicate = True
+    if duplicate:
         raise HTTPException(
             status_code=409, detail=f"Artist '{artist.name}' already exists in our data"
         )
+    record_artist_added(db, document)
+    autocomplete.record_artist_added(document)
+    fuzzy_names.record_artist_added(document)
+    catalog_snapshot.record_artist_added(document)
 
-    result = db.artists.insert_one(normalized_input)
-    new_artist = db.artists.find_one({"_id": result.inserted_id})
-
-    return {"message": "Artist registered successfully", "artist": serialize_doc(new_artist)}
+    response = {"message": "Artist registered successfully",
+                "artist": serialize_doc(public_document(document))}
+    store_response(db, idempotency_key, "register", request, response)
+    announce_change("artist_added", document)
+    return response
 
 
 class RegisteredTrack(BaseModel):
     title: str
-    duration: str
+    # Seconds, or an "m:ss" / "h:mm:ss" string; stored as integer seconds.
+    duration: Union[int, str]
+
+    @field_validator("duration")
+    @classmethod
+    def duration_must_parse(cls, value):
+        seconds = parse_duration(value)
+        if seconds is None:
+            raise ValueError("duration must be seconds or an m:ss string")
+        return seconds
 
 
 class RegisteredDiscography(BaseModel):
@@ -352,32 +793,49 @@ class RegisteredDiscography(BaseModel):
 
 @app.post("/artists/register/discography")
 def register_artist_discography(
-    discography: RegisteredDiscography, artist_name: Optional[str] = None
+    discography: RegisteredDiscography,
+    artist_name: Optional[str] = None,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
 ):
     """register your own artist discography"""
     if not artist_name:
         raise HTTPException(status_code=404, detail="Artist name is required")
+    request = dict(discography.model_dump(), artist_name=artist_name)
+    replayed = replayed_response(idempotency_key, "register_discography", request)
+    if replayed is not None:
+        return replayed
 
-    result = db.artists.update_one(
-        {"name": {"$regex": f"^{re.escape(artist_name)}$", "$options": "i"}},
-        {"$push": {"albums": discography.dict()}}
-    )
-
-    if result.matched_count == 0:
+    album = normalize_album(discography.model_dump())
+    try:
+        # The artist before the update, for the new album's position.
+        artist = append_album(db, artist_name, album)
+    except DuplicateAlbum:
         raise HTTPException(
-            status_code=404, detail=f"Artist '{artist_name}' does not exist in our data"
+            status_code=409,
+            detail=f"Album '{discography.title}' ({discography.year}) already exists for '{artist_name}'",
         )
-    
-    if result.modified_count == 0:
+
+    if artist is None:
         raise HTTPException(
-            status_code=500, detail="Failed to update artist discography."
+            status_code=404, detail=f"Artist '{artist_name}' does not exist in our data"
         )
+    record_album_added(db, artist, album)
+    catalog_snapshot.record_album_added(artist_name, album)
+    autocomplete.record_album_added(artist_name)
 
-    return {
+    response = {
         "message": "Artist discography registered successfully",
         "artist": artist_name,
     }
+    store_response(db, idempotency_key, "register_discography", request, response)
+    announce_change("album_added", artist)
+    return response
+
+
+BOOT_SECONDS.set(time.perf_counter() - _import_started, "import")
 
 
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
\ No newline at end of file
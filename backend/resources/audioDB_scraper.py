@@ -39,17 +39,6 @@ async def fetch_json(session, url, retries=3):
     print(f"failed after {retries} retries")
     return None
 
-def milliseconds_to_duration(milliseconds):
-    """milisecond to m:ss converter"""
-    if not milliseconds or milliseconds == 0:
-        return "0:00"
-    
-    total_seconds = int(milliseconds) // 1000
-    minutes = total_seconds // 60
-    seconds = total_seconds % 60
-    
-    return f"{minutes}:{seconds:02d}"
-
 def clean_artist_data(artist_obj):
     """build artist data in exact schema order"""
     if not artist_obj:
@@ -105,9 +94,10 @@ async def process_artist(session, artist_id):
                     for raw_track in tracks_data["track"]:
                         dur = raw_track.get("intDuration")
                         duration_ms = int(dur) if dur and dur != "0" else 0
+                        # integer seconds, like expanded_schema.json; 0 means unknown
                         track_obj = {
                             "title": raw_track.get("strTrack"),
-                            "duration": milliseconds_to_duration(duration_ms)
+                            "duration": duration_ms // 1000 or None
                         }
                         album_obj["tracks"].append(track_obj)
             
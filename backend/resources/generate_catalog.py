@@ -0,0 +1,605 @@
+"""
+Synthetic catalog generator derived from the real datasets.
+
+Learns the genre mix, the (country, city) distribution, artist name
+structure and the discography/track shape from the files in this directory
+(``sprint1_music_data.json``, ``audioDB_200_in_order.json`` when present,
+``test_artist_output.json`` and ``expanded_schema.json``), then emits
+arbitrarily large catalogs following ``expanded_schema.json``.
+
+Output is deterministic for a given seed and chunk size regardless of the
+number of worker processes, and is streamed so memory stays flat apart from
+the set of names used to keep artists unique.
+
+Usage (from the ``backend`` directory)::
+
+    python resources/generate_catalog.py --count 1000000 --output catalog.ndjson
+    python resources/generate_catalog.py --count 50000 --format json --output catalog.json
+
+``ndjson`` writes one artist per line with its ``genre``; ``json`` writes
+the genre-keyed layout of ``expanded_schema.json``.
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import sys
+import time
+import zlib
+from bisect import bisect_right
+from collections import Counter
+from itertools import accumulate
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# Allow running as a script from anywhere; utils lives in the backend root.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.durations import parse_duration as duration_seconds
+from utils.text import normalize_text
+
+logger = logging.getLogger(__name__)
+
+RESOURCES_DIR = Path(__file__).resolve().parent
+
+DEFAULT_SOURCES = [
+    "sprint1_music_data.json",
+    "audioDB_200_in_order.json",
+    "test_artist_output.json",
+    "expanded_schema.json",
+]
+
+# Known city centres, used before falling back to a hashed point inside the
+# country's bounding box. Sources that carry coordinates extend this table.
+CITY_COORDINATES = {
+    ("united states", "new york"): (40.7128, -74.0060),
+    ("united states", "los angeles"): (34.0522, -118.2437),
+    ("united states", "chicago"): (41.8781, -87.6298),
+    ("united states", "brooklyn"): (40.6782, -73.9442),
+    ("united states", "philadelphia"): (39.9526, -75.1652),
+    ("united states", "new orleans"): (29.9511, -90.0715),
+    ("united states", "detroit"): (42.3314, -83.0458),
+    ("united states", "boston"): (42.3601, -71.0589),
+    ("united states", "san francisco"): (37.7749, -122.4194),
+    ("united states", "seattle"): (47.6062, -122.3321),
+    ("united states", "portland"): (45.5152, -122.6784),
+    ("united states", "nashville"): (36.1627, -86.7816),
+    ("united states", "memphis"): (35.1495, -90.0490),
+    ("united states", "atlanta"): (33.7490, -84.3880),
+    ("united states", "houston"): (29.7604, -95.3698),
+    ("united states", "dallas"): (32.7767, -96.7970),
+    ("united states", "austin"): (30.2672, -97.7431),
+    ("united states", "st. louis"): (38.6270, -90.1994),
+    ("united states", "kansas city"): (39.0997, -94.5786),
+    ("united states", "minneapolis"): (44.9778, -93.2650),
+    ("united states", "pittsburgh"): (40.4406, -79.9959),
+    ("united states", "baltimore"): (39.2904, -76.6122),
+    ("united states", "washington"): (38.9072, -77.0369),
+    ("united states", "cleveland"): (41.4993, -81.6944),
+    ("united states", "miami"): (25.7617, -80.1918),
+    ("united states", "denver"): (39.7392, -104.9903),
+    ("united states", "oakland"): (37.8044, -122.2712),
+    ("united states", "newark"): (40.7357, -74.1724),
+    ("united states", "the bronx"): (40.8448, -73.8648),
+    ("united states", "queens"): (40.7282, -73.7949),
+    ("united states", "indianapolis"): (39.7684, -86.1581),
+    ("united states", "cincinnati"): (39.1031, -84.5120),
+    ("united states", "hollywood"): (34.0928, -118.3287),
+    ("united states", "long branch"): (40.3043, -73.9924),
+    ("united states", "gary"): (41.5934, -87.3464),
+    ("united kingdom", "london"): (51.5074, -0.1278),
+    ("canada", "toronto"): (43.6532, -79.3832),
+}
+
+# (min latitude, max latitude, min longitude, max longitude)
+COUNTRY_BOUNDS = {
+    "united states": (25.0, 49.0, -124.0, -67.0),
+    "canada": (43.0, 60.0, -130.0, -60.0),
+    "united kingdom": (50.0, 58.5, -6.0, 1.7),
+    "germany": (47.3, 55.0, 5.9, 15.0),
+    "france": (42.3, 51.1, -4.8, 8.2),
+    "japan": (31.0, 45.5, 129.5, 145.8),
+    "australia": (-38.5, -12.5, 114.0, 153.5),
+}
+_WORLD_BOUNDS = (-45.0, 60.0, -125.0, 150.0)
+
+# Discography shape used when the sources hold too few albums to learn from.
+_DEFAULT_ALBUM_COUNTS = [0, 0, 1, 1, 2, 2, 3, 4, 5, 6, 8, 12]
+_DEFAULT_TRACK_COUNTS = [8, 9, 10, 10, 11, 12, 12, 13, 14, 16]
+_DEFAULT_DURATIONS = [150, 180, 200, 210, 225, 240, 255, 270, 300, 330, 360, 420]
+_MIN_SAMPLES = 20
+
+
+def _iter_source_artists(data) -> Iterator[Tuple[Optional[str], Dict]]:
+    """
+    Yield (genre, artist) pairs from any of the source layouts.
+
+    Genre-keyed lists give the genre; single-artist documents give ``None``
+    so they shape discographies without skewing the genre mix.
+    """
+    if not isinstance(data, dict):
+        return
+    if "name" in data:
+        yield data.get("genre"), data
+        return
+    for genre, artists in data.items():
+        if isinstance(artists, list):
+            for artist in artists:
+                if isinstance(artist, dict) and artist.get("name"):
+                    yield genre, artist
+        elif isinstance(artists, dict) and artists.get("name"):
+            yield artists.get("genre"), artists
+
+
+def _split_location(location: str) -> Tuple[Optional[str], Optional[str]]:
+    parts = [part.strip() for part in location.split(",") if part.strip()]
+    if not parts:
+        return None, None
+    return parts[-1], parts[0]
+
+
+class WeightedChoice:
+    """Sample from a weighted population with one bisect per draw."""
+
+    def __init__(self, counts: Dict):
+        items = sorted(counts.items(), key=lambda item: (-item[1], str(item[0])))
+        self.values = [value for value, _ in items]
+        self.weights = [weight for _, weight in items]
+        self._cumulative = list(accumulate(self.weights))
+        self._total = self._cumulative[-1] if self._cumulative else 0
+
+    def __call__(self, rng: random.Random):
+        return self.values[bisect_right(self._cumulative, rng.random() * self._total)]
+
+    def probabilities(self) -> Dict:
+        return {value: weight / self._total for value, weight in zip(self.values, self.weights)}
+
+
+class CatalogModel:
+    """Distributions learned from the real datasets."""
+
+    def __init__(self):
+        self.genres = Counter()
+        self.places = Counter()
+        self.coordinates: Dict[Tuple[str, str], Tuple[float, float]] = {}
+        self.display_names: Dict[str, str] = {}
+        self.name_lengths = Counter()
+        self.single_names = Counter()
+        self.first_words = Counter()
+        self.other_words = Counter()
+        self.summary_lengths: List[int] = []
+        self.summary_words = Counter()
+        self.album_counts: List[int] = []
+        self.track_counts: List[int] = []
+        self.durations: List[int] = []
+        self.years: List[int] = []
+        self.ratings: List[Optional[float]] = []
+        self.title_words = Counter()
+
+    # -- learning ---------------------------------------------------------
+
+    @classmethod
+    def from_sources(cls, paths: Iterable[Path]) -> "CatalogModel":
+        model = cls()
+        for path in paths:
+            if not path.exists():
+                logger.info(f"Skipping missing source {path.name}")
+                continue
+            with path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+            learned = 0
+            for genre, artist in _iter_source_artists(data):
+                model.learn_artist(genre, artist)
+                learned += 1
+            logger.info(f"Learned from {learned} artists in {path.name}")
+        if not model.genres:
+            raise ValueError("No artists found in the source files")
+        return model
+
+    def _display(self, value: str) -> str:
+        key = value.strip().lower()
+        self.display_names.setdefault(key, value.strip())
+        return key
+
+    def learn_artist(self, genre: Optional[str], artist: Dict) -> None:
+        if genre:
+            self.genres[genre.strip().lower()] += 1
+
+        country, city = artist.get("country"), artist.get("city")
+        if not country and artist.get("location"):
+            country, city = _split_location(artist["location"])
+        if country:
+            place = (self._display(country), self._display(city or country))
+            self.places[place] += 1
+            coordinates = artist.get("coordinates") or {}
+            if "latitude" in coordinates and "longitude" in coordinates:
+                self.coordinates.setdefault(
+                    place, (coordinates["latitude"], coordinates["longitude"])
+                )
+
+        words = artist["name"].split()
+        if len(words) == 1:
+            self.name_lengths[1] += 1
+            self.single_names[words[0]] += 1
+        elif words:
+            self.name_lengths[len(words)] += 1
+            self.first_words[words[0]] += 1
+            self.other_words.update(words[1:])
+
+        summary = artist.get("summary")
+        if summary:
+            self.summary_lengths.append(len(summary.split()))
+            self.summary_words.update(word for word in summary.split() if word.isalpha())
+
+        albums = artist.get("albums")
+        if albums is None:
+            return
+        self.album_counts.append(len(albums))
+        for album in albums:
+            self.title_words.update((album.get("title") or "").split())
+            year = album.get("year")
+            if year and str(year).isdigit():
+                self.years.append(int(year))
+            self.ratings.append(album.get("rating"))
+            tracks = album.get("tracks") or []
+            self.track_counts.append(len(tracks))
+            for track in tracks:
+                self.title_words.update((track.get("title") or "").split())
+                seconds = duration_seconds(track.get("duration"))
+                if seconds:
+                    self.durations.append(seconds)
+
+    # -- sampling ---------------------------------------------------------
+
+    def sampler(self) -> "CatalogSampler":
+        return CatalogSampler(self)
+
+    def coordinates_for(self, country: str, city: str) -> Tuple[float, float]:
+        """Coordinates for a place: learned, built in, or a stable hashed point."""
+        place = (country, city)
+        if place in self.coordinates:
+            return self.coordinates[place]
+        if place in CITY_COORDINATES:
+            return CITY_COORDINATES[place]
+        min_lat, max_lat, min_lon, max_lon = COUNTRY_BOUNDS.get(country, _WORLD_BOUNDS)
+        digest = zlib.crc32(f"{country}|{city}".encode("utf-8"))
+        lat = min_lat + (digest & 0xFFFF) / 0xFFFF * (max_lat - min_lat)
+        lon = min_lon + (digest >> 16) / 0xFFFF * (max_lon - min_lon)
+        return round(lat, 4), round(lon, 4)
+
+    def top_places(self, limit: int = 20) -> List[Tuple[str, str, float, float]]:
+        """Most common (city, country, latitude, longitude) in display form."""
+        places = []
+        for (country, city), _ in self.places.most_common(limit):
+            lat, lon = self.coordinates_for(country, city)
+            places.append((self.display_names[city], self.display_names[country], lat, lon))
+        return places
+
+    def genre_counts(self, total: int) -> List[Tuple[str, int]]:
+        """Split ``total`` artists across genres in the learned proportions."""
+        probabilities = WeightedChoice(self.genres).probabilities()
+        exact = {genre: total * share for genre, share in probabilities.items()}
+        counts = {genre: int(math.floor(value)) for genre, value in exact.items()}
+        remainder = total - sum(counts.values())
+        for genre in sorted(exact, key=lambda g: (counts[g] - exact[g], g))[:remainder]:
+            counts[genre] += 1
+        return [(genre, count) for genre, count in sorted(counts.items()) if count]
+
+
+class CatalogSampler:
+    """
+    Precomputed samplers for fast generation from a ``CatalogModel``.
+
+    Titles, summaries and track lists are drawn from pools built once from
+    the learned distributions, so each artist costs a handful of
+    ``random()`` calls rather than one per word or track.
+    """
+
+    POOL_SIZE = 4096
+
+    def __init__(self, model: CatalogModel):
+        self.model = model
+        self.place = WeightedChoice(model.places)
+        self.name_length = WeightedChoice(model.name_lengths)
+        self.single_name = WeightedChoice(model.single_names or model.first_words)
+        self.first_word = WeightedChoice(model.first_words or model.single_names)
+        self.other_word = WeightedChoice(model.other_words or model.first_words or model.single_names)
+
+        enough_albums = len(model.album_counts) >= _MIN_SAMPLES
+        self.album_counts = model.album_counts if enough_albums else _DEFAULT_ALBUM_COUNTS
+        enough_tracks = len(model.track_counts) >= _MIN_SAMPLES
+        self.track_counts = model.track_counts if enough_tracks else _DEFAULT_TRACK_COUNTS
+        durations = model.durations if len(model.durations) >= _MIN_SAMPLES else _DEFAULT_DURATIONS
+        self.years = model.years or list(range(1960, 2025))
+        self.ratings = model.ratings or [None]
+
+        # Pools are seeded independently of the catalog seed so they are
+        # identical in every worker process.
+        pool_rng = random.Random(0)
+        title_words = list(model.title_words) or ["Untitled"]
+        summary_words = list(model.summary_words) or ["music"]
+        summary_lengths = model.summary_lengths or [60]
+        self.titles = [
+            " ".join(pool_rng.choices(title_words, k=pool_rng.randint(1, 4)))
+            for _ in range(self.POOL_SIZE)
+        ]
+        self.durations = [
+            max(30, pool_rng.choice(durations) + pool_rng.randint(-20, 20))
+            for _ in range(self.POOL_SIZE)
+        ]
+        # Albums take a random slice of this pool as their track list.
+        self.tracks = [
+            {"title": self.titles[i % self.POOL_SIZE], "duration": self.durations[i % self.POOL_SIZE]}
+            for i in range(self.POOL_SIZE + max(self.track_counts))
+        ]
+        self.summaries = [
+            " ".join(pool_rng.choices(summary_words, k=pool_rng.choice(summary_lengths)))
+            for _ in range(self.POOL_SIZE // 8)
+        ]
+
+        display = model.display_names
+        self.place_details = {
+            (country, city): (
+                display[city],
+                display[country],
+                display[city] if city == country else f"{display[city]}, {display[country]}",
+                *model.coordinates_for(country, city),
+            )
+            for country, city in self.place.values
+        }
+
+    def name(self, rng: random.Random) -> str:
+        length = self.name_length(rng)
+        if length == 1:
+            return self.single_name(rng)
+        words = [self.first_word(rng)]
+        words.extend(self.other_word(rng) for _ in range(length - 1))
+        return " ".join(words)
+
+    def artist(self, rng: random.Random, genre: str, index: int) -> Dict:
+        city, country, location, lat, lon = self.place_details[self.place(rng)]
+        name = self.name(rng)
+
+        rand = rng.random
+        titles, tracks = self.titles, self.tracks
+        pool = len(titles)
+        albums = []
+        for album_index in range(self.album_counts[int(rand() * len(self.album_counts))]):
+            track_count = self.track_counts[int(rand() * len(self.track_counts))]
+            first_track = int(rand() * pool)
+            albums.append({
+                "title": titles[int(rand() * pool)],
+                "year": self.years[int(rand() * len(self.years))],
+                "image": f"https://example.com/synthetic/albums/{genre}/{index}-{album_index}.jpg",
+                "rating": self.ratings[int(rand() * len(self.ratings))],
+                "tracks": tracks[first_track:first_track + track_count],
+            })
+
+        summary = self.summaries[int(rand() * len(self.summaries))]
+        return {
+            "name": name,
+            "genre": genre,
+            "country": country,
+            "city": city,
+            "location": location,
+            "coordinates": {
+                "latitude": round(lat + (rand() - 0.5) * 0.1, 5),
+                "longitude": round(lon + (rand() - 0.5) * 0.1, 5),
+            },
+            "summary": f"{name} is a {genre} artist from {city}. {summary}",
+            "image": f"https://example.com/synthetic/artists/{genre}/{index}.jpg",
+            "albums": albums,
+        }
+
+
+# -- generation --------------------------------------------------------------
+
+def _chunk_plan(model: CatalogModel, count: int, chunk_size: int) -> List[Tuple[str, int, int]]:
+    plan = []
+    for genre, genre_count in model.genre_counts(count):
+        for start in range(0, genre_count, chunk_size):
+            plan.append((genre, start, min(chunk_size, genre_count - start)))
+    return plan
+
+
+_worker_sampler: Optional[CatalogSampler] = None
+_encode = json.JSONEncoder(separators=(",", ":")).encode
+
+
+def _init_worker(model: CatalogModel) -> None:
+    global _worker_sampler
+    _worker_sampler = model.sampler()
+
+
+def _generate_chunk(task) -> List[Dict]:
+    seed, genre, start, size = task[:4]
+    # Each chunk has its own stream, so output does not depend on worker count.
+    rng = random.Random(f"{seed}:{genre}:{start}")
+    return [_worker_sampler.artist(rng, genre, start + offset) for offset in range(size)]
+
+
+def _encode_chunk(task) -> List[Tuple[str, str]]:
+    """Generate a chunk and encode it in the worker, returning (name, json) pairs."""
+    include_genre = task[4]
+    encoded = []
+    for artist in _generate_chunk(task):
+        if not include_genre:
+            del artist["genre"]
+        encoded.append((artist["name"], _encode(artist)))
+    return encoded
+
+
+def _run_tasks(func, tasks, model: CatalogModel, workers: int) -> Iterator:
+    if workers <= 1:
+        _init_worker(model)
+        yield from map(func, tasks)
+        return
+    with Pool(workers, initializer=_init_worker, initargs=(model,)) as pool:
+        yield from pool.imap(func, tasks)
+
+
+class NameDeduper:
+    """Keep artist names unique under the app's ``normalize_text`` key."""
+
+    def __init__(self):
+        self._seen: Dict[str, int] = {}
+
+    def unique(self, name: str) -> Optional[str]:
+        """Return a replacement name if ``name`` was already used, else None."""
+        key = normalize_text(name)
+        if key not in self._seen:
+            self._seen[key] = 1
+            return None
+        repeats = self._seen[key]
+        while True:
+            repeats += 1
+            candidate = f"{name} ({repeats})"
+            candidate_key = normalize_text(candidate)
+            if candidate_key not in self._seen:
+                self._seen[key] = repeats
+                self._seen[candidate_key] = 1
+                return candidate
+
+
+def generate_artists(
+    model: CatalogModel,
+    count: int,
+    seed: int = 42,
+    chunk_size: int = 10_000,
+    workers: int = 1,
+    unique_names: bool = True,
+) -> Iterator[Dict]:
+    """
+    Yield ``count`` synthetic artists, grouped by genre.
+
+    Track dicts come from a shared pool, so treat them as read-only.
+
+    Args:
+        model: Learned catalog model
+        count: Number of artists to generate
+        seed: Random seed; the same seed and chunk size give the same catalog
+        chunk_size: Artists generated per task
+        workers: Worker processes (1 generates in-process)
+        unique_names: Suffix repeated names ("Name (2)", "Name (3)", ...)
+    """
+    tasks = [(seed, genre, start, size) for genre, start, size in _chunk_plan(model, count, chunk_size)]
+    deduper = NameDeduper() if unique_names else None
+    for chunk in _run_tasks(_generate_chunk, tasks, model, workers):
+        for artist in chunk:
+            if deduper is not None:
+                renamed = deduper.unique(artist["name"])
+                if renamed:
+                    artist["name"] = renamed
+            yield artist
+
+
+def generate_lines(
+    model: CatalogModel,
+    count: int,
+    seed: int = 42,
+    chunk_size: int = 10_000,
+    workers: int = 1,
+    unique_names: bool = True,
+    include_genre: bool = True,
+) -> Iterator[Tuple[str, str]]:
+    """
+    Yield (genre, encoded artist JSON) pairs, encoding in the workers.
+
+    Same catalog as ``generate_artists`` for the same arguments; only the
+    rare renamed duplicate is re-encoded in this process.
+    """
+    plan = _chunk_plan(model, count, chunk_size)
+    tasks = [(seed, genre, start, size, include_genre) for genre, start, size in plan]
+    deduper = NameDeduper() if unique_names else None
+    for (genre, _, _), chunk in zip(plan, _run_tasks(_encode_chunk, tasks, model, workers)):
+        for name, line in chunk:
+            if deduper is not None:
+                renamed = deduper.unique(name)
+                if renamed:
+                    # Every document starts with its name, so swap just that prefix.
+                    prefix = len(_encode({"name": name})) - 1
+                    line = _encode({"name": renamed})[:-1] + line[prefix:]
+            yield genre, line
+
+
+def write_catalog(lines: Iterable[Tuple[str, str]], output, output_format: str = "ndjson") -> int:
+    """
+    Stream encoded artists to ``output``.
+
+    ``ndjson`` writes one artist per line; ``json`` writes the genre-keyed
+    layout of ``expanded_schema.json``, relying on ``lines`` being grouped
+    by genre.
+    """
+    written = 0
+    if output_format == "ndjson":
+        for _, line in lines:
+            output.write(line)
+            output.write("\n")
+            written += 1
+        return written
+
+    current_genre = None
+    output.write("{")
+    for genre, line in lines:
+        if genre != current_genre:
+            if current_genre is not None:
+                output.write("],")
+            output.write(f"{_encode(genre)}:[")
+            current_genre = genre
+        else:
+            output.write(",")
+        output.write(line)
+        written += 1
+    if current_genre is not None:
+        output.write("]")
+    output.write("}\n")
+    return written
+
+
+def load_model(sources: Optional[Sequence[str]] = None) -> CatalogModel:
+    """Learn a model from the given source files (defaults to this directory's)."""
+    paths = [Path(source) if os.path.sep in source else RESOURCES_DIR / source
+             for source in (sources or DEFAULT_SOURCES)]
+    return CatalogModel.from_sources(paths)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic artist catalog.")
+    parser.add_argument("--count", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--format", choices=["ndjson", "json"], default="ndjson")
+    parser.add_argument("--output", default="-", help="Output file ('-' for stdout)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=10_000)
+    parser.add_argument("--sources", nargs="*", default=None,
+                        help="Source JSON files (defaults to the files in resources/)")
+    parser.add_argument("--allow-duplicate-names", action="store_true",
+                        help="Skip name dedupe (saves memory for very large catalogs)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    model = load_model(args.sources)
+    shares = ", ".join(f"{genre} {share:.1%}"
+                       for genre, share in WeightedChoice(model.genres).probabilities().items())
+    logger.info(f"Genre mix: {shares}")
+    logger.info(f"{len(model.places)} distinct places, {len(model.album_counts)} discographies")
+
+    started = time.perf_counter()
+    lines = generate_lines(model, args.count, seed=args.seed, chunk_size=args.chunk_size,
+                           workers=args.workers,
+                           unique_names=not args.allow_duplicate_names,
+                           include_genre=args.format == "ndjson")
+    if args.output == "-":
+        written = write_catalog(lines, sys.stdout, args.format)
+    else:
+        with open(args.output, "w", encoding="utf-8", buffering=1 << 20) as f:
+            written = write_catalog(lines, f, args.format)
+    elapsed = time.perf_counter() - started
+    logger.info(f"Wrote {written} artists in {elapsed:.1f}s ({written / elapsed:,.0f} artists/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,79 @@
-import json
+import argparse
+
 from database import db
+from indexes import ensure_indexes
+from services.album_buckets import ALBUM_BUCKET_COLLECTION
+from services.catalog_changes import publish_reload
+from services.catalog_file import CatalogFile, CatalogFileError, json_catalog_documents, stamp_catalog_version
+from services.facets import rebuild_facet_counts
+from services.tracks import rebuild_tracks
+
+JSON_CATALOG = 'resources/audioDB_200_in_order.json'
 
-def seed_database():
+
+def read_catalog_file(filename, batch_size=5000):
+    """
+    Inserts the artists of a binary catalog file (see services/catalog_file.py)
+    as stored, without decoding them.
     """
-    Seeds the MongoDB database with data from the JSON file.
+    catalog = CatalogFile(filename)
+    try:
+        for start in range(0, len(catalog), batch_size):
+            db.artists.insert_many(catalog.raw_documents(start, start + batch_size), ordered=False)
+        return len(catalog)
+    finally:
+        catalog.close()
+
+
+def seed_database(catalog_file=None):
+    """
+    Seeds the MongoDB database with data from the JSON file, or from a
+    binary catalog file when one is given.
     """
     artists_collection = db.artists
-    
+
     # Clear existing data to avoid duplicates on re-running
     print("Clearing existing artist data...")
     artists_collection.delete_many({})
-    
-    print("Reading data from JSON file...")
-    try:
-        with open('resources/audioDB_200_in_order.json', 'r', encoding='utf-8') as f:
-            data = json.load(f)
-    except FileNotFoundError:
-        print("Error: audioDB_200_in_order.json not found. Make sure the file is in the 'resources' directory.")
-        return
-    
-    all_artists = []
-    for genre, artists_in_genre in data.items():
-        for artist in artists_in_genre:
-            artist_document = artist.copy()
-            artist_document['genre'] = genre
-            all_artists.append(artist_document)
-            
-    if all_artists:
-        print(f"Inserting {len(all_artists)} artists into the database...")
-        artists_collection.insert_many(all_artists)
+    db[ALBUM_BUCKET_COLLECTION].delete_many({})
+
+    if catalog_file:
+        print(f"Reading data from {catalog_file}...")
+        inserted = read_catalog_file(catalog_file)
+    else:
+        print("Reading data from JSON file...")
+        try:
+            # Names are unique (see indexes.py); an artist keeps its first genre.
+            all_artists = list(json_catalog_documents(JSON_CATALOG))
+        except FileNotFoundError:
+            print("Error: audioDB_200_in_order.json not found. Make sure the file is in the 'resources' directory.")
+            return
+        if all_artists:
+            print(f"Inserting {len(all_artists)} artists into the database...")
+            artists_collection.insert_many(all_artists)
+        inserted = len(all_artists)
+
+    if inserted:
         print(f"Successfully seeded {artists_collection.count_documents({})} artists into the database.")
+        print("Applying indexes...")
+        created = ensure_indexes(db, background=False)
+        print(f"Created indexes: {created.get('artists', [])}")
+        print(f"Materialized {rebuild_facet_counts(db)} facet rows.")
+        print(f"Flattened {rebuild_tracks(db)} tracks.")
+        # Never moves the version backwards: running workers reload everything.
+        version = publish_reload(db)
+        print(f"Catalog version is now {version}.")
+        if catalog_file:
+            # The database now holds exactly the file's artists, as of this version.
+            try:
+                stamp_catalog_version(catalog_file, version)
+            except (OSError, CatalogFileError) as e:
+                print(f"Could not record the version in {catalog_file} ({e}); "
+                      "re-export it before using it as CATALOG_FILE.")
     else:
-        print("No artists found in the JSON file to seed.")
+        print("No artists found to seed.")
 
 if __name__ == "__main__":
-    seed_database()
+    parser = argparse.ArgumentParser(description="Seed the artists collection.")
+    parser.add_argument("--catalog", help="Binary catalog file to seed from instead of the JSON file")
+    seed_database(parser.parse_args().catalog)
@@ -0,0 +1,100 @@
+"""
+Multi-process server entry point.
+
+Runs ``main:app`` under uvicorn with ``Config.WEB_WORKERS`` worker processes
+(one per available CPU by default). Each worker imports the app on its own
+and creates its MongoDB client, HTTP session and caches in its lifespan, so
+nothing is shared across processes. Workers are recycled after
+``Config.WEB_MAX_REQUESTS`` requests and replaced by the supervisor, and get
+``Config.WEB_GRACEFUL_TIMEOUT`` seconds to finish in-flight requests when
+stopping.
+
+From the ``backend`` directory::
+
+    python serve.py
+    WEB_WORKERS=4 WEB_PORT=8001 python serve.py
+
+Metrics are per process too. So that a scrape of ``/metrics``, which
+reaches whichever worker accepts it, reports the whole server, workers
+write their samples to a shared directory (``Config.METRICS_DIR``) and
+``/metrics`` sums them (see ``utils.metrics.SharedMetrics``). With more
+than one worker and no ``METRICS_DIR`` configured, ``main()`` creates a
+fresh temporary directory for the run; a configured directory is cleared of
+the previous run's files at start.
+
+For pre-fork servers that import the app before forking (e.g. gunicorn
+with ``--preload``), ``database`` and ``lifecycle`` drop inherited clients in
+``os.register_at_fork`` hooks.
+"""
+import glob
+import inspect
+import logging
+import os
+import tempfile
+from typing import Optional
+
+import uvicorn
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def worker_count(configured: Optional[int] = None) -> int:
+    """The configured worker count, or the number of usable CPUs for 0."""
+    if configured is None:
+        configured = Config.WEB_WORKERS
+    if configured > 0:
+        return configured
+    if hasattr(os, "sched_getaffinity"):
+        return max(1, len(os.sched_getaffinity(0)))
+    return os.cpu_count() or 1
+
+
+def server_options() -> dict:
+    """Keyword arguments for ``uvicorn.run`` built from ``Config``."""
+    options = {
+        "host": Config.WEB_HOST,
+        "port": Config.WEB_PORT,
+        "workers": worker_count(),
+        "limit_max_requests": Config.WEB_MAX_REQUESTS or None,
+        "timeout_graceful_shutdown": Config.WEB_GRACEFUL_TIMEOUT,
+    }
+    if Config.WEB_MAX_REQUESTS and Config.WEB_MAX_REQUESTS_JITTER:
+        # Only newer uvicorn releases can stagger recycling.
+        if "limit_max_requests_jitter" in inspect.signature(uvicorn.Config).parameters:
+            options["limit_max_requests_jitter"] = Config.WEB_MAX_REQUESTS_JITTER
+        else:
+            logger.warning("This uvicorn version ignores WEB_MAX_REQUESTS_JITTER")
+    return options
+
+
+def prepare_metrics_dir(workers: int) -> str:
+    """
+    The directory workers share metrics through, exported as ``METRICS_DIR``
+    so the worker processes inherit it. Empty for a single worker.
+    """
+    directory = Config.METRICS_DIR
+    if not directory:
+        if workers <= 1:
+            return ""
+        directory = tempfile.mkdtemp(prefix="cfyby-metrics-")
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, "metrics-*.json")):
+        os.remove(path)
+    os.environ["METRICS_DIR"] = directory
+    return directory
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    options = server_options()
+    metrics_dir = prepare_metrics_dir(options["workers"])
+    if metrics_dir:
+        logger.info(f"Workers share metrics through {metrics_dir}")
+    logger.info(f"Serving with {options['workers']} worker(s) on {options['host']}:{options['port']}")
+    uvicorn.run("main:app", **options)
+
+
+if __name__ == "__main__":
+    main()
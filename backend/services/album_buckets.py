@@ -0,0 +1,267 @@
+"""
+Registered albums stored in bounded per-artist buckets.
+
+Albums registered through ``/artists/register/discography`` are not pushed
+onto the artist document, which would grow without bound and be read in
+full by every name lookup. They go to the ``album_buckets`` collection
+instead, ``Config.ALBUM_BUCKET_SIZE`` albums per bucket::
+
+    {"artist_id": ..., "artist": "Name", "bucket": 0,
+     "albums": [...], "positions": [0, 1, ...],
+     "album_titles_normalized": [...]}
+
+The artist document keeps only small bookkeeping fields:
+
+- ``bucketed_albums``: how many albums are in buckets; appending an album
+  ``$inc``s it, and the value before the increment is the album's position,
+  so its bucket is ``position // ALBUM_BUCKET_SIZE``
+- ``album_keys``: ``"title|year"`` keys of every album (derived, see
+  ``services.artist_documents``); appending is conditional on the key being
+  absent, which makes the dedupe atomic
+- ``album_titles_normalized``, as before, for album title lookups
+
+Albums embedded in artist documents (seeded catalogs, earlier
+registrations) stay where they are and come first; bucketed albums follow
+them in registration order. Responses that include albums get both, via
+``attach_albums``, which only queries buckets for artists with
+``bucketed_albums``.
+"""
+import logging
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from config import Config
+from services.artist_documents import album_key, normalize_album
+from utils.text import normalize_text
+
+logger = logging.getLogger(__name__)
+
+ALBUM_BUCKET_COLLECTION = "album_buckets"
+
+
+class DuplicateAlbum(Exception):
+    """Raised when an artist already has an album with the same title and year."""
+    pass
+
+
+def append_album(db, name: str, album: Dict[str, Any],
+                 bucket_size: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """
+    Append an album to an artist's buckets, unless the artist already has it.
+
+    Args:
+        db: pymongo Database
+        name: Artist name, compared normalized
+        album: Album as registered; normalized on the way in
+        bucket_size: Albums per bucket (``Config.ALBUM_BUCKET_SIZE`` by default)
+
+    Returns:
+        The artist before the update, with ``_id``, ``name``, ``genre``, the
+        titles of its embedded ``albums`` and ``bucketed_albums`` (the new
+        album's position), or None if there is no such artist
+
+    Raises:
+        DuplicateAlbum: The artist already has an album with this title and year
+    """
+    bucket_size = bucket_size or Config.ALBUM_BUCKET_SIZE
+    album = normalize_album(album)
+    key = album_key(album)
+    title = normalize_text(album.get("title"))
+    artist_filter = {"name_normalized": normalize_text(name)}
+    artist = db.artists.find_one_and_update(
+        dict(artist_filter, album_keys={"$ne": key}),
+        {"$addToSet": {"album_keys": key, "album_titles_normalized": title},
+         "$inc": {"bucketed_albums": 1}},
+        projection={"name": 1, "genre": 1, "albums.title": 1, "bucketed_albums": 1},
+    )
+    if artist is None:
+        if db.artists.find_one(artist_filter, {"_id": 1}) is not None:
+            raise DuplicateAlbum(key)
+        return None
+
+    position = artist.get("bucketed_albums", 0)
+    bucket_filter = {"artist_id": artist["_id"], "bucket": position // bucket_size}
+    update = {
+        "$push": {"albums": album, "positions": position},
+        "$addToSet": {"album_titles_normalized": title},
+        "$setOnInsert": {"artist": artist.get("name")},
+    }
+    try:
+        try:
+            db[ALBUM_BUCKET_COLLECTION].update_one(bucket_filter, update, upsert=True)
+        except DuplicateKeyError:
+            # A concurrent append created the bucket first; it exists now.
+            db[ALBUM_BUCKET_COLLECTION].update_one(bucket_filter, update)
+    except PyMongoError:
+        _undo_reservation(db, artist, position, key)
+        raise
+    return artist
+
+
+def _undo_reservation(db, artist: Dict[str, Any], position: int, key: str) -> None:
+    """
+    Give back the position and album key an append reserved but never filled.
+
+    Only possible while no later append has taken the next position; past
+    that, ``bucketed_albums`` stays one ahead of the buckets (``album_page``
+    offsets after the gap are off by one) and the artist is logged for repair.
+    """
+    try:
+        undone = db.artists.update_one(
+            {"_id": artist["_id"], "bucketed_albums": position + 1},
+            {"$inc": {"bucketed_albums": -1}, "$pull": {"album_keys": key}},
+        ).modified_count
+    except PyMongoError as e:
+        logger.error(f"Undoing the album append failed: {e}")
+        undone = 0
+    if not undone:
+        logger.error(f"Album bucket position {position} of artist {artist['_id']} "
+                     f"({artist.get('name')}) was reserved but not written; "
+                     f"album key {key!r} is held without an album")
+
+
+def _in_order(bucket: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """A bucket's albums by position (concurrent appends may land out of order)."""
+    albums = bucket.get("albums") or []
+    positions = bucket.get("positions") or []
+    if positions == sorted(positions):
+        return albums
+    return [album for _, album in sorted(zip(positions, albums), key=lambda pair: pair[0])]
+
+
+def bucket_projection(projection: Optional[Dict[str, int]]) -> Optional[Dict[str, int]]:
+    """
+    The ``album_buckets`` projection matching the albums an artist
+    projection includes, or None when it includes no albums.
+    """
+    if not projection:
+        return {"artist_id": 1, "albums": 1, "positions": 1}
+    inclusion = any(value for key, value in projection.items() if key != "_id")
+    if not inclusion:
+        if projection.get("albums", 1) == 0:
+            return None
+        excluded = {key: 0 for key, value in projection.items() if key.startswith("albums.") and not value}
+        return dict(excluded, album_titles_normalized=0) if excluded else {"album_titles_normalized": 0}
+    if projection.get("albums"):
+        return {"artist_id": 1, "albums": 1, "positions": 1}
+    fields = {key: 1 for key, value in projection.items() if key.startswith("albums.") and value}
+    return dict(fields, artist_id=1, positions=1) if fields else None
+
+
+def bucketed_albums(db, artist_ids: Iterable[Any],
+                    projection: Optional[Dict[str, int]] = None) -> Dict[Any, List[Dict[str, Any]]]:
+    """
+    The bucketed albums of several artists, in order, with one query.
+
+    Args:
+        db: pymongo Database
+        artist_ids: Artist ``_id`` values
+        projection: ``album_buckets`` projection (see ``bucket_projection``)
+
+    Returns:
+        Albums per artist ``_id``; artists without buckets are omitted
+    """
+    ids = list(artist_ids)
+    albums: Dict[Any, List[Dict[str, Any]]] = defaultdict(list)
+    if not ids:
+        return albums
+    buckets = db[ALBUM_BUCKET_COLLECTION].find(
+        {"artist_id": {"$in": ids}}, projection or {"artist_id": 1, "albums": 1, "positions": 1}
+    ).sort([("artist_id", 1), ("bucket", 1)])
+    for bucket in buckets:
+        albums[bucket["artist_id"]].extend(_in_order(bucket))
+    return albums
+
+
+def attach_albums(db, artists: List[Dict[str, Any]],
+                  projection: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
+    """
+    Append bucketed albums to artists read with ``projection``, in place.
+
+    Only artists whose ``bucketed_albums`` came back non-zero are looked up,
+    and the field is removed from every artist.
+
+    Args:
+        db: pymongo Database
+        artists: Artist documents as read, ``_id`` still an ObjectId
+        projection: The projection they were read with
+
+    Returns:
+        The same artists
+    """
+    pending = [artist for artist in artists if artist.pop("bucketed_albums", 0)]
+    shape = bucket_projection(projection)
+    if not pending or shape is None:
+        return artists
+    found = bucketed_albums(db, (artist["_id"] for artist in pending), shape)
+    for artist in pending:
+        if artist["_id"] in found:
+            artist["albums"] = list(artist.get("albums") or []) + found[artist["_id"]]
+    return artists
+
+
+def album_page(db, artist: Dict[str, Any], offset: int = 0,
+               limit: Optional[int] = None,
+               bucket_size: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    A page of an artist's albums, embedded ones first, reading only the
+    buckets the page overlaps.
+
+    Args:
+        db: pymongo Database
+        artist: Artist with ``_id``, its embedded ``albums`` and ``bucketed_albums``
+        offset: Albums to skip
+        limit: Albums to return (None for all from ``offset``)
+        bucket_size: Albums per bucket (``Config.ALBUM_BUCKET_SIZE`` by default)
+
+    Returns:
+        The albums on the page
+    """
+    bucket_size = bucket_size or Config.ALBUM_BUCKET_SIZE
+    embedded = artist.get("albums") or []
+    end = None if limit is None else offset + limit
+    page = embedded[offset:end]
+    bucketed = artist.get("bucketed_albums", 0)
+    first = max(offset - len(embedded), 0)
+    last = bucketed if end is None else min(end - len(embedded), bucketed)
+    if last <= first:
+        return page
+    buckets = db[ALBUM_BUCKET_COLLECTION].find(
+        {"artist_id": artist["_id"],
+         "bucket": {"$gte": first // bucket_size, "$lte": (last - 1) // bucket_size}},
+        {"albums": 1, "positions": 1},
+    ).sort("bucket", 1)
+    albums = [album for bucket in buckets for album in _in_order(bucket)]
+    start = first - (first // bucket_size) * bucket_size
+    return page + albums[start:start + last - first]
+
+
+def find_bucketed_album(db, title: str) -> Optional[Dict[str, Any]]:
+    """A bucketed album with this title, compared normalized, or None."""
+    normalized = normalize_text(title)
+    bucket = db[ALBUM_BUCKET_COLLECTION].find_one({"album_titles_normalized": normalized}, {"albums": 1})
+    for album in (bucket or {}).get("albums") or []:
+        if normalize_text(album.get("title")) == normalized:
+            return album
+    return None
+
+
+def albums_by_runtime(db, runtime: Dict[str, float], limit: int) -> List[Dict[str, Any]]:
+    """Bucketed albums whose runtime is in the ``runtime`` range, as ``/albums`` lists them."""
+    return list(db[ALBUM_BUCKET_COLLECTION].aggregate([
+        {"$match": {"albums": {"$elemMatch": {"runtime_seconds": runtime}}}},
+        {"$unwind": "$albums"},
+        {"$match": {"albums.runtime_seconds": runtime}},
+        {"$limit": limit},
+        {"$project": {
+            "_id": 0,
+            "artist": "$artist",
+            "artist_id": "$artist_id",
+            "title": "$albums.title",
+            "year": "$albums.year",
+            "runtime_seconds": "$albums.runtime_seconds",
+            "track_count": "$albums.track_count",
+        }},
+    ]))
@@ -0,0 +1,248 @@
+"""
+Stored shape of artist documents.
+
+Artists are stored as they come from the sources plus a few derived fields
+that exist only so queries can use indexes:
+
+- ``name_normalized``: ``normalize_text(name)``, for exact name lookups
+- ``album_titles_normalized``: normalized album titles, for album lookups
+- ``album_keys``: ``album_key`` of every album, so registering an album can
+  skip one the artist already has in the same atomic update
+- ``geo``: a GeoJSON point built from ``coordinates``, for radius searches
+- ``derived_version``: which version of these rules produced the fields
+
+Albums are normalized too (see ``normalize_album``): every track's duration
+is stored as integer ``duration_seconds`` with the "m:ss" ``duration``
+derived from it, and each album carries its ``runtime_seconds`` and
+``track_count``, so runtimes can be filtered with indexed range queries.
+
+The location is also parsed into normalized top-level ``city``, ``region``
+and ``country`` fields (see ``utils.locations``), which are returned to
+clients like ``genre`` is.
+
+Registered albums are kept in bounded buckets outside the artist document
+(see ``services.album_buckets``); the artist only counts them in
+``bucketed_albums``. Reads request it alongside albums, and ``attach_albums``
+removes it from responses.
+
+Every write path goes through ``prepare_artist_document`` (or
+``services.album_buckets.append_album`` for new albums) so the derived
+fields never drift from the source fields, and reads exclude them with
+``PUBLIC_PROJECTION``.
+"""
+from typing import Any, Dict, Iterable, List, Optional
+
+from utils.durations import format_duration, parse_duration
+from utils.locations import location_parts, location_text
+from utils.text import normalize_text
+
+# Bump when the derivation rules change so existing documents are backfilled.
+DERIVED_VERSION = 4
+
+DERIVED_FIELDS = ("name_normalized", "album_titles_normalized", "album_keys", "geo", "derived_version")
+
+# Derived fields that also cover bucketed albums, so updates add to them
+# rather than replacing them.
+ACCUMULATED_FIELDS = ("album_titles_normalized", "album_keys")
+
+# Fields never returned to clients: the derived ones and the bucket count.
+HIDDEN_FIELDS = DERIVED_FIELDS + ("bucketed_albums",)
+
+# Projection that hides the derived fields from API responses.
+PUBLIC_PROJECTION = {field: 0 for field in DERIVED_FIELDS}
+
+# Album fields returned by expand=albums (everything but the track list).
+ALBUM_FIELDS = ("title", "year", "image", "rating", "description", "runtime_seconds", "track_count")
+
+EXPANSIONS = ("albums", "tracks")
+
+
+def public_document(document: Dict[str, Any]) -> Dict[str, Any]:
+    """A stored artist document as reads return it, without the derived fields."""
+    return {key: value for key, value in document.items() if key not in HIDDEN_FIELDS}
+
+
+def public_projection(fields: Optional[Iterable[str]] = None) -> Dict[str, int]:
+    """
+    Projection returning only the requested public fields.
+
+    Args:
+        fields: Field names (dotted paths allowed), or None for every public field
+
+    Returns:
+        A Mongo projection; derived fields and operators are never included
+    """
+    if fields is None:
+        return PUBLIC_PROJECTION
+    projection = {
+        field: 1 for field in (field.strip() for field in fields)
+        if field and not field.startswith("$") and field.split(".")[0] not in HIDDEN_FIELDS
+    }
+    if any(field.split(".")[0] == "albums" for field in projection):
+        projection["bucketed_albums"] = 1
+    # An empty inclusion projection would mean "everything".
+    return projection or {"_id": 1}
+
+
+def _split_list(value: Optional[str]) -> List[str]:
+    return [item.strip() for item in (value or "").split(",") if item.strip()]
+
+
+def response_projection(
+    fields: Optional[str] = None, expand: Optional[str] = None
+) -> Dict[str, int]:
+    """
+    Projection for the ``fields=`` and ``expand=`` query parameters.
+
+    Without either parameter the full public document is returned, as
+    before. Otherwise albums are left out unless expanded: ``expand=albums``
+    adds them without their tracks, ``expand=tracks`` with them. ``fields``
+    restricts the top-level fields (``_id`` is always returned); naming
+    ``albums`` there is the same as expanding it.
+
+    Args:
+        fields: Comma-separated field names
+        expand: Comma-separated expansions, from ``EXPANSIONS``
+
+    Returns:
+        A Mongo projection
+
+    Raises:
+        ValueError: If ``expand`` names an unknown expansion
+    """
+    requested = _split_list(fields)
+    expansions = set(_split_list(expand))
+    unknown = expansions.difference(EXPANSIONS)
+    if unknown:
+        raise ValueError(
+            f"Unknown expansion(s): {', '.join(sorted(unknown))}. "
+            f"Use {', '.join(EXPANSIONS)}."
+        )
+    if not requested and fields is None and expand is None:
+        return PUBLIC_PROJECTION
+    if any(field.split(".")[0] == "albums" for field in requested):
+        expansions.add("albums")
+    if "tracks" in expansions:
+        expansions.add("albums")
+
+    if not requested:
+        projection = dict(PUBLIC_PROJECTION)
+        if "albums" not in expansions:
+            projection["albums"] = 0
+        elif "tracks" not in expansions:
+            projection["albums.tracks"] = 0
+        return projection
+
+    projection = public_projection(
+        field for field in requested if field.split(".")[0] != "albums"
+    )
+    if "tracks" in expansions:
+        projection["albums"] = 1
+    elif "albums" in expansions:
+        projection.update({f"albums.{field}": 1 for field in ALBUM_FIELDS})
+    if "albums" in expansions:
+        projection["bucketed_albums"] = 1
+    return projection
+
+
+def geo_point(coordinates: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Build a GeoJSON point from a ``{"latitude", "longitude"}`` mapping.
+
+    Args:
+        coordinates: Stored coordinates, possibly missing or incomplete
+
+    Returns:
+        A GeoJSON Point (longitude first), or None if coordinates are unusable
+    """
+    if not isinstance(coordinates, dict):
+        return None
+    latitude, longitude = coordinates.get("latitude"), coordinates.get("longitude")
+    if not isinstance(latitude, (int, float)) or not isinstance(longitude, (int, float)):
+        return None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return {"type": "Point", "coordinates": [float(longitude), float(latitude)]}
+
+
+def album_key(album: Dict[str, Any]) -> str:
+    """The key albums are deduplicated by: normalized title and year."""
+    return f"{normalize_text(album.get('title'))}|{str(album.get('year') or '').strip()}"
+
+
+def normalize_track(track: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Return a copy of a track with ``duration_seconds`` and the display
+    ``duration`` derived from whichever form the source gave.
+    """
+    seconds = parse_duration(track.get("duration_seconds", track.get("duration")))
+    normalized = dict(track)
+    normalized["duration_seconds"] = seconds
+    normalized["duration"] = format_duration(seconds)
+    return normalized
+
+
+def normalize_album(album: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Return a copy of an album with normalized tracks, its total
+    ``runtime_seconds`` (None when no track has a duration) and ``track_count``.
+    """
+    tracks = [normalize_track(track) for track in album.get("tracks") or []]
+    durations = [track["duration_seconds"] for track in tracks if track["duration_seconds"] is not None]
+    normalized = dict(album)
+    normalized["tracks"] = tracks
+    normalized["track_count"] = len(tracks)
+    normalized["runtime_seconds"] = sum(durations) if durations else None
+    return normalized
+
+
+def derived_fields(document: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Compute the derived fields for an artist document.
+
+    Args:
+        document: Artist document with its source fields
+
+    Returns:
+        Derived field values, including the parsed ``city``/``region``/
+        ``country`` and the normalized ``albums`` when the document has
+        any; ``geo`` is omitted when there are no usable coordinates so the
+        2dsphere index skips the document
+    """
+    fields = {
+        "derived_version": DERIVED_VERSION,
+        "name_normalized": normalize_text(document.get("name")),
+        "album_titles_normalized": sorted({
+            normalize_text(album.get("title"))
+            for album in document.get("albums") or []
+            if album.get("title")
+        }),
+        "album_keys": sorted({album_key(album) for album in document.get("albums") or []}),
+    }
+    if document.get("albums"):
+        fields["albums"] = [normalize_album(album) for album in document["albums"]]
+    fields.update(location_parts(document))
+    point = geo_point(document.get("coordinates"))
+    if point:
+        fields["geo"] = point
+    return fields
+
+
+def prepare_artist_document(document: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Return a copy of an artist document with its derived fields set.
+
+    Args:
+        document: Artist document as read from a source or a request
+
+    Returns:
+        The document to store
+    """
+    prepared = {key: value for key, value in document.items() if key not in DERIVED_FIELDS}
+    if not prepared.get("location"):
+        # Keep a display string for sources that only have separate fields.
+        location = location_text(prepared)
+        if location:
+            prepared["location"] = location
+    prepared.update(derived_fields(prepared))
+    return prepared
@@ -0,0 +1,289 @@
+"""
+Search-as-you-type suggestions for artist names, locations and genres.
+
+Each suggestion type is a ``PrefixIndex``: the normalized keys in one sorted
+list with their display strings and popularity scores in parallel arrays,
+so the entries starting with a prefix are a contiguous range found with two
+bisections. Ranges too large to rank per keystroke (more than
+``SCAN_LIMIT`` entries, e.g. every name starting with "t") get their top
+``Config.AUTOCOMPLETE_TOP_K`` precomputed when the index is built, so any
+lookup touches at most ``SCAN_LIMIT`` entries.
+
+Popularity is the number of albums for artists and the number of artists for
+locations and genres. The indexes are built per worker from the database at
+startup, off the request path (lookups return no suggestions until then),
+and updated in place by registrations through that worker.
+
+Run ``python -m services.autocomplete --count 1000000`` to measure build
+time, memory and lookup latency on a synthetic catalog.
+"""
+import heapq
+import logging
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import Config
+from utils.text import normalize_text, prefix_end
+
+logger = logging.getLogger(__name__)
+
+SUGGESTION_TYPES = ("artist", "location", "genre")
+
+# Prefix ranges larger than this have their top suggestions precomputed.
+SCAN_LIMIT = 128
+
+Suggestion = Tuple[float, str, str]  # (score, display, key)
+
+
+class PrefixIndex:
+    """Sorted-array prefix index with precomputed top-k for large ranges."""
+
+    def __init__(self, top_k: int = 10):
+        self.top_k = top_k
+        self._keys: List[str] = []
+        self._displays: List[str] = []
+        self._scores = array("d")
+        self._top: Dict[str, List[Suggestion]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def build(self, entries: Iterable[Tuple[str, float]]) -> None:
+        """
+        Replace the contents with ``(display, score)`` entries.
+
+        Entries that normalize to the same key are merged: the scores add up
+        and the display of the most popular one is kept.
+        """
+        merged: Dict[str, List] = {}
+        for display, score in entries:
+            key = normalize_text(display)
+            if not key:
+                continue
+            current = merged.get(key)
+            if current is None:
+                merged[key] = [score, display, score]
+            else:
+                current[0] += score
+                if score > current[2]:
+                    current[1], current[2] = display, score
+        keys = sorted(merged)
+        displays = [merged[key][1] for key in keys]
+        scores = array("d", (merged[key][0] for key in keys))
+        top = {}
+        self._precompute(keys, displays, scores, "", 0, len(keys), top)
+        with self._lock:
+            self._keys, self._displays, self._scores, self._top = keys, displays, scores, top
+
+    def _ranked(self, keys, displays, scores, lo: int, hi: int) -> List[Suggestion]:
+        best = heapq.nlargest(self.top_k, range(lo, hi), key=scores.__getitem__)
+        return [(scores[i], displays[i], keys[i]) for i in best]
+
+    def _precompute(self, keys, displays, scores, prefix: str, lo: int, hi: int, top) -> None:
+        """Store the top suggestions of every prefix whose range exceeds SCAN_LIMIT."""
+        pending = [(prefix, lo, hi)]
+        while pending:
+            prefix, lo, hi = pending.pop()
+            if hi - lo <= SCAN_LIMIT:
+                continue
+            top[prefix] = self._ranked(keys, displays, scores, lo, hi)
+            depth = len(prefix)
+            index = lo
+            if keys[index] == prefix:
+                index += 1
+            while index < hi:
+                child = keys[index][:depth + 1]
+                end = bisect_left(keys, prefix_end(child), index, hi)
+                pending.append((child, index, end))
+                index = end
+
+    def add(self, display: str, score: float = 1.0) -> None:
+        """
+        Add popularity to an entry, inserting it if it is new.
+
+        Args:
+            display: The suggestion as shown
+            score: Popularity to add
+        """
+        key = normalize_text(display)
+        if not key:
+            return
+        with self._lock:
+            index = bisect_left(self._keys, key)
+            if index < len(self._keys) and self._keys[index] == key:
+                self._scores[index] += score
+            else:
+                self._keys.insert(index, key)
+                self._displays.insert(index, display)
+                self._scores.insert(index, score)
+            entry = (self._scores[index], self._displays[index], key)
+            for depth in range(len(key) + 1):
+                ranked = self._top.get(key[:depth])
+                if ranked is not None:
+                    self._offer(ranked, entry)
+
+    def _offer(self, ranked: List[Suggestion], entry: Suggestion) -> None:
+        ranked[:] = [item for item in ranked if item[2] != entry[2]]
+        if len(ranked) < self.top_k or entry[0] > ranked[-1][0]:
+            ranked.append(entry)
+            ranked.sort(key=lambda item: (-item[0], item[2]))
+            del ranked[self.top_k:]
+
+    def suggest(self, prefix: str, limit: Optional[int] = None) -> List[Dict]:
+        """
+        The most popular entries starting with ``prefix``.
+
+        Args:
+            prefix: What the user has typed so far
+            limit: Number of suggestions, at most ``top_k``
+
+        Returns:
+            ``{"value", "score"}`` dicts, most popular first
+        """
+        key = normalize_text(prefix)
+        limit = min(limit or self.top_k, self.top_k)
+        if not key:
+            return []
+        with self._lock:
+            ranked = self._top.get(key)
+            if ranked is None:
+                lo = bisect_left(self._keys, key)
+                hi = bisect_left(self._keys, prefix_end(key), lo)
+                ranked = self._ranked(self._keys, self._displays, self._scores, lo, hi)
+                if hi - lo > SCAN_LIMIT:
+                    # Grew past the limit through registrations.
+                    self._top[key] = ranked
+            ranked = sorted(ranked, key=lambda item: (-item[0], item[2]))[:limit]
+        return [{"value": display, "score": score} for score, display, _ in ranked]
+
+
+class Autocomplete:
+    """The per-worker suggestion indexes, loaded from the database once."""
+
+    def __init__(self, top_k: int):
+        self.indexes = {kind: PrefixIndex(top_k) for kind in SUGGESTION_TYPES}
+        self.loaded = False
+        self._load_lock = threading.Lock()
+
+    def load(self, db) -> None:
+        """Build every index from the artists collection."""
+        started = time.perf_counter()
+        artists = db.artists.aggregate([{"$project": {
+            "_id": 0, "name": 1,
+            # Embedded albums plus the ones in album buckets.
+            "albums": {"$add": [
+                {"$size": {"$ifNull": ["$albums", []]}},
+                {"$ifNull": ["$bucketed_albums", 0]},
+            ]},
+        }}])
+        self.indexes["artist"].build(
+            (artist["name"], artist["albums"]) for artist in artists if artist.get("name")
+        )
+        for kind, field in (("location", "$location"), ("genre", "$genre")):
+            groups = db.artists.aggregate([
+                {"$match": {field[1:]: {"$nin": [None, ""]}}},
+                {"$group": {"_id": field, "count": {"$sum": 1}}},
+            ])
+            self.indexes[kind].build((group["_id"], group["count"]) for group in groups)
+        self.loaded = True
+        logger.info(
+            f"Built autocomplete indexes ({len(self.indexes['artist'])} artists) "
+            f"in {time.perf_counter() - started:.2f}s"
+        )
+
+    def ensure_loaded(self, db) -> None:
+        """Load the indexes unless another thread already has."""
+        if self.loaded:
+            return
+        with self._load_lock:
+            if not self.loaded:
+                self.load(db)
+
+    def suggest(self, prefix: str, kind: str = "artist", limit: Optional[int] = None):
+        """
+        Suggestions of the given kind starting with prefix. The indexes are
+        built at startup on a background thread (``lifecycle``); until they
+        are loaded there are no suggestions, so no request waits for the build.
+        """
+        if not self.loaded:
+            return []
+        return self.indexes[kind].suggest(prefix, limit)
+
+    def record_artist_added(self, document: Dict) -> None:
+        """Add a newly registered artist's name, location and genre."""
+        if not self.loaded:
+            return
+        if document.get("name"):
+            self.indexes["artist"].add(document["name"], len(document.get("albums") or []))
+        if document.get("location"):
+            self.indexes["location"].add(document["location"])
+        if document.get("genre"):
+            self.indexes["genre"].add(document["genre"])
+
+    def record_album_added(self, name: str) -> None:
+        """Count a new album toward an artist's popularity."""
+        if self.loaded:
+            self.indexes["artist"].add(name)
+
+
+autocomplete = Autocomplete(Config.AUTOCOMPLETE_TOP_K)
+
+
+def _benchmark(count: int, seed: int, queries: int) -> None:
+    import random
+    import tracemalloc
+
+    from resources.generate_catalog import NameDeduper, load_model
+
+    rng = random.Random(seed)
+    sampler = load_model().sampler()
+    deduper = NameDeduper()
+    # Traced from here so the name strings the index keeps are counted.
+    tracemalloc.start()
+    names = []
+    while len(names) < count:
+        name = deduper.unique(sampler.name(rng))
+        if name:
+            names.append((name, rng.randint(0, 12)))
+    del deduper
+    baseline = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    index = PrefixIndex(Config.AUTOCOMPLETE_TOP_K)
+    index.build(names)
+    del names
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"memory: {current / 2**20:.1f} MiB held by the index, "
+          f"{(peak - baseline) / 2**20:.1f} MiB peak on top of the input while building")
+
+    entries = [(display, score) for display, score in zip(index._displays, index._scores)]
+    started = time.perf_counter()
+    index.build(entries)
+    print(f"built {len(index):,} names in {time.perf_counter() - started:.2f}s "
+          f"(untraced); {len(index._top):,} precomputed prefixes")
+
+    prefixes = [index._keys[rng.randrange(len(index))][:rng.randint(1, 6)] for _ in range(queries)]
+    timings = []
+    for prefix in prefixes:
+        began = time.perf_counter()
+        index.suggest(prefix)
+        timings.append(time.perf_counter() - began)
+    timings.sort()
+    for label, fraction in (("p50", 0.5), ("p99", 0.99), ("max", 1.0)):
+        value = timings[min(len(timings) - 1, int(fraction * len(timings)))]
+        print(f"lookup {label}: {value * 1e6:.1f} us")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Measure the autocomplete prefix index.")
+    parser.add_argument("--count", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--queries", type=int, default=20_000)
+    args = parser.parse_args()
+    _benchmark(args.count, args.seed, args.queries)
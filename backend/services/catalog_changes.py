@@ -0,0 +1,284 @@
+"""
+Catalog version and changelog, so each worker can invalidate what other
+workers' writes made stale.
+
+Registrations update the caches and in-memory indexes of the worker that
+handled them. Every write also calls ``publish_change``, which bumps a
+single ``catalog_changes`` document in one atomic update::
+
+    {"_id": "catalog", "version": 42,
+     "changes": [{"kind": "artist_added", "artist_id": ..., "name": ...,
+                  "genre": ..., "origin": "host:pid", "at": 1700000000.0}, ...]}
+
+``changes`` keeps the last ``CHANGELOG_LENGTH`` entries, the newest last, so
+the entry at position ``i`` has version ``version - len(changes) + 1 + i``.
+
+Each worker runs a ``ChangeListener`` that reads ``version`` (one tiny
+``_id`` read) every ``Config.CATALOG_POLL_SECONDS``. When it has moved, the
+listener fetches only the new entries with a ``$slice`` projection and, for
+each entry written by another worker:
+
+- evicts the response cache entries for the artist's genre (and ``/facets``)
+- invalidates the facet cache, for new artists
+- updates the catalog snapshot, autocomplete and fuzzy name indexes from the
+  stored artist document, when they are loaded
+
+A worker that fell more than ``CHANGELOG_LENGTH`` changes behind clears its
+caches and reloads its indexes instead. Bulk loads too large to list entry by
+entry call ``publish_reload``, which moves every worker past that point. When MongoDB runs as a replica set
+(a single node is enough), the listener also watches the document through a
+change stream and syncs as soon as it changes rather than at the next poll.
+
+The time from ``publish_change`` to the eviction in each worker is exported
+as ``cfyby_invalidation_lag_seconds``.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs
+
+from pymongo import ReturnDocument
+
+from config import Config
+from services.album_buckets import attach_albums
+from services.autocomplete import autocomplete
+from services.facets import facet_cache
+from services.fuzzy import fuzzy_names
+from services.snapshot import catalog_snapshot
+from utils.metrics import CATALOG_CHANGES_APPLIED, CATALOG_VERSION, INVALIDATION_LAG
+from utils.response_cache import Key, response_cache
+from utils.text import normalize_text
+
+logger = logging.getLogger(__name__)
+
+CHANGE_COLLECTION = "catalog_changes"
+CATALOG_ID = "catalog"
+
+# Changes kept in the changelog; a worker further behind reloads everything.
+CHANGELOG_LENGTH = 1000
+
+CHANGE_KINDS = ("artist_added", "album_added")
+
+
+def origin() -> str:
+    """This worker's identity in the changelog (computed per call: pids change on fork)."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def publish_change(db, kind: str, artist: Dict[str, Any]) -> int:
+    """
+    Record a catalog write and bump the catalog version.
+
+    Args:
+        db: pymongo Database
+        kind: One of ``CHANGE_KINDS``
+        artist: The stored artist, with ``_id``, ``name`` and ``genre``
+
+    Returns:
+        The new catalog version
+    """
+    change = {
+        "kind": kind,
+        "artist_id": artist["_id"],
+        "name": artist.get("name"),
+        "genre": artist.get("genre"),
+        "origin": origin(),
+        "at": time.time(),
+    }
+    document = db[CHANGE_COLLECTION].find_one_and_update(
+        {"_id": CATALOG_ID},
+        {"$inc": {"version": 1},
+         "$push": {"changes": {"$each": [change], "$slice": -CHANGELOG_LENGTH}}},
+        projection={"version": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return document["version"]
+
+
+def publish_reload(db) -> int:
+    """
+    Record a bulk write (an ingest, a reseed) too large to list change by change.
+
+    Bumps the version past the whole changelog and empties it, so every
+    worker clears its caches and reloads its indexes, and catalog files
+    exported before it are no longer replayed onto the database.
+
+    Returns:
+        The new catalog version
+    """
+    document = db[CHANGE_COLLECTION].find_one_and_update(
+        {"_id": CATALOG_ID},
+        {"$inc": {"version": CHANGELOG_LENGTH + 1}, "$set": {"changes": []}},
+        projection={"version": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return document["version"]
+
+
+def current_version(db) -> int:
+    """The catalog version, 0 before the first change."""
+    document = db[CHANGE_COLLECTION].find_one({"_id": CATALOG_ID}, {"version": 1})
+    return document["version"] if document else 0
+
+
+def changes_since(db, version: int) -> Optional[List[Dict[str, Any]]]:
+    """
+    The changes after ``version``, oldest first.
+
+    Returns:
+        The changes, or None when some have already left the changelog or
+        ``version`` is ahead of it (it came from another database)
+    """
+    document = db[CHANGE_COLLECTION].find_one({"_id": CATALOG_ID}, {"version": 1, "changes": 1})
+    current = document["version"] if document else 0
+    changes = document["changes"] if document else []
+    missed = current - version
+    if missed < 0 or missed > len(changes):
+        return None
+    return changes[len(changes) - missed:]
+
+
+def _affected(genre: Optional[str]):
+    """Whether a cached response can include an artist of ``genre``."""
+    genre = normalize_text(genre)
+
+    def predicate(key: Key) -> bool:
+        path, query_string = key
+        if path == "/facets":
+            return True
+        requested = parse_qs(query_string.decode("latin-1")).get("genre")
+        return not requested or normalize_text(requested[0]) == genre
+
+    return predicate
+
+
+class ChangeListener:
+    """Follows the changelog on a background thread and applies other workers' changes."""
+
+    def __init__(self, poll_seconds: float):
+        self.poll_seconds = poll_seconds
+        self.version: Optional[int] = None
+        self._sync_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self, db) -> None:
+        """Start from the current version, then follow the changelog."""
+        if self.poll_seconds <= 0 or self._threads:
+            return
+        self.version = current_version(db)
+        CATALOG_VERSION.set(self.version)
+        self._stopped.clear()
+        self._threads = [threading.Thread(target=self._poll, args=(db,), name="catalog-changes",
+                                          daemon=True)]
+        if Config.CATALOG_CHANGE_STREAM:
+            self._threads.append(threading.Thread(target=self._watch, args=(db,),
+                                                  name="catalog-change-stream", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._wake.set()
+        self._threads = []
+
+    def _poll(self, db) -> None:
+        while not self._stopped.is_set():
+            try:
+                self.sync(db)
+            except Exception as e:
+                logger.error(f"Following the catalog changelog failed: {e}")
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def _watch(self, db) -> None:
+        """Wake the poller on every changelog update; gives up without a replica set."""
+        try:
+            with db[CHANGE_COLLECTION].watch([{"$match": {"documentKey._id": CATALOG_ID}}]) as stream:
+                logger.info("Following the catalog changelog through a change stream")
+                for _ in stream:
+                    if self._stopped.is_set():
+                        return
+                    self._wake.set()
+        except Exception as e:
+            logger.info(f"No change stream for the catalog changelog, polling only: {e}")
+
+    def sync(self, db) -> int:
+        """
+        Apply the changes since the last sync.
+
+        Args:
+            db: pymongo Database
+
+        Returns:
+            Number of changes applied (other workers' changes only)
+        """
+        with self._sync_lock:
+            version = current_version(db)
+            if self.version is None:
+                self.version = version
+            if version <= self.version:
+                return 0
+            while True:
+                missed = version - self.version
+                if missed > CHANGELOG_LENGTH:
+                    self._reload(db)
+                    self.version = version
+                    CATALOG_VERSION.set(version)
+                    return 0
+                document = db[CHANGE_COLLECTION].find_one(
+                    {"_id": CATALOG_ID}, {"version": 1, "changes": {"$slice": -missed}}
+                )
+                # Read again if the version moved on between the two reads.
+                if document["version"] == version:
+                    break
+                version = document["version"]
+            changes = document["changes"]
+            applied = 0
+            me = origin()
+            for change in changes:
+                if change.get("origin") != me:
+                    self._apply(db, change)
+                    applied += 1
+            self.version = document["version"]
+            CATALOG_VERSION.set(self.version)
+            return applied
+
+    def _apply(self, db, change: Dict[str, Any]) -> None:
+        kind = change.get("kind")
+        response_cache.evict(_affected(change.get("genre")))
+        if kind == "artist_added":
+            facet_cache.invalidate()
+        INVALIDATION_LAG.observe(max(time.time() - change.get("at", time.time()), 0.0))
+        CATALOG_CHANGES_APPLIED.inc(kind or "unknown")
+
+        if not (catalog_snapshot.loaded or autocomplete.loaded or fuzzy_names.loaded):
+            return
+        artist = db.artists.find_one({"_id": change["artist_id"]})
+        if artist is None:
+            return
+        attach_albums(db, [artist])
+        catalog_snapshot.record_artist_added(artist)
+        if kind == "artist_added":
+            autocomplete.record_artist_added(artist)
+            fuzzy_names.record_artist_added(artist)
+        elif kind == "album_added":
+            autocomplete.record_album_added(artist.get("name"))
+
+    def _reload(self, db) -> None:
+        """Start over after missing changes that left the changelog."""
+        logger.warning("Fell behind the catalog changelog; clearing caches and reloading indexes")
+        response_cache.clear()
+        facet_cache.invalidate()
+        for index in (catalog_snapshot, autocomplete, fuzzy_names):
+            if index.loaded:
+                index.load(db)
+
+
+change_listener = ChangeListener(Config.CATALOG_POLL_SECONDS)
@@ -0,0 +1,403 @@
+"""
+Memory-mappable binary catalog file.
+
+An export of the artist catalog that workers and ``seed_db.py`` open with
+``mmap`` instead of parsing JSON or querying MongoDB. The file is read-only,
+so every process that maps it shares one page-cached copy.
+
+Layout (little-endian, every section 8-byte aligned)::
+
+    header     magic "CFYBCAT1", format version, artist count, catalog
+               version at export, then (offset, length) for each section
+    ids        count x 12 bytes      ObjectId of each artist
+    genres     count x uint16        code into genre_names (0xFFFF: none)
+    latitude   count x float64       NaN without usable coordinates
+    longitude  count x float64
+    name_offsets   (count + 1) x uint64   into names
+    names          UTF-8 names, back to back
+    genre_offsets  (genre count + 1) x uint64   into genre_names
+    genre_names    UTF-8 genre names
+    blob_offsets   (count + 1) x uint64   into blobs
+    blobs          each artist's stored document as BSON
+
+The columns answer "which artists, where, what genre" without touching the
+blobs. Each blob is the document as stored, derived fields included, with
+bucketed albums folded into ``albums`` (see ``services.album_buckets``), so
+``seed_db.py`` inserts the blobs as ``RawBSONDocument`` without decoding
+them, and the catalog snapshot decodes them with ``bson`` rather than a
+JSON parser.
+
+Export with (from the ``backend`` directory)::
+
+    python -m services.catalog_file export --output catalog.bin
+    python -m services.catalog_file export --json resources/audioDB_200_in_order.json --output catalog.bin
+    python -m services.catalog_file benchmark --count 100000
+"""
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import time
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import bson
+from bson import ObjectId
+from bson.raw_bson import RawBSONDocument
+
+from services.artist_documents import prepare_artist_document
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"CFYBCAT1"
+FORMAT_VERSION = 1
+
+SECTIONS = ("ids", "genres", "latitude", "longitude", "name_offsets", "names",
+            "genre_offsets", "genre_names", "blob_offsets", "blobs")
+
+# magic, format version, reserved, artist count, catalog version
+_HEADER = struct.Struct("<8sIIQq")
+_VERSION = struct.Struct("<q")
+_VERSION_OFFSET = _HEADER.size - _VERSION.size
+_SECTION = struct.Struct("<QQ")
+HEADER_SIZE = _HEADER.size + _SECTION.size * len(SECTIONS)
+
+NO_GENRE = 0xFFFF
+
+
+class CatalogFileError(Exception):
+    """Raised when a file is not a catalog file this version can read."""
+    pass
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def _offsets(lengths: Iterable[int]) -> array:
+    offsets = array("Q", [0])
+    total = 0
+    for length in lengths:
+        total += length
+        offsets.append(total)
+    return offsets
+
+
+def write_catalog_file(documents: Iterable[Dict[str, Any]], filename: str,
+                       catalog_version: int = 0) -> int:
+    """
+    Write stored artist documents to a catalog file.
+
+    The file is written to a temporary name and renamed into place, so
+    processes that have the old file mapped keep reading it.
+
+    Args:
+        documents: Artist documents as stored, each with an ``_id``
+        filename: Path of the catalog file
+        catalog_version: The changelog version the documents reflect (see
+            ``services.catalog_changes``)
+
+    Returns:
+        Number of artists written
+    """
+    ids = bytearray()
+    genres = array("H")
+    latitude, longitude = array("d"), array("d")
+    names: List[bytes] = []
+    blobs: List[bytes] = []
+    genre_codes: Dict[str, int] = {}
+    for document in documents:
+        ids += ObjectId(document["_id"]).binary
+        genre = document.get("genre")
+        if isinstance(genre, str):
+            if genre not in genre_codes:
+                if len(genre_codes) >= NO_GENRE:
+                    raise CatalogFileError("Too many distinct genres for 16-bit codes")
+                genre_codes[genre] = len(genre_codes)
+            genres.append(genre_codes[genre])
+        else:
+            genres.append(NO_GENRE)
+        point = (document.get("geo") or {}).get("coordinates")
+        longitude.append(point[0] if point else math.nan)
+        latitude.append(point[1] if point else math.nan)
+        names.append((document.get("name") or "").encode("utf-8"))
+        blobs.append(bson.encode(document))
+
+    genre_names = [genre.encode("utf-8") for genre in genre_codes]
+    sections = {
+        "ids": bytes(ids),
+        "genres": genres.tobytes(),
+        "latitude": latitude.tobytes(),
+        "longitude": longitude.tobytes(),
+        "name_offsets": _offsets(map(len, names)).tobytes(),
+        "names": b"".join(names),
+        "genre_offsets": _offsets(map(len, genre_names)).tobytes(),
+        "genre_names": b"".join(genre_names),
+        "blob_offsets": _offsets(map(len, blobs)).tobytes(),
+        "blobs": b"".join(blobs),
+    }
+    table = []
+    offset = HEADER_SIZE
+    for name in SECTIONS:
+        offset = _align(offset)
+        table.append((offset, len(sections[name])))
+        offset += len(sections[name])
+
+    partial = f"{filename}.{os.getpid()}.tmp"
+    with open(partial, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(blobs), catalog_version))
+        for entry in table:
+            f.write(_SECTION.pack(*entry))
+        for name, (start, _) in zip(SECTIONS, table):
+            f.write(b"\0" * (start - f.tell()))
+            f.write(sections[name])
+    os.replace(partial, filename)
+    return len(blobs)
+
+
+def stamp_catalog_version(filename: str, catalog_version: int) -> None:
+    """
+    Record a new catalog version in a catalog file's header, in place.
+
+    For a database that was just seeded from the file, so it reflects the
+    version the seed published. The only write to an existing file; mappings
+    already open read the version once and are not affected.
+    """
+    with open(filename, "r+b") as f:
+        magic, version, _, _, _ = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise CatalogFileError(f"{filename} is not a version {FORMAT_VERSION} catalog file")
+        f.seek(_VERSION_OFFSET)
+        f.write(_VERSION.pack(catalog_version))
+
+
+class CatalogFile:
+    """
+    A catalog file mapped read-only.
+
+    Columns are ``memoryview`` casts over the mapping, so reading them copies
+    nothing; strings and documents are decoded per access.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        with open(filename, "rb") as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise CatalogFileError(f"{filename} is empty")
+        if len(self._map) < HEADER_SIZE:
+            raise CatalogFileError(f"{filename} is too short to be a catalog file")
+        magic, version, _, count, catalog_version = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise CatalogFileError(f"{filename} is not a version {FORMAT_VERSION} catalog file")
+        self.count = count
+        self.catalog_version = catalog_version
+        view = memoryview(self._map)
+        # Every view over the mapping, released by close().
+        self._views = [view]
+        self._sections = {}
+        for index, name in enumerate(SECTIONS):
+            start, length = _SECTION.unpack_from(self._map, _HEADER.size + index * _SECTION.size)
+            if start + length > len(self._map):
+                raise CatalogFileError(f"{filename} is truncated")
+            self._sections[name] = self._view(view[start:start + length])
+        self._genres = self._view(self._sections["genres"].cast("H"))
+        self.latitude = self._view(self._sections["latitude"].cast("d"))
+        self.longitude = self._view(self._sections["longitude"].cast("d"))
+        self._name_offsets = self._view(self._sections["name_offsets"].cast("Q"))
+        self._blob_offsets = self._view(self._sections["blob_offsets"].cast("Q"))
+        genre_offsets = self._view(self._sections["genre_offsets"].cast("Q"))
+        genre_names = self._sections["genre_names"]
+        self.genre_names = [
+            genre_names[genre_offsets[code]:genre_offsets[code + 1]].tobytes().decode("utf-8")
+            for code in range(len(genre_offsets) - 1)
+        ]
+
+    def _view(self, view: memoryview) -> memoryview:
+        self._views.append(view)
+        return view
+
+    def __len__(self) -> int:
+        return self.count
+
+    def id(self, index: int) -> ObjectId:
+        return ObjectId(bytes(self._sections["ids"][index * 12:index * 12 + 12]))
+
+    def genre(self, index: int) -> Optional[str]:
+        code = self._genres[index]
+        return None if code == NO_GENRE else self.genre_names[code]
+
+    def coordinates(self, index: int) -> Optional[Tuple[float, float]]:
+        """``(latitude, longitude)``, or None without usable coordinates."""
+        latitude = self.latitude[index]
+        return None if math.isnan(latitude) else (latitude, self.longitude[index])
+
+    def name(self, index: int) -> str:
+        names = self._sections["names"]
+        return names[self._name_offsets[index]:self._name_offsets[index + 1]].tobytes().decode("utf-8")
+
+    def blob(self, index: int) -> bytes:
+        """The stored document of an artist as BSON."""
+        return self._sections["blobs"][self._blob_offsets[index]:self._blob_offsets[index + 1]].tobytes()
+
+    def document(self, index: int) -> Dict[str, Any]:
+        """The stored document of an artist."""
+        return bson.decode(self.blob(index))
+
+    def documents(self, batch_size: int = 10_000) -> Iterator[Dict[str, Any]]:
+        """Every stored document, in file order, decoded a batch at a time."""
+        blobs = self._sections["blobs"]
+        for start in range(0, self.count, batch_size):
+            stop = min(start + batch_size, self.count)
+            yield from bson.decode_all(
+                blobs[self._blob_offsets[start]:self._blob_offsets[stop]].tobytes()
+            )
+
+    def raw_documents(self, start: int = 0, stop: Optional[int] = None) -> List[RawBSONDocument]:
+        """Stored documents as ``RawBSONDocument``, which pymongo inserts without re-encoding."""
+        stop = self.count if stop is None else min(stop, self.count)
+        return [RawBSONDocument(self.blob(index)) for index in range(start, stop)]
+
+    def close(self) -> None:
+        # Views must be released, newest first, before the mapping can close.
+        for view in reversed(self._views):
+            view.release()
+        self._map.close()
+
+
+def json_catalog_documents(filename: str) -> Iterator[Dict[str, Any]]:
+    """
+    Artist documents to store, from a genre-keyed JSON catalog (the
+    scraper's output, ``expanded_schema.json``) or NDJSON with a ``genre``
+    per artist.
+
+    Names are unique (see ``indexes.py``), so an artist listed again keeps
+    its first genre. Documents get their derived fields but no ``_id``.
+    """
+    with open(filename, "r", encoding="utf-8") as f:
+        first = f.read(1)
+        while first.isspace():
+            first = f.read(1)
+        f.seek(0)
+        if first == "{" and not filename.endswith(".ndjson"):
+            data = json.load(f)
+            artists = ((genre, artist) for genre, listed in data.items() for artist in listed)
+        else:
+            artists = ((None, json.loads(line)) for line in f if line.strip())
+        seen = set()
+        for genre, artist in artists:
+            document = dict(artist)
+            if genre is not None:
+                document["genre"] = genre
+            document = prepare_artist_document(document)
+            if document["name_normalized"] in seen:
+                continue
+            seen.add(document["name_normalized"])
+            yield document
+
+
+def database_documents(db) -> Iterator[Dict[str, Any]]:
+    """Every stored artist, bucketed albums folded into ``albums``."""
+    from services.album_buckets import attach_albums
+
+    batch: List[Dict[str, Any]] = []
+    for document in db.artists.find({}).sort("_id", 1).batch_size(1000):
+        batch.append(document)
+        if len(batch) >= 1000:
+            yield from attach_albums(db, batch)
+            batch = []
+    yield from attach_albums(db, batch)
+
+
+def export_catalog(filename: str, source: Optional[str] = None, db=None) -> int:
+    """
+    Export the catalog to a catalog file.
+
+    Args:
+        filename: Path of the catalog file
+        source: A JSON or NDJSON catalog to read instead of the database
+        db: pymongo Database (the app's by default)
+
+    Returns:
+        Number of artists written
+    """
+    if source:
+        documents = (dict(document, _id=ObjectId()) for document in json_catalog_documents(source))
+        return write_catalog_file(documents, filename)
+    if db is None:
+        from database import db
+    from services.catalog_changes import current_version
+
+    # Read before the artists: changes after it are replayed by readers.
+    version = current_version(db)
+    return write_catalog_file(database_documents(db), filename, catalog_version=version)
+
+
+def _benchmark(count: int, seed: int) -> None:
+    import gc
+    import tempfile
+
+    from benchmarks.catalog import generate_artists
+    from services.snapshot import CatalogSnapshot
+
+    artists = list(generate_artists(count, seed))
+    with tempfile.TemporaryDirectory() as directory:
+        json_path = os.path.join(directory, "catalog.json")
+        file_path = os.path.join(directory, "catalog.bin")
+        grouped: Dict[str, List[Dict[str, Any]]] = {}
+        for artist in artists:
+            grouped.setdefault(artist.pop("genre"), []).append(artist)
+        with open(json_path, "w", encoding="utf-8") as f:
+            # Pretty-printed and genre-keyed, like the scraper's output.
+            json.dump(grouped, f, indent=2)
+        del artists, grouped
+        gc.collect()
+        written = export_catalog(file_path, source=json_path)
+        print(f"{written:,} artists: JSON {os.path.getsize(json_path) / 2**20:.0f} MiB, "
+              f"catalog file {os.path.getsize(file_path) / 2**20:.0f} MiB")
+
+        def timed(label, run):
+            began = time.perf_counter()
+            result = run()
+            print(f"{label}: {time.perf_counter() - began:.2f}s")
+            return result
+
+        documents = timed("parse JSON and derive fields (seed today)",
+                          lambda: list(json_catalog_documents(json_path)))
+        del documents
+        catalog = timed("open catalog file", lambda: CatalogFile(file_path))
+        timed("decode every document from it", lambda: sum(1 for _ in catalog.documents()))
+        timed("raw documents for insert_many", lambda: len(catalog.raw_documents()))
+        timed("snapshot load from MongoDB-shaped documents",
+              lambda: CatalogSnapshot().build(catalog.documents()))
+        timed("snapshot load from the catalog file", lambda: CatalogSnapshot().build_from_file(catalog))
+        catalog.close()
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export or measure the binary catalog file.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="Write the catalog file")
+    export.add_argument("--output", required=True, help="Catalog file to write")
+    export.add_argument("--json", help="Read this JSON or NDJSON catalog instead of MongoDB")
+    benchmark = commands.add_parser("benchmark", help="Compare loading JSON and the catalog file")
+    benchmark.add_argument("--count", type=int, default=100_000)
+    benchmark.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == "benchmark":
+        _benchmark(args.count, args.seed)
+        return
+    started = time.perf_counter()
+    written = export_catalog(args.output, source=args.json)
+    logger.info(f"Exported {written} artists to {args.output} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
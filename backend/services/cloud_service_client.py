@@ -14,6 +14,7 @@ import requests
 from requests.exceptions import RequestException, Timeout, ConnectionError
 
 from config import config
+from utils.metrics import CLOUD_ERRORS, CLOUD_LATENCY, CLOUD_RETRIES
 
 logger = logging.getLogger(__name__)
 
@@ -52,8 +53,9 @@ class CloudServiceClient:
         self,
         base_url: Optional[str] = None,
         token: Optional[str] = None,
-        timeout: Optional[int] = None,
-        max_retries: Optional[int] = None
+        timeout: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        session: Optional[requests.Session] = None
     ):
         """
         Initialize the cloud service client.
@@ -63,11 +65,14 @@ class CloudServiceClient:
             token: API token (defaults to config.AWS_TOKEN)
             timeout: Request timeout in seconds (defaults to config.HTTP_TIMEOUT)
             max_retries: Maximum retry attempts (defaults to config.HTTP_MAX_RETRIES)
+            session: Shared requests session for connection reuse (defaults to
+                a new connection per request)
         """
         self.base_url = (base_url or config.AWS_URL).rstrip('/')
         self.token = token or config.AWS_TOKEN
         self.timeout = timeout if timeout is not None else config.HTTP_TIMEOUT
         self.max_retries = max_retries if max_retries is not None else config.HTTP_MAX_RETRIES
+        self.http = session or requests
         
         if not self.base_url or not self.token:
             raise CloudServiceError(
@@ -181,15 +186,22 @@ class CloudServiceClient:
         # Retry logic
         last_exception = None
         for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                CLOUD_RETRIES.inc("GET")
+                time.sleep(1)  # Brief delay before retry
+            started = time.perf_counter()
+            outcome = "error"
             try:
-                response = requests.get(
+                response = self.http.get(
                     url,
                     headers=headers,
                     params=params,
                     timeout=self.timeout,
                     **kwargs
                 )
-                return self._handle_response(response)
+                data = self._handle_response(response)
+                outcome = "ok"
+                return data
                 
             except Timeout as e:
                 last_exception = CloudServiceTimeoutError(
@@ -198,9 +210,6 @@ class CloudServiceClient:
                 logger.warning(
                     f"Request timeout (attempt {attempt + 1}/{self.max_retries + 1}): {str(e)}"
                 )
-                if attempt < self.max_retries:
-                    time.sleep(1)  # Brief delay before retry
-                    continue
                     
             except ConnectionError as e:
                 last_exception = CloudServiceConnectionError(
@@ -209,12 +218,10 @@ class CloudServiceClient:
                 logger.warning(
                     f"Connection error (attempt {attempt + 1}/{self.max_retries + 1}): {str(e)}"
                 )
-                if attempt < self.max_retries:
-                    time.sleep(1)  # Brief delay before retry
-                    continue
                     
             except CloudServiceAuthenticationError:
                 # Don't retry authentication errors
+                CLOUD_ERRORS.inc("GET", "authentication")
                 raise
                 
             except RequestException as e:
@@ -223,13 +230,18 @@ class CloudServiceClient:
                     f"Request error (attempt {attempt + 1}/{self.max_retries + 1}): {str(e)}",
                     exc_info=True
                 )
-                if attempt < self.max_retries:
-                    time.sleep(1)  # Brief delay before retry
-                    continue
+
+            except CloudServiceError:
+                CLOUD_ERRORS.inc("GET", "response")
+                raise
+
+            finally:
+                CLOUD_LATENCY.observe(time.perf_counter() - started, "GET", outcome)
         
         # All retries exhausted
         if last_exception:
             logger.error(f"All retry attempts exhausted: {str(last_exception)}")
+            CLOUD_ERRORS.inc("GET", _error_kind(last_exception))
             raise last_exception
         raise CloudServiceError("Failed to complete request after all retries")
     
@@ -259,26 +271,49 @@ class CloudServiceClient:
         
         logger.info(f"Making POST request to {url}")
         
+        started = time.perf_counter()
+        outcome = "error"
         try:
-            response = requests.post(
+            response = self.http.post(
                 url,
                 headers=headers,
                 json=data,
                 timeout=self.timeout,
                 **kwargs
             )
-            return self._handle_response(response)
+            result = self._handle_response(response)
+            outcome = "ok"
+            return result
         except Timeout as e:
+            CLOUD_ERRORS.inc("POST", "timeout")
             raise CloudServiceTimeoutError(
                 f"Request to {url} timed out after {self.timeout} seconds"
             )
         except ConnectionError as e:
+            CLOUD_ERRORS.inc("POST", "connection")
             raise CloudServiceConnectionError(
                 f"Failed to connect to {url}: {str(e)}"
             )
         except RequestException as e:
             logger.error(f"POST request failed: {str(e)}", exc_info=True)
+            CLOUD_ERRORS.inc("POST", "request")
             raise CloudServiceError(f"POST request failed: {str(e)}")
+        except CloudServiceError as e:
+            CLOUD_ERRORS.inc("POST", _error_kind(e))
+            raise
+        finally:
+            CLOUD_LATENCY.observe(time.perf_counter() - started, "POST", outcome)
+
+
+def _error_kind(error: Exception) -> str:
+    """Metric label for a cloud service exception."""
+    if isinstance(error, CloudServiceAuthenticationError):
+        return "authentication"
+    if isinstance(error, CloudServiceTimeoutError):
+        return "timeout"
+    if isinstance(error, CloudServiceConnectionError):
+        return "connection"
+    return "response"
 
 
 def create_cloud_service_client() -> CloudServiceClient:
@@ -0,0 +1,187 @@
+"""
+Faceted artist counts served from a materialized aggregate.
+
+The ``facet_counts`` collection holds one document per (genre, country,
+city) combination with the number of artists in it. It is rebuilt from
+``artists`` with one aggregation after seeding (or when missing at startup)
+and kept current by ``record_artist_added`` on every registration, so no
+request ever aggregates the artist collection.
+
+Each worker keeps the whole table in memory for ``Config.FACETS_CACHE_SECONDS``
+(it is small: one row per genre and city), and computes filtered facets from
+it, so populating the filter dropdowns is a single cached read.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import Config
+from utils.locations import canonical_country
+from utils.metrics import record_cache_lookup
+from utils.text import normalize_text
+
+logger = logging.getLogger(__name__)
+
+FACET_COLLECTION = "facet_counts"
+
+Row = Tuple[Optional[str], Optional[str], Optional[str], int]
+
+
+def facet_key(document: Dict[str, Any]) -> Dict[str, Optional[str]]:
+    """The ``facet_counts`` key for a stored artist document."""
+    return {
+        "genre": document.get("genre"),
+        "country": document.get("country"),
+        "city": document.get("city"),
+    }
+
+
+def rebuild_facet_counts(db) -> int:
+    """
+    Recompute ``facet_counts`` from the artists collection.
+
+    Args:
+        db: pymongo Database
+
+    Returns:
+        Number of facet rows written
+    """
+    db.artists.aggregate([
+        {"$group": {
+            "_id": {"genre": "$genre", "country": "$country", "city": "$city"},
+            "count": {"$sum": 1},
+        }},
+        {"$out": FACET_COLLECTION},
+    ])
+    facet_cache.invalidate()
+    rows = db[FACET_COLLECTION].count_documents({})
+    logger.info(f"Rebuilt {rows} facet rows")
+    return rows
+
+
+def ensure_facet_counts(db) -> None:
+    """Rebuild ``facet_counts`` if it is missing but there are artists."""
+    if db[FACET_COLLECTION].find_one({}, {"_id": 1}) is None \
+            and db.artists.find_one({}, {"_id": 1}) is not None:
+        rebuild_facet_counts(db)
+
+
+def record_artist_added(db, document: Dict[str, Any]) -> None:
+    """
+    Count a newly stored artist in its facet row.
+
+    Args:
+        db: pymongo Database
+        document: The artist document as stored
+    """
+    db[FACET_COLLECTION].update_one(
+        {"_id": facet_key(document)}, {"$inc": {"count": 1}}, upsert=True
+    )
+    facet_cache.invalidate()
+
+
+def _ranked(counts: Counter) -> List[Tuple[Any, int]]:
+    """Non-empty values with their counts, most common first."""
+    return sorted(
+        ((value, count) for value, count in counts.items() if value and count > 0),
+        key=lambda item: (-item[1], item[0]),
+    )
+
+
+def compute_facets(
+    rows: List[Row],
+    genre: Optional[str] = None,
+    country: Optional[str] = None,
+    city: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Genre, country and city counts, each filtered by the other two facets.
+
+    Args:
+        rows: (genre, country, city, count) facet rows
+        genre: Normalized genre filter
+        country: Canonical country filter
+        city: Normalized city filter
+
+    Returns:
+        ``genres``, ``countries`` and ``cities`` with counts (most common
+        first), and the ``total`` number of artists matching every filter
+    """
+    genres, countries, cities = Counter(), Counter(), Counter()
+    total = 0
+    for row_genre, row_country, row_city, count in rows:
+        genre_ok = genre is None or row_genre == genre
+        country_ok = country is None or row_country == country
+        city_ok = city is None or row_city == city
+        if country_ok and city_ok:
+            genres[row_genre] += count
+        if genre_ok and city_ok:
+            countries[row_country] += count
+        if genre_ok and country_ok:
+            if row_city:
+                cities[(row_city, row_country or "")] += count
+            if city_ok:
+                total += count
+    return {
+        "genres": [{"genre": value, "count": count} for value, count in _ranked(genres)],
+        "countries": [{"country": value, "count": count} for value, count in _ranked(countries)],
+        "cities": [
+            {"city": value[0], "country": value[1], "count": count}
+            for value, count in _ranked(cities)
+        ],
+        "total": total,
+    }
+
+
+class FacetCache:
+    """Per-worker copy of ``facet_counts`` with memoized filtered results."""
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._rows: Optional[List[Row]] = None
+        self._results: Dict[Tuple, Dict[str, Any]] = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._rows = None
+            self._results = {}
+
+    def _load(self, db) -> List[Row]:
+        rows = [
+            (doc["_id"].get("genre"), doc["_id"].get("country"), doc["_id"].get("city"), doc["count"])
+            for doc in db[FACET_COLLECTION].find({}, {"count": 1})
+        ]
+        with self._lock:
+            self._rows = rows
+            self._results = {}
+            self._loaded_at = time.monotonic()
+        return rows
+
+    def facets(self, db, genre=None, country=None, city=None) -> Dict[str, Any]:
+        """Filtered facets, reading ``facet_counts`` at most once per TTL."""
+        key = (
+            normalize_text(genre) or None,
+            (canonical_country(country) or normalize_text(country)) if country else None,
+            normalize_text(city) or None,
+        )
+        with self._lock:
+            fresh = self._rows is not None and time.monotonic() - self._loaded_at < self.ttl_seconds
+            rows = self._rows if fresh else None
+            cached = self._results.get(key) if fresh else None
+        record_cache_lookup("facets", cached is not None)
+        if cached is not None:
+            return cached
+        if rows is None:
+            rows = self._load(db)
+        result = compute_facets(rows, *key)
+        with self._lock:
+            if self._rows is rows:
+                self._results[key] = result
+        return result
+
+
+facet_cache = FacetCache(Config.FACETS_CACHE_SECONDS)
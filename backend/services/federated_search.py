@@ -0,0 +1,147 @@
+"""
+Federated artist search across the local catalog and the cloud service.
+
+Both sources are queried concurrently under a shared deadline, so a merged
+answer is ready in roughly the latency of the slower source instead of the
+sum of both. A source that misses the deadline or fails is reported in the
+response and the remaining results are returned flagged as partial. Failures
+are reported to clients only as ``SOURCE_ERROR``; the exception, which can
+name upstream hosts and URLs, goes to the log.
+
+Queries are expected to give up at the deadline themselves (a server-side
+time limit, an HTTP timeout): the pool cannot stop a running thread, and a
+query left running past the deadline keeps one of its threads busy. Queries
+still queued when the deadline passes are cancelled and never run.
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+from utils.text import normalize_text
+
+logger = logging.getLogger(__name__)
+
+LOCAL_SOURCE = "local"
+CLOUD_SOURCE = "cloud"
+
+# The only failure detail clients see.
+SOURCE_ERROR = "source_unavailable"
+
+# Dedicated pool so that a source still running past the deadline never holds
+# up the event loop's default executor (or its shutdown).
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="federated")
+
+
+def extract_cloud_results(data: Any) -> List[Dict[str, Any]]:
+    """Pull the artist list out of a cloud service payload."""
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict):
+        results = data.get("results", data.get("data", []))
+        return results if isinstance(results, list) else []
+    return []
+
+
+def merge_artist_results(
+    results_by_source: Dict[str, List[Dict[str, Any]]]
+) -> List[Dict[str, Any]]:
+    """
+    Merge artist lists from several sources, deduplicating by normalized name.
+
+    Sources are merged in the order given, so the first source to report an
+    artist wins on conflicting fields; later sources only fill in fields the
+    earlier ones did not have. Each merged artist lists the sources it came
+    from under ``sources``.
+
+    Args:
+        results_by_source: Mapping of source name to the artists it returned
+
+    Returns:
+        Merged list of artists in first-seen order
+    """
+    merged: Dict[str, Dict[str, Any]] = {}
+    for source, results in results_by_source.items():
+        for artist in results:
+            if not isinstance(artist, dict):
+                continue
+            key = normalize_text(artist.get("name"))
+            if not key:
+                continue
+
+            existing = merged.get(key)
+            if existing is None:
+                entry = dict(artist)
+                entry["sources"] = [source]
+                merged[key] = entry
+                continue
+
+            for field, value in artist.items():
+                if existing.get(field) in (None, "", []):
+                    existing[field] = value
+            if source not in existing["sources"]:
+                existing["sources"].append(source)
+
+    return list(merged.values())
+
+
+async def _timed(query: Callable[[], List[Dict[str, Any]]]):
+    """Run a blocking query in a worker thread and time it."""
+    started = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    results = await loop.run_in_executor(_executor, query)
+    return results, time.perf_counter() - started
+
+
+async def federated_search(
+    queries: Dict[str, Callable[[], List[Dict[str, Any]]]],
+    deadline: float,
+) -> Dict[str, Any]:
+    """
+    Run blocking source queries concurrently and merge what finishes in time.
+
+    Args:
+        queries: Mapping of source name to a blocking callable returning a
+            list of artists. Sources are merged in this order.
+        deadline: Shared deadline in seconds for all sources
+
+    Returns:
+        Dict with merged ``results``, a ``partial`` flag and a per-source
+        ``sources`` report (status, result count and elapsed milliseconds)
+    """
+    started = time.perf_counter()
+    tasks = {
+        source: asyncio.ensure_future(_timed(query))
+        for source, query in queries.items()
+    }
+    await asyncio.wait(tasks.values(), timeout=deadline)
+
+    results_by_source: Dict[str, List[Dict[str, Any]]] = {}
+    report: Dict[str, Dict[str, Any]] = {}
+    for source, task in tasks.items():
+        if not task.done():
+            # The worker thread keeps running; we simply stop waiting for it.
+            task.cancel()
+            elapsed = time.perf_counter() - started
+            logger.warning(
+                f"Federated source '{source}' missed the {deadline:.3f}s deadline"
+            )
+            report[source] = {"status": "timeout", "count": 0,
+                              "elapsed_ms": round(elapsed * 1000, 1)}
+            continue
+
+        error = task.exception()
+        if error is not None:
+            logger.error(f"Federated source '{source}' failed: {error!r}")
+            report[source] = {"status": "error", "count": 0, "error": SOURCE_ERROR}
+            continue
+
+        results, elapsed = task.result()
+        results_by_source[source] = results
+        report[source] = {"status": "ok", "count": len(results),
+                          "elapsed_ms": round(elapsed * 1000, 1)}
+
+    merged = merge_artist_results(results_by_source)
+    partial = any(entry["status"] != "ok" for entry in report.values())
+    return {"results": merged, "partial": partial, "sources": report}
@@ -0,0 +1,77 @@
+"""
+Idempotency keys for retried POSTs.
+
+A client that sends ``Idempotency-Key: <key>`` with a registration can
+retry it after a timeout without registering twice: the first successful
+result is stored in the ``idempotency_keys`` collection under the key, and
+a retry with the same key and body gets that result back from one ``_id``
+read, without running the write again. Reusing a key for a different
+request is an error. Stored results expire after
+``Config.IDEMPOTENCY_TTL_SECONDS`` (a TTL index, see ``indexes.py``).
+
+Only successful results are stored, so a retry of a request that failed
+runs again.
+"""
+import datetime
+import hashlib
+import json
+from typing import Any, Dict, Optional
+
+from pymongo.errors import DuplicateKeyError
+
+IDEMPOTENCY_COLLECTION = "idempotency_keys"
+
+
+class IdempotencyKeyReused(Exception):
+    """Raised when a key is sent again with a different request."""
+    pass
+
+
+def fingerprint(endpoint: str, request: Dict[str, Any]) -> str:
+    """A digest of the endpoint and request body, to recognise a retry."""
+    encoded = json.dumps([endpoint, request], sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def stored_response(db, key: Optional[str], endpoint: str,
+                    request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    The stored result of an earlier request with this key.
+
+    Args:
+        db: pymongo Database
+        key: The Idempotency-Key header, or None
+        endpoint: Name of the endpoint the key is used with
+        request: The request body
+
+    Returns:
+        The stored response body, or None if there is none (or no key)
+
+    Raises:
+        IdempotencyKeyReused: The key was used for a different request
+    """
+    if not key:
+        return None
+    stored = db[IDEMPOTENCY_COLLECTION].find_one({"_id": key})
+    if stored is None:
+        return None
+    if stored["fingerprint"] != fingerprint(endpoint, request):
+        raise IdempotencyKeyReused(key)
+    return stored["response"]
+
+
+def store_response(db, key: Optional[str], endpoint: str, request: Dict[str, Any],
+                   response: Dict[str, Any]) -> None:
+    """Store a successful result for retries with the same key."""
+    if not key:
+        return
+    try:
+        db[IDEMPOTENCY_COLLECTION].insert_one({
+            "_id": key,
+            "fingerprint": fingerprint(endpoint, request),
+            "response": response,
+            "created_at": datetime.datetime.now(datetime.timezone.utc),
+        })
+    except DuplicateKeyError:
+        # A concurrent request with the same key stored its result first.
+        pass
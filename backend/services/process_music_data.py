@@ -1,92 +1,285 @@
+"""
+Parallel ingest of MusicBrainz CSV dumps.
+
+The CSV (one row per artist and tag, with ``name``, ``tag``, ``area_name``
+and ``begin_area_name`` columns) is split into byte ranges that end on line
+boundaries, and a process pool parses the ranges independently:
+
+- only rows whose tag is one of ``ALLOWED_GENRES`` are kept, as artists
+  ``{"name", "genre", "country", "city"}`` (``area_name`` is the country,
+  ``begin_area_name`` the city)
+- artists are deduplicated by ``normalize_text(name)``, like the unique
+  index on ``name_normalized``; the first row in file order wins, so an
+  artist keeps its first allowed tag as its genre
+- each worker also does the output work for its range: encoding NDJSON
+  lines, or building the stored documents with ``prepare_artist_document``
+
+The parent only drops names already seen in earlier ranges and writes,
+taking ranges in file order while the workers parse the next ones, so the
+output is the same for any number of workers and memory holds a few ranges
+plus the set of names.
+
+Byte ranges assume one record per line. A quoted field with a line break in
+it would be split across ranges; the MusicBrainz pulls do not have those.
+
+Usage (from the ``backend`` directory)::
+
+    python -m services.process_music_data dump.csv --output artists.ndjson
+    python -m services.process_music_data dump.csv --mongo
+    python -m services.process_music_data --benchmark 2000000
+
+``--mongo`` inserts into the artists collection in unordered batches; names
+already in the database are skipped by the unique index, or looked up per
+batch when the index is missing. It then rebuilds
+the facet counts and tracks, as seeding does, and bumps the catalog version
+with ``publish_reload`` so running workers reload their caches and indexes.
+"""
 import csv
+import io
 import json
-from operator import ge
-from uuid import UUID
-from webbrowser import get
+import logging
+import os
+import sys
+import time
+from multiprocessing import Pool
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from utils.text import normalize_text
 
+logger = logging.getLogger(__name__)
 
-def process_music_data(
-    filename="data-backend/resources/musicbrainz_pull_clean_more_data.csv",
-):
+ALLOWED_GENRES = frozenset({"rock", "pop", "jazz", "hip hop", "techno", "classical", "country"})
+
+# Bytes per parse task: large enough to amortise the task overhead, small
+# enough that a few in flight fit comfortably in memory.
+DEFAULT_CHUNK_BYTES = 32 << 20
+
+OUTPUT_FORMATS = ("ndjson", "documents")
+
+_encode = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False).encode
+
+
+def read_header(filename: str) -> Tuple[List[str], Any, int]:
     """
-    Processes a CSV file of music data, filtering and storing unique artists.
+    Read the header line and work out the CSV dialect.
 
     Args:
-        filename (str): The name of the CSV file to process.
+        filename: Path of the CSV file
 
     Returns:
-        dict: A dictionary containing the processed music data,
-              with artist names as keys.
+        ``(columns, dialect, data_start)``: the column names, a dialect for
+        ``csv.reader`` and the byte offset of the first data row
     """
-    allowed_genres = {
-        "rock",
-        "pop",
-        "jazz",
-        "hip hop",
-        "techno",
-        "classical",
-        "country",
+    with open(filename, "rb") as f:
+        sample = f.read(64 << 10)
+        f.seek(0)
+        header = f.readline()
+        data_start = f.tell()
+    try:
+        dialect = csv.Sniffer().sniff(sample.decode("utf-8", errors="ignore"))
+    except csv.Error:
+        # If sniffer fails, assume comma delimiter
+        dialect = csv.excel
+    columns = next(csv.reader([header.decode("utf-8-sig").rstrip("\r\n")], dialect), [])
+    return [column.strip() for column in columns], dialect, data_start
+
+
+def chunk_ranges(filename: str, start: int = 0,
+                 chunk_bytes: int = DEFAULT_CHUNK_BYTES) -> List[Tuple[int, int]]:
+    """
+    Split a file into byte ranges of about ``chunk_bytes`` that end on line
+    boundaries.
+
+    Args:
+        filename: Path of the file
+        start: Offset to start from (the first data row)
+        chunk_bytes: Target range size
+
+    Returns:
+        ``(start, end)`` offsets covering ``[start, file size)`` in order
+    """
+    size = os.path.getsize(filename)
+    ranges = []
+    with open(filename, "rb") as f:
+        while start < size:
+            f.seek(min(start + chunk_bytes, size))
+            # Finish the line the target offset falls in.
+            f.readline()
+            end = min(f.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def _dialect_params(dialect) -> Dict[str, Any]:
+    """Picklable ``csv.reader`` keyword arguments for a sniffed dialect."""
+    return {
+        "delimiter": dialect.delimiter,
+        "quotechar": dialect.quotechar,
+        "doublequote": dialect.doublequote,
+        "escapechar": dialect.escapechar,
+        "skipinitialspace": dialect.skipinitialspace,
     }
-    music_data = {}
-    infolist = []
 
-    try:
-        with open(filename, "r", encoding="utf-8") as csvfile:
-            # Try to determine the delimiter
-            sniffer = csv.Sniffer()
-            try:
-                dialect = sniffer.sniff(csvfile.read(1024))
-                csvfile.seek(0)
-            except csv.Error:
-                # If sniffer fails, assume comma delimiter
-                dialect = "excel"
-
-            reader = csv.DictReader(csvfile, dialect=dialect)
-            for row in reader:
-                name = row.get("name")
-                genre = row.get("tag")
-                country = row.get("area_name")
-                city = row.get("begin_area_name")
-
-                if genre not in allowed_genres:
-                    continue
 
-                if name:
-                    infolist.append(
-                        {
-                            "name": name,
-                            "country": country,
-                            "city": city,
-                        }
-                    )
+def parse_rows(lines: Iterable[str], columns: List[str], dialect: Dict[str, Any],
+               genres: Iterable[str] = ALLOWED_GENRES) -> Iterator[Tuple[str, Dict[str, str]]]:
+    """
+    Artists from CSV lines, first row per name only.
 
-                if tag in allowed_tags:
-                    if country and city:
-                        music_data[genre] = music_data.get(tag, [])
-                        music_data[genre].append(infolist[-1])
+    Args:
+        lines: Data lines, without the header
+        columns: Column names from the header
+        dialect: ``csv.reader`` keyword arguments
+        genres: Tags to keep
+
+    Yields:
+        ``(name_normalized, artist)`` pairs
+    """
+    genres = frozenset(genres)
+    index = {column: position for position, column in enumerate(columns)}
+    name_at, tag_at = index.get("name"), index.get("tag")
+    country_at, city_at = index.get("area_name"), index.get("begin_area_name")
+    if name_at is None or tag_at is None:
+        raise ValueError("The CSV needs 'name' and 'tag' columns")
+    width = max(position for position in (name_at, tag_at, country_at, city_at) if position is not None)
+    seen = set()
+    for row in csv.reader(lines, **dialect):
+        if len(row) <= width:
+            continue
+        genre = row[tag_at].strip().lower()
+        if genre not in genres:
+            continue
+        name = row[name_at].strip()
+        key = normalize_text(name)
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        artist = {"name": name, "genre": genre}
+        for field, position in (("country", country_at), ("city", city_at)):
+            value = row[position].strip() if position is not None else ""
+            if value:
+                artist[field] = value
+        yield key, artist
 
-    except FileNotFoundError:
-        print(f"Error: The file {filename} was not found.")
-    except Exception as e:
-        print(f"An error occurred: {e}")
 
-    return music_data
+def _parse_chunk(task) -> List[Tuple[str, Any]]:
+    """Parse one byte range in a worker, producing output in ``output_format``."""
+    filename, start, end, columns, dialect, genres, output_format = task
+    with open(filename, "rb") as f:
+        f.seek(start)
+        text = f.read(end - start).decode("utf-8", errors="replace")
+    # Not str.splitlines(), which also splits on U+2028, U+0085 and other
+    # separators that can appear inside names.
+    artists = parse_rows(io.StringIO(text, newline=""), columns, dialect, genres)
+    if output_format == "ndjson":
+        return [(key, _encode(artist)) for key, artist in artists]
+    # Imported here so NDJSON workers never load the document rules.
+    from services.artist_documents import prepare_artist_document
+    return [(key, prepare_artist_document(artist)) for key, artist in artists]
 
 
-def create_json_file(music_data, json_filename="../resources/music_data_new.json"):
+def ingest(filename: str, output_format: str = "ndjson", workers: Optional[int] = None,
+           chunk_bytes: int = DEFAULT_CHUNK_BYTES,
+           genres: Iterable[str] = ALLOWED_GENRES) -> Iterator[List[Any]]:
     """
-    Creates a JSON file from the given music data.
+    Parse a CSV dump in parallel.
 
     Args:
-        music_data (dict): The dictionary containing music data.
-        json_filename (str): The name of the JSON file to create.
+        filename: Path of the CSV file
+        output_format: ``"ndjson"`` for encoded lines, ``"documents"`` for
+            artist documents ready to insert
+        workers: Worker processes (defaults to every core; 1 parses in-process)
+        chunk_bytes: Bytes per parse task
+        genres: Tags to keep
+
+    Yields:
+        Per byte range, in file order, its new artists in ``output_format``
     """
-    try:
-        with open(json_filename, "w", encoding="utf-8") as jsonfile:
-            json.dump(music_data, jsonfile, indent=4)
-        print(f"Successfully created {json_filename}")
-    except Exception as e:
-        print(f"An error occurred while creating the JSON file: {e}")
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"output_format must be one of: {', '.join(OUTPUT_FORMATS)}")
+    workers = workers or os.cpu_count() or 1
+    columns, dialect, data_start = read_header(filename)
+    params = _dialect_params(dialect)
+    genres = sorted(genres)
+    tasks = [(filename, start, end, columns, params, genres, output_format)
+             for start, end in chunk_ranges(filename, data_start, chunk_bytes)]
+    seen = set()
+
+    def fresh(chunk):
+        artists = []
+        for key, artist in chunk:
+            if key not in seen:
+                seen.add(key)
+                artists.append(artist)
+        return artists
+
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield fresh(_parse_chunk(task))
+        return
+    with Pool(min(workers, len(tasks))) as pool:
+        for chunk in pool.imap(_parse_chunk, tasks):
+            yield fresh(chunk)
+
+
+def write_ndjson(chunks: Iterable[List[str]], output) -> int:
+    """Write encoded artists one per line; returns how many were written."""
+    written = 0
+    for lines in chunks:
+        if lines:
+            output.write("\n".join(lines))
+            output.write("\n")
+            written += len(lines)
+    return written
+
+
+def write_mongo(db, chunks: Iterable[List[Dict[str, Any]]], batch_size: int = 10_000) -> int:
+    """
+    Insert artist documents in unordered batches.
+
+    Artists whose name is already in the collection are skipped by the
+    unique ``name_normalized`` index (see ``indexes.py``). When that index
+    does not exist (``INDEX_BUILD=off``, or stored duplicates blocked it),
+    each batch is checked against the stored names first, one ``$in`` query
+    per batch.
+
+    Args:
+        db: pymongo Database
+        chunks: Lists of documents from ``ingest(..., "documents")``
+        batch_size: Documents per ``insert_many``
+
+    Returns:
+        Number of documents inserted
+    """
+    from pymongo.errors import BulkWriteError
+
+    from indexes import unique_artist_names
+
+    check_names = not unique_artist_names.exists(db)
+    if check_names:
+        logger.warning("The unique name_normalized index is missing; "
+                       "checking every batch against the stored names")
+    inserted = 0
+    for documents in chunks:
+        for start in range(0, len(documents), batch_size):
+            batch = documents[start:start + batch_size]
+            if check_names:
+                stored = {artist["name_normalized"] for artist in db.artists.find(
+                    {"name_normalized": {"$in": [document["name_normalized"] for document in batch]}},
+                    {"name_normalized": 1, "_id": 0},
+                )}
+                batch = [document for document in batch if document["name_normalized"] not in stored]
+                if not batch:
+                    continue
+            try:
+                inserted += len(db.artists.insert_many(batch, ordered=False).inserted_ids)
+            except BulkWriteError as e:
+                errors = e.details.get("writeErrors", [])
+                if any(error.get("code") != 11000 for error in errors):
+                    raise
+                inserted += e.details.get("nInserted", 0)
+    return inserted
 
 
 def get_unique_locations(json_filename="../resources/audioDB_200_in_order.json"):
@@ -118,20 +311,86 @@ def get_unique_genres(json_filename="../resources/audioDB_200_in_order.json"):
         print(f"An error occurred while reading the JSON file: {e}")
 
 
+def _benchmark(rows: int, workers: int, chunk_bytes: int) -> None:
+    """Time NDJSON ingest of a synthetic dump with one worker and with ``workers``."""
+    import random
+    import tempfile
+
+    rng = random.Random(42)
+    tags = sorted(ALLOWED_GENRES) + ["folk", "metal", "ambient", "blues"]
+    places = [("United States", "New York"), ("United Kingdom", "London"), ("Japan", "Tokyo"),
+              ("Germany", "Berlin"), ("Brazil", ""), ("", "")]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "dump.csv")
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["id", "gid", "name", "tag", "area_name", "begin_area_name"])
+            for row in range(rows):
+                country, city = rng.choice(places)
+                # About two tag rows per artist, as in the real pulls.
+                writer.writerow([row, f"{rng.getrandbits(64):016x}", f"Artist {row // 2}",
+                                 rng.choice(tags), country, city])
+        size = os.path.getsize(path)
+        print(f"{rows:,} rows, {size / 2**20:.0f} MiB")
+        for count in sorted({1, workers}):
+            began = time.perf_counter()
+            with open(os.devnull, "w", encoding="utf-8") as sink:
+                written = write_ndjson(ingest(path, "ndjson", count, chunk_bytes), sink)
+            elapsed = time.perf_counter() - began
+            print(f"{count:>3} worker(s): {written:,} artists in {elapsed:.2f}s "
+                  f"({size / 2**20 / elapsed:.0f} MiB/s)")
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Ingest a MusicBrainz CSV dump.")
+    parser.add_argument("filename", nargs="?", help="The CSV dump")
+    parser.add_argument("--output", default="-", help="NDJSON output file ('-' for stdout)")
+    parser.add_argument("--mongo", action="store_true",
+                        help="Insert into the artists collection instead of writing NDJSON")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-mb", type=int, default=DEFAULT_CHUNK_BYTES >> 20)
+    parser.add_argument("--genres", nargs="*", default=None,
+                        help=f"Tags to keep (default: {', '.join(sorted(ALLOWED_GENRES))})")
+    parser.add_argument("--benchmark", type=int, metavar="ROWS",
+                        help="Time the ingest of a synthetic dump with ROWS rows instead")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    chunk_bytes = max(args.chunk_mb, 1) << 20
+    if args.benchmark:
+        _benchmark(args.benchmark, args.workers, chunk_bytes)
+        return
+    if not args.filename:
+        parser.error("a CSV file is required")
+    genres = [genre.lower() for genre in args.genres] if args.genres else ALLOWED_GENRES
+
+    started = time.perf_counter()
+    if args.mongo:
+        from database import db
+        from indexes import ensure_indexes
+
+        from services.catalog_changes import publish_reload
+        from services.facets import rebuild_facet_counts
+        from services.tracks import rebuild_tracks
+
+        # The unique name index is what skips artists already stored.
+        ensure_indexes(db, background=False)
+        chunks = ingest(args.filename, "documents", args.workers, chunk_bytes, genres)
+        written = write_mongo(db, chunks)
+        if written:
+            # As after seeding; then running workers reload their caches and indexes.
+            logger.info(f"Materialized {rebuild_facet_counts(db)} facet rows")
+            logger.info(f"Flattened {rebuild_tracks(db)} tracks")
+            logger.info(f"Catalog version is now {publish_reload(db)}")
+    elif args.output == "-":
+        written = write_ndjson(ingest(args.filename, "ndjson", args.workers, chunk_bytes, genres), sys.stdout)
+    else:
+        with open(args.output, "w", encoding="utf-8", buffering=1 << 20) as f:
+            written = write_ndjson(ingest(args.filename, "ndjson", args.workers, chunk_bytes, genres), f)
+    elapsed = time.perf_counter() - started
+    logger.info(f"Wrote {written} artists in {elapsed:.1f}s ({written / elapsed:,.0f} artists/s)")
+
+
 if __name__ == "__main__":
-    #    unique_locations = get_unique_locations()
-    #    print(f"Unique locations: {unique_locations}")
-    get_unique_genres()
-    print(f"Unique genres: {get_unique_genres()}")
-    # processed_data = process_music_data()
-    # create_json_file(processed_data)
-    # # Optional: print the number of unique artists found
-    # print(f"Found {len(processed_data)} unique artists with the specified tags.")
-    # # Optional: print the first 5 items for verification
-    # count = 0
-    # for name, data in processed_data.items():
-    #     if count < 5:
-    #         print(f"{name}: {data}")
-    #         count += 1
-    #     else:
-    #         break
+    main()
@@ -0,0 +1,626 @@
+"""
+Compact in-process snapshot of the artist catalog for read-mostly endpoints.
+
+With ``Config.CATALOG_SNAPSHOT`` on, each worker loads every artist into
+memory at startup (on a background thread; requests use MongoDB until it is
+ready) and the genre, location, name and radius endpoints answer from it
+without a database round trip. Registrations through the worker update it
+in place.
+
+Each artist is an ``ArtistRecord`` with ``__slots__`` instead of a dict:
+
+- genre, location, city, region and country strings are interned, so the
+  few thousand distinct values are stored once
+- coordinates are two floats
+- the discography, embedded and bucketed albums together (see
+  ``services.album_buckets``), is kept as zlib-compressed JSON, decoded
+  only for responses that include albums
+- summaries are stored out of line, zlib-compressed in a separate list, and
+  only decompressed when a response includes them
+
+Lookups go through per-field slot lists (genre, city, region, country) and a
+name dictionary (to the first artist with each name; artists sharing a name
+keep their own records), mirroring the MongoDB indexes, so queries only touch
+matching records. Radius searches use a one-degree grid of coordinates, the
+counterpart of the ``geo`` 2dsphere index. Filters use the same Mongo filter documents as the
+database path (``{"genre": ...}`` plus ``utils.locations.location_filter``).
+
+With ``Config.CATALOG_FILE`` set, the snapshot is loaded from that binary
+catalog file (see ``services.catalog_file``) instead of the database. Its
+records then keep no albums or summaries of their own: they point at their
+document in the memory-mapped file, which all workers share through the
+page cache, and decode it for responses that need either. Changes made since
+the file was exported are re-read from the database through the changelog;
+a file that is too far behind, or does not match the database (its artist
+count, or a sample of its ``_id``s), is ignored.
+
+Run ``python -m services.snapshot --count 100000`` to measure memory and
+latency.
+"""
+import json
+import logging
+import math
+import random
+import sys
+import threading
+import time
+import zlib
+from array import array
+from typing import Any, Dict, Iterable, List, Optional
+
+from services.album_buckets import attach_albums
+from config import Config
+from services.artist_documents import DERIVED_FIELDS, HIDDEN_FIELDS, geo_point
+from services.catalog_file import CatalogFile, CatalogFileError
+from utils.fast_json import dumps, find_documents
+from utils.geolocation import EARTH_RADIUS_MI, haversine_distance
+from utils.text import normalize_text
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Artists of a catalog file looked up by _id (besides the first and last)
+# to confirm the file was exported from this database.
+FILE_ID_SAMPLE = 32
+
+# Record fields with a slot list, matching the artists collection indexes.
+INDEXED_FIELDS = ("genre", "city", "region", "country")
+
+_INTERNED = ("genre", "location", "city", "region", "country")
+_MODELLED = frozenset(("_id", "name", "image", "coordinates", "summary", "albums") + _INTERNED)
+
+# Interned fields the document does not have at all (as opposed to null).
+_ABSENT = object()
+
+# Miles per degree of latitude.
+_MILES_PER_DEGREE = EARTH_RADIUS_MI * math.pi / 180
+
+
+def _loads(data: bytes) -> Any:
+    data = zlib.decompress(data)
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def _compress(value: Any) -> bytes:
+    return zlib.compress(dumps(value))
+
+
+def _cell(latitude: float, longitude: float):
+    return math.floor(latitude), math.floor(longitude)
+
+
+def _cells_around(latitude: float, longitude: float, radius: float) -> Optional[List[tuple]]:
+    """Grid cells covering ``radius`` miles around a point, or None for "all"."""
+    delta_latitude = radius / _MILES_PER_DEGREE
+    scale = math.cos(math.radians(min(abs(latitude) + delta_latitude, 90.0)))
+    if latitude + delta_latitude >= 90 or latitude - delta_latitude <= -90 \
+            or scale * 180 * _MILES_PER_DEGREE <= radius:
+        return None
+    delta_longitude = radius / (_MILES_PER_DEGREE * scale)
+    rows = range(math.floor(latitude - delta_latitude), math.floor(latitude + delta_latitude) + 1)
+    columns = {
+        (column + 180) % 360 - 180
+        for column in range(math.floor(longitude - delta_longitude),
+                            math.floor(longitude + delta_longitude) + 1)
+    }
+    return [(row, column) for row in rows for column in columns]
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class ArtistRecord:
+    """One artist, stored compactly."""
+
+    __slots__ = ("id", "name", "genre", "location", "city", "region", "country",
+                 "latitude", "longitude", "image", "summary", "albums", "blob", "extra")
+
+    def __init__(self, document: Dict[str, Any], summary: Optional[int], blob: Optional[int] = None):
+        self.id = document["_id"]
+        self.name = document.get("name")
+        for field in _INTERNED:
+            setattr(self, field, _intern(document.get(field, _ABSENT)))
+        self.image = document.get("image")
+        self.summary = summary
+        # Index of the document in the catalog file, which then holds the
+        # albums and summary.
+        self.blob = blob
+        if blob is None and document.get("albums") is not None:
+            self.albums = _compress(document["albums"])
+        else:
+            self.albums = None
+        # Unmodelled fields, and modelled ones stored as null, go here as is.
+        extra = {
+            key: value for key, value in document.items()
+            if (key not in _MODELLED or value is None) and key not in HIDDEN_FIELDS
+            and key not in _INTERNED
+        }
+        point = geo_point(document.get("coordinates"))
+        if point and set(document["coordinates"]) == {"latitude", "longitude"}:
+            self.longitude, self.latitude = point["coordinates"]
+        else:
+            self.latitude = self.longitude = None
+            if "coordinates" in document:
+                extra["coordinates"] = document["coordinates"]
+        self.extra = extra or None
+
+    def get(self, field: str):
+        """A field for filter matching; ``geo`` exists when coordinates do."""
+        if field == "geo":
+            return True if self.latitude is not None else None
+        if field in _INTERNED:
+            value = getattr(self, field)
+            return None if value is _ABSENT else value
+        return (self.extra or {}).get(field)
+
+
+def _matches(record: ArtistRecord, query: Dict[str, Any]) -> bool:
+    """Evaluate the subset of Mongo filters the read endpoints build."""
+    for field, condition in query.items():
+        if field == "$and":
+            if not all(_matches(record, clause) for clause in condition):
+                return False
+        elif field == "$or":
+            if not any(_matches(record, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict) and "$exists" in condition:
+            if (record.get(field) is not None) != bool(condition["$exists"]):
+                return False
+        elif record.get(field) != condition:
+            return False
+    return True
+
+
+def apply_projection(document: Dict[str, Any], projection: Optional[Dict[str, int]]) -> Dict[str, Any]:
+    """
+    Apply a Mongo projection (top-level fields, one level of dotted paths
+    into sub-documents or arrays of them) to a document.
+    """
+    if not projection:
+        return document
+    inclusion = any(value for key, value in projection.items() if key != "_id")
+    if not inclusion:
+        result = dict(document)
+        for key, value in projection.items():
+            if value:
+                continue
+            head, _, tail = key.partition(".")
+            if not tail:
+                result.pop(head, None)
+            elif isinstance(result.get(head), list):
+                result[head] = [
+                    {k: v for k, v in item.items() if k != tail} if isinstance(item, dict) else item
+                    for item in result[head]
+                ]
+            elif isinstance(result.get(head), dict):
+                result[head] = {k: v for k, v in result[head].items() if k != tail}
+        return result
+
+    result = {}
+    if projection.get("_id", 1) and "_id" in document:
+        result["_id"] = document["_id"]
+    nested: Dict[str, List[str]] = {}
+    for key, value in projection.items():
+        if not value or key == "_id":
+            continue
+        head, _, tail = key.partition(".")
+        if not tail:
+            if head in document:
+                result[head] = document[head]
+        elif head not in result:
+            nested.setdefault(head, []).append(tail)
+    for head, tails in nested.items():
+        value = document.get(head)
+        if isinstance(value, list):
+            result[head] = [
+                {k: v for k, v in item.items() if k in tails} if isinstance(item, dict) else item
+                for item in value
+            ]
+        elif isinstance(value, dict):
+            result[head] = {k: v for k, v in value.items() if k in tails}
+    return result
+
+
+def _needs(projection: Optional[Dict[str, int]], field: str) -> bool:
+    """Whether a projection can include ``field`` (or a path inside it)."""
+    if not projection:
+        return True
+    inclusion = any(value for key, value in projection.items() if key != "_id")
+    if inclusion:
+        return any(value and key.split(".")[0] == field for key, value in projection.items())
+    return projection.get(field, 1) != 0
+
+
+class CatalogSnapshot:
+    """The per-worker snapshot: records, slot lists and out-of-line summaries."""
+
+    def __init__(self):
+        self.loaded = False
+        self._records: List[ArtistRecord] = []
+        self._summaries: List[bytes] = []
+        self._by_name: Dict[str, int] = {}
+        # Slots of later artists with an already indexed name.
+        self._same_name: Dict[str, List[int]] = {}
+        self._by_field: Dict[str, Dict[Any, array]] = {field: {} for field in INDEXED_FIELDS}
+        self._by_cell: Dict[tuple, array] = {}
+        self._file: Optional[CatalogFile] = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def load(self, db) -> None:
+        """Replace the snapshot with every artist, from the catalog file when possible."""
+        if Config.CATALOG_FILE and self.load_file(db, Config.CATALOG_FILE):
+            return
+        started = time.perf_counter()
+        fresh = CatalogSnapshot()
+        for document in attach_albums(db, find_documents(db.artists, {}, None)):
+            fresh._insert(document)
+        self.replace_with(fresh)
+        logger.info(f"Loaded the catalog snapshot ({len(self)} artists) "
+                    f"in {time.perf_counter() - started:.2f}s")
+
+    def load_file(self, db, filename: str) -> bool:
+        """
+        Replace the snapshot with a catalog file plus the changes made since
+        it was exported.
+
+        Args:
+            db: pymongo Database
+            filename: Path of the catalog file
+
+        Returns:
+            Whether the file was used; False when it is missing, unreadable,
+            too far behind the changelog or does not match the database
+        """
+        # Imported here: catalog_changes updates this module's snapshot.
+        from services.catalog_changes import changes_since
+
+        started = time.perf_counter()
+        try:
+            catalog = CatalogFile(filename)
+        except (OSError, CatalogFileError) as e:
+            logger.warning(f"Not loading the snapshot from {filename}: {e}")
+            return False
+        changes = changes_since(db, catalog.catalog_version)
+        added = sum(1 for change in changes or () if change.get("kind") == "artist_added")
+        if changes is None or db.artists.estimated_document_count() != len(catalog) + added \
+                or not self._ids_match(db, catalog):
+            logger.warning(f"{filename} does not match the database; loading the snapshot from MongoDB")
+            catalog.close()
+            return False
+        self.build_from_file(catalog)
+        changed = list({change["artist_id"]: None for change in changes})
+        if changed:
+            artists = find_documents(db.artists, {"_id": {"$in": changed}}, None)
+            for artist in attach_albums(db, artists):
+                self.record_artist_added(artist)
+        logger.info(f"Loaded the catalog snapshot ({len(self)} artists) from {filename} "
+                    f"and {len(changed)} changed artists in {time.perf_counter() - started:.2f}s")
+        return True
+
+    @staticmethod
+    def _ids_match(db, catalog: CatalogFile) -> bool:
+        """
+        Whether a sample of the file's artists (first, last and random ones)
+        are stored under the same ``_id``s, checked with one query.
+
+        Catches a file exported from another copy of the catalog (an export of
+        the JSON gets fresh ids) that happens to have the same size.
+        """
+        count = len(catalog)
+        if not count:
+            return True
+        sample = {0, count - 1}
+        sample.update(random.sample(range(count), min(count, FILE_ID_SAMPLE)))
+        ids = [catalog.id(index) for index in sample]
+        return db.artists.count_documents({"_id": {"$in": ids}}) == len(ids)
+
+    def ensure_loaded(self, db) -> None:
+        """Load the snapshot unless another thread already has."""
+        if self.loaded:
+            return
+        with self._load_lock:
+            if not self.loaded:
+                self.load(db)
+
+    def build(self, documents: Iterable[Dict[str, Any]]) -> None:
+        """Replace the snapshot with ``documents`` (stored artist documents)."""
+        fresh = CatalogSnapshot()
+        for document in documents:
+            fresh._insert(document)
+        self.replace_with(fresh)
+
+    def build_from_file(self, catalog: CatalogFile) -> None:
+        """Replace the snapshot with the artists of a catalog file, albums and summaries left in it."""
+        fresh = CatalogSnapshot()
+        fresh._file = catalog
+        for blob, document in enumerate(catalog.documents()):
+            fresh._insert(document, blob)
+        self.replace_with(fresh)
+
+    def replace_with(self, other: "CatalogSnapshot") -> None:
+        with self._lock:
+            self._file = other._file
+            self._records, self._summaries = other._records, other._summaries
+            self._by_name, self._by_field = other._by_name, other._by_field
+            self._same_name = other._same_name
+            self._by_cell = other._by_cell
+            self.loaded = True
+
+    def _insert(self, document: Dict[str, Any], blob: Optional[int] = None) -> None:
+        key = document.get("name_normalized") or normalize_text(document.get("name"))
+        summary = None
+        if document.get("summary") is not None and blob is None:
+            summary = len(self._summaries)
+            self._summaries.append(zlib.compress(document["summary"].encode("utf-8")))
+        record = ArtistRecord(document, summary, blob)
+        slot = self._slot_of(key, record.id) if key else None
+        if slot is not None:
+            self._unindex(slot)
+            self._records[slot] = record
+        else:
+            slot = len(self._records)
+            self._records.append(record)
+            if key in self._by_name:
+                self._same_name.setdefault(key, []).append(slot)
+            elif key:
+                self._by_name[key] = slot
+        for field in INDEXED_FIELDS:
+            value = record.get(field)
+            if value is not None:
+                self._by_field[field].setdefault(value, array("I")).append(slot)
+        if record.latitude is not None:
+            self._by_cell.setdefault(_cell(record.latitude, record.longitude), array("I")).append(slot)
+
+    def _slot_of(self, key: str, artist_id: Any) -> Optional[int]:
+        """The slot of the artist with this name key and ``_id``, if stored."""
+        slot = self._by_name.get(key)
+        if slot is None:
+            return None
+        for candidate in [slot] + self._same_name.get(key, []):
+            if self._records[candidate].id == artist_id:
+                return candidate
+        return None
+
+    def _unindex(self, slot: int) -> None:
+        old = self._records[slot]
+        for field in INDEXED_FIELDS:
+            slots = self._by_field[field].get(old.get(field))
+            if slots is not None and slot in slots:
+                slots.remove(slot)
+        if old.latitude is not None:
+            slots = self._by_cell.get(_cell(old.latitude, old.longitude))
+            if slots is not None and slot in slots:
+                slots.remove(slot)
+
+    def record_artist_added(self, document: Dict[str, Any]) -> None:
+        """Add an artist written through this worker, or replace the one with its ``_id``."""
+        if self.loaded:
+            with self._lock:
+                self._insert(document)
+
+    def record_album_added(self, name: str, album: Dict[str, Any]) -> None:
+        """Append an album registered through this worker."""
+        if not self.loaded:
+            return
+        with self._lock:
+            slot = self._by_name.get(normalize_text(name))
+            if slot is None:
+                return
+            record = self._records[slot]
+            if record.albums:
+                albums = _loads(record.albums)
+            elif record.blob is not None:
+                albums = self._file.document(record.blob).get("albums") or []
+            else:
+                albums = []
+            albums.append(album)
+            record.albums = _compress(albums)
+
+    def document(self, record: ArtistRecord, projection: Optional[Dict[str, int]] = None) -> Dict:
+        """The public document for a record, as the database path returns it."""
+        document: Dict[str, Any] = {"_id": record.id}
+        if record.name is not None:
+            document["name"] = record.name
+        for field in _INTERNED:
+            value = getattr(record, field)
+            if value is not _ABSENT:
+                document[field] = value
+        if record.image is not None:
+            document["image"] = record.image
+        if record.latitude is not None:
+            document["coordinates"] = {"latitude": record.latitude, "longitude": record.longitude}
+        if record.summary is not None and _needs(projection, "summary"):
+            document["summary"] = zlib.decompress(self._summaries[record.summary]).decode("utf-8")
+        if record.albums is not None and _needs(projection, "albums"):
+            document["albums"] = _loads(record.albums)
+        if record.blob is not None and (_needs(projection, "summary") or _needs(projection, "albums")):
+            stored = self._file.document(record.blob)
+            if stored.get("summary") is not None and _needs(projection, "summary"):
+                document["summary"] = stored["summary"]
+            if record.albums is None and stored.get("albums") is not None and _needs(projection, "albums"):
+                document["albums"] = stored["albums"]
+        if record.extra:
+            document.update(record.extra)
+        return apply_projection(document, projection)
+
+    def _candidates(self, query: Dict[str, Any]) -> Optional[Iterable[int]]:
+        """Slots that may match, from the slot lists, or None for "all"."""
+        best = None
+        for field, condition in query.items():
+            if field in INDEXED_FIELDS and not isinstance(condition, dict):
+                slots = self._by_field[field].get(condition, ())
+            elif field == "$and":
+                slots = None
+                for clause in condition:
+                    found = self._candidates(clause)
+                    if found is not None and (slots is None or len(found) < len(slots)):
+                        slots = found
+            elif field == "$or":
+                branches = [self._candidates(clause) for clause in condition]
+                if any(branch is None for branch in branches):
+                    continue
+                slots = sorted(set().union(*branches))
+            else:
+                continue
+            if slots is not None and (best is None or len(slots) < len(best)):
+                best = slots
+        return best
+
+    def find(self, query: Dict[str, Any], projection: Optional[Dict[str, int]] = None,
+             limit: int = 0) -> List[Dict]:
+        """
+        Artists matching a Mongo filter, in insertion order.
+
+        Args:
+            query: Filter on genre and the location fields (see ``_matches``)
+            projection: Mongo projection applied to each result
+            limit: Maximum number of results (0 for no limit)
+
+        Returns:
+            Public artist documents
+        """
+        results = []
+        with self._lock:
+            candidates = self._candidates(query)
+            slots = range(len(self._records)) if candidates is None else candidates
+            for slot in slots:
+                record = self._records[slot]
+                if _matches(record, query):
+                    results.append(self.document(record, projection))
+                    if limit and len(results) >= limit:
+                        break
+        return results
+
+    def find_by_name(self, name: str, projection: Optional[Dict[str, int]] = None) -> Optional[Dict]:
+        """The artist with this name, compared normalized, or None."""
+        with self._lock:
+            slot = self._by_name.get(normalize_text(name))
+            return None if slot is None else self.document(self._records[slot], projection)
+
+    def near(self, query: Dict[str, Any], latitude: float, longitude: float, radius: float,
+             fallback: Optional[Dict[str, Any]] = None,
+             projection: Optional[Dict[str, int]] = None) -> List[Dict]:
+        """
+        Artists matching ``query`` within ``radius`` miles, nearest first,
+        each with its ``distance_mi``; artists without coordinates are
+        included after them when they match ``fallback`` (the location
+        filter), as on the database path.
+        """
+        near, located = [], []
+        with self._lock:
+            cells = _cells_around(latitude, longitude, radius)
+            if cells is None:
+                slots: Iterable[int] = range(len(self._records))
+            else:
+                slots = [slot for cell in cells for slot in self._by_cell.get(cell, ())]
+            for slot in slots:
+                record = self._records[slot]
+                if record.latitude is None or not _matches(record, query):
+                    continue
+                distance = haversine_distance(latitude, longitude, record.latitude, record.longitude)
+                if distance <= radius:
+                    near.append((distance, slot, record))
+            if fallback is not None:
+                combined = {"$and": [query, fallback]}
+                candidates = self._candidates(combined)
+                for slot in range(len(self._records)) if candidates is None else candidates:
+                    record = self._records[slot]
+                    if record.latitude is None and _matches(record, combined):
+                        located.append(record)
+            near.sort(key=lambda item: item[:2])
+            results = []
+            for distance, _, record in near:
+                document = self.document(record, projection)
+                document["distance_mi"] = round(distance, 2)
+                results.append(document)
+            results.extend(self.document(record, projection) for record in located)
+        return results
+
+
+catalog_snapshot = CatalogSnapshot()
+
+
+def _benchmark(count: int, seed: int, queries: int) -> None:
+    import gc
+    import random
+    import tracemalloc
+
+    import bson
+    from bson import ObjectId
+
+    from benchmarks.catalog import CITIES, GENRES, generate_artists
+    from services.artist_documents import PUBLIC_PROJECTION, prepare_artist_document
+    from utils.fast_json import _CODEC_OPTIONS
+    from utils.locations import location_filter
+
+    documents = []
+    for artist in generate_artists(count, seed):
+        document = prepare_artist_document(artist)
+        document["_id"] = ObjectId()
+        documents.append(document)
+
+    tracemalloc.start()
+    snapshot = CatalogSnapshot()
+    snapshot.build(documents)
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"snapshot of {len(snapshot):,} artists: {held / 2**20:.1f} MiB "
+          f"({held / len(snapshot):.0f} bytes per artist)")
+
+    # The database path decodes every returned document from BSON before
+    # anything else, so that alone is a floor for its latency.
+    encoded = {str(document["_id"]): bson.encode(
+        {k: v for k, v in document.items() if k not in DERIVED_FIELDS}
+    ) for document in documents}
+    rng = random.Random(seed)
+    names = [document["name"] for document in rng.sample(documents, min(queries, len(documents)))]
+    # Only the snapshot should be live while timing, as in a worker.
+    del documents
+    gc.collect()
+    gc.freeze()
+    scenarios = {
+        "genre (n=20)": lambda: snapshot.find({"genre": rng.choice(GENRES)}, PUBLIC_PROJECTION, 20),
+        "location (n=20)": lambda: snapshot.find(
+            dict({"genre": rng.choice(GENRES)}, **location_filter(location=rng.choice(CITIES)[0])),
+            PUBLIC_PROJECTION, 20),
+        "name": lambda: snapshot.find_by_name(rng.choice(names), PUBLIC_PROJECTION),
+        "radius 50 mi": lambda: snapshot.near(
+            {"genre": rng.choice(GENRES)}, *rng.choice(CITIES)[2:], 50, projection=PUBLIC_PROJECTION),
+    }
+    for label, run in scenarios.items():
+        timings, decode_timings = [], []
+        for _ in range(queries):
+            began = time.perf_counter()
+            results = run()
+            timings.append(time.perf_counter() - began)
+            results = results if isinstance(results, list) else [results] if results else []
+            batch = b"".join(encoded[str(result["_id"])] for result in results)
+            began = time.perf_counter()
+            bson.decode_all(batch, _CODEC_OPTIONS)
+            decode_timings.append(time.perf_counter() - began)
+        timings.sort()
+        decode_timings.sort()
+        print(f"{label}: p50 {timings[len(timings) // 2] * 1e3:.3f} ms, "
+              f"p99 {timings[int(len(timings) * 0.99)] * 1e3:.3f} ms; "
+              f"BSON decode alone on the database path: p50 "
+              f"{decode_timings[len(decode_timings) // 2] * 1e3:.3f} ms")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Measure the catalog snapshot.")
+    parser.add_argument("--count", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--queries", type=int, default=1_000)
+    args = parser.parse_args()
+    _benchmark(args.count, args.seed, args.queries)
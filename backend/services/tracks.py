@@ -0,0 +1,212 @@
+"""
+Flattened track index for track-level search.
+
+Tracks are stored inside ``albums[].tracks[]`` on each artist document,
+which no index can search without reading whole discographies. The
+``tracks`` collection holds one small document per track instead, pointing
+back at its artist (``artist_id``, ``artist``) and album (``album``,
+``album_index``, ``year``), plus two indexed search fields:
+
+- ``title_normalized``: ``normalize_text(title)``, for exact and prefix
+  matches (a prefix is an indexed ``$gte``/``$lt`` range)
+- ``title_words``: the distinct normalized words of the title, for matching
+  every word of a query anywhere in the title
+
+Albums in the album buckets (see ``services.album_buckets``) are indexed
+too; their ``album_index`` continues after the artist's embedded albums.
+
+Each row records the ``DERIVED_VERSION`` it was built under, since it copies
+normalized album fields such as ``duration_seconds``. The collection is
+rebuilt from ``artists`` after seeding, and at startup when it is missing or
+was built under another version, and it is extended by ``record_album_added`` whenever a discography is
+registered, so it never needs a scan of the artists collection at request
+time.
+"""
+import logging
+from typing import Any, Dict, Iterator, List, Optional
+
+from services.album_buckets import ALBUM_BUCKET_COLLECTION
+from services.artist_documents import DERIVED_VERSION
+from utils.text import normalize_text, prefix_end
+
+logger = logging.getLogger(__name__)
+
+TRACK_COLLECTION = "tracks"
+
+MATCH_TYPES = ("exact", "prefix", "text")
+
+# Fields returned by searches; the search fields stay internal.
+TRACK_PROJECTION = {"_id": 0, "title_normalized": 0, "title_words": 0, "derived_version": 0}
+
+
+def track_documents(artist_id, artist_name: Optional[str], album: Dict[str, Any],
+                    album_index: int) -> Iterator[Dict[str, Any]]:
+    """
+    The ``tracks`` documents for one album.
+
+    Args:
+        artist_id: ``_id`` of the artist document
+        artist_name: Artist name as stored
+        album: Album as stored in ``albums[]``
+        album_index: Position of the album in ``albums[]``
+
+    Yields:
+        One document per titled track, numbered from 1 in album order
+    """
+    for number, track in enumerate(album.get("tracks") or [], start=1):
+        title = track.get("title")
+        if not title:
+            continue
+        title_normalized = normalize_text(title)
+        yield {
+            "title": title,
+            "duration": track.get("duration"),
+            "duration_seconds": track.get("duration_seconds"),
+            "track_number": number,
+            "album": album.get("title"),
+            "album_index": album_index,
+            "year": album.get("year"),
+            "artist": artist_name,
+            "artist_id": artist_id,
+            "title_normalized": title_normalized,
+            "title_words": sorted(set(title_normalized.split())),
+            "derived_version": DERIVED_VERSION,
+        }
+
+
+def artist_track_documents(artist: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Every ``tracks`` document for a stored artist document."""
+    for album_index, album in enumerate(artist.get("albums") or []):
+        yield from track_documents(artist["_id"], artist.get("name"), album, album_index)
+
+
+def rebuild_tracks(db, batch_size: int = 5000) -> int:
+    """
+    Recompute the ``tracks`` collection from the artists and album buckets.
+
+    Args:
+        db: pymongo Database
+        batch_size: Documents per insert
+
+    Returns:
+        Number of tracks written
+    """
+    collection = db[TRACK_COLLECTION]
+    collection.delete_many({})
+    artists = db.artists.find(
+        {"$or": [{"albums.tracks.0": {"$exists": True}}, {"bucketed_albums": {"$gt": 0}}]},
+        {"name": 1, "albums.title": 1, "albums.year": 1, "albums.tracks": 1, "bucketed_albums": 1},
+    )
+    written = 0
+    batch: List[Dict[str, Any]] = []
+    # Embedded album counts of artists with buckets, where their indexes continue.
+    embedded: Dict[Any, int] = {}
+
+    def flush(limit: int) -> None:
+        nonlocal written, batch
+        if len(batch) >= limit:
+            collection.insert_many(batch, ordered=False)
+            written += len(batch)
+            batch = []
+
+    for artist in artists:
+        if artist.get("bucketed_albums"):
+            embedded[artist["_id"]] = len(artist.get("albums") or [])
+        batch.extend(artist_track_documents(artist))
+        flush(batch_size)
+    buckets = db[ALBUM_BUCKET_COLLECTION].find(
+        {"albums.tracks.0": {"$exists": True}},
+        {"artist_id": 1, "artist": 1, "positions": 1,
+         "albums.title": 1, "albums.year": 1, "albums.tracks": 1},
+    )
+    for bucket in buckets:
+        offset = embedded.get(bucket["artist_id"], 0)
+        for position, album in zip(bucket.get("positions") or [], bucket.get("albums") or []):
+            batch.extend(track_documents(bucket["artist_id"], bucket.get("artist"), album, offset + position))
+        flush(batch_size)
+    if batch:
+        collection.insert_many(batch, ordered=False)
+        written += len(batch)
+    logger.info(f"Rebuilt {written} tracks")
+    return written
+
+
+def ensure_tracks(db) -> None:
+    """
+    Rebuild ``tracks`` if it is empty but some artist has tracks, or if it
+    was built under an older ``DERIVED_VERSION`` (rows are rebuilt together,
+    so one row tells).
+    """
+    row = db[TRACK_COLLECTION].find_one({}, {"derived_version": 1})
+    if row is not None:
+        if row.get("derived_version") != DERIVED_VERSION:
+            logger.info(f"Tracks were built under derived version {row.get('derived_version')}; rebuilding")
+            rebuild_tracks(db)
+        return
+    has_tracks = {"albums.tracks.0": {"$exists": True}}
+    if db.artists.find_one(has_tracks, {"_id": 1}) is not None \
+            or db[ALBUM_BUCKET_COLLECTION].find_one(has_tracks, {"_id": 1}) is not None:
+        rebuild_tracks(db)
+
+
+def record_album_added(db, artist: Dict[str, Any], album: Dict[str, Any]) -> None:
+    """
+    Index the tracks of an album just appended to an artist.
+
+    Args:
+        db: pymongo Database
+        artist: The artist document before the update, with ``_id``, ``name``,
+            ``albums`` (titles are enough) and ``bucketed_albums`` so the
+            album's index is known
+        album: The album as stored
+    """
+    album_index = len(artist.get("albums") or []) + artist.get("bucketed_albums", 0)
+    documents = list(track_documents(artist["_id"], artist.get("name"), album, album_index))
+    if documents:
+        db[TRACK_COLLECTION].insert_many(documents, ordered=False)
+
+
+def _match_filter(key: str, match: str) -> Dict[str, Any]:
+    if match == "exact":
+        return {"title_normalized": key}
+    if match == "prefix":
+        return {"title_normalized": {"$gte": key, "$lt": prefix_end(key)}}
+    return {"title_words": {"$all": sorted(set(key.split()))}}
+
+
+def search_tracks(db, query: str, match: Optional[str] = None, limit: int = 20) -> List[Dict]:
+    """
+    Find tracks by title.
+
+    Without ``match``, exact matches come first, then prefix matches, then
+    titles containing every word of the query, until ``limit`` is reached.
+
+    Args:
+        db: pymongo Database
+        query: Title or part of it
+        match: One of ``MATCH_TYPES`` to use only that kind of match
+        limit: Maximum number of tracks
+
+    Returns:
+        Track documents with the kind of ``match`` that found them
+    """
+    key = normalize_text(query)
+    if not key:
+        return []
+    results: List[Dict] = []
+    seen = set()
+    for kind in (match,) if match else MATCH_TYPES:
+        cursor = db[TRACK_COLLECTION].find(_match_filter(key, kind), TRACK_PROJECTION)
+        if kind != "text":
+            # Walks the title index in order; word matches come in index order.
+            cursor = cursor.sort([("title_normalized", 1), ("artist", 1)])
+        for track in cursor.limit(limit + len(seen)):
+            identity = (track["artist_id"], track["album_index"], track["track_number"])
+            if identity in seen:
+                continue
+            seen.add(identity)
+            track["match"] = kind
+            results.append(track)
+            if len(results) >= limit:
+                return results
+    return results
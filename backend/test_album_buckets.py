@@ -0,0 +1,135 @@
+"""
+Tests for registered albums stored in bounded per-artist buckets.
+"""
+import pytest
+from fastapi.testclient import TestClient
+from pymongo.errors import WriteError
+
+from config import Config
+from database import db
+from indexes import backfill_derived_fields, ensure_indexes
+from main import app
+from services.album_buckets import ALBUM_BUCKET_COLLECTION, DuplicateAlbum, album_page, append_album
+from services.artist_documents import prepare_artist_document
+
+client = TestClient(app)
+
+REGISTER = "/artists/register/discography?artist_name=Lorde"
+
+
+@pytest.fixture(autouse=True)
+def catalog(monkeypatch):
+    """Lorde with one embedded album, and buckets of two albums."""
+    monkeypatch.setattr(Config, "ALBUM_BUCKET_SIZE", 2)
+    db.artists.drop()
+    db[ALBUM_BUCKET_COLLECTION].drop()
+    ensure_indexes(db)
+    db.artists.insert_one(prepare_artist_document({
+        "name": "Lorde", "genre": "pop",
+        "albums": [{"title": "Pure Heroine", "year": "2013"}],
+    }))
+    yield
+    db.artists.drop()
+    db[ALBUM_BUCKET_COLLECTION].drop()
+
+
+def register(count):
+    for number in range(count):
+        response = client.post(REGISTER, json={
+            "title": f"Album {number}", "year": "2020",
+            "tracks": [{"title": f"Song {number}", "duration": 60 * (number + 1)}],
+        })
+        assert response.status_code == 200
+
+
+def titles(albums):
+    return [album["title"] for album in albums]
+
+
+def test_albums_go_to_bounded_buckets():
+    """Happy Path: The artist document keeps a count; albums fill buckets in order."""
+    register(5)
+    artist = db.artists.find_one({"name": "Lorde"})
+    assert titles(artist["albums"]) == ["Pure Heroine"]
+    assert artist["bucketed_albums"] == 5
+    buckets = list(db[ALBUM_BUCKET_COLLECTION].find().sort("bucket", 1))
+    assert [len(bucket["albums"]) for bucket in buckets] == [2, 2, 1]
+    assert buckets[2]["positions"] == [4]
+    assert titles(client.get("/artists/Lorde/albums").json()["albums"]) == \
+        ["Pure Heroine"] + [f"Album {number}" for number in range(5)]
+
+
+def test_duplicate_albums_are_rejected():
+    """Sad Path: The same title and year is a 409, for embedded and bucketed albums alike."""
+    register(1)
+    for album in ({"title": "album 0 ", "year": "2020"}, {"title": "Pure Heroine", "year": "2013"}):
+        response = client.post(REGISTER, json=album)
+        assert response.status_code == 409
+    assert client.post(REGISTER, json={"title": "Album 0", "year": "2021"}).status_code == 200
+    assert db.artists.find_one({"name": "Lorde"})["bucketed_albums"] == 2
+
+
+class FailingBucketWrites:
+    """The test database, except that writes to the album buckets fail."""
+
+    class Buckets:
+        def update_one(self, *args, **kwargs):
+            raise WriteError("no primary available")
+
+    def __getattr__(self, name):
+        return getattr(db, name)
+
+    def __getitem__(self, name):
+        return self.Buckets() if name == ALBUM_BUCKET_COLLECTION else db[name]
+
+
+def test_failed_bucket_write_gives_the_position_back():
+    """Sad Path: A bucket write that fails undoes the count and key it reserved."""
+    register(1)
+    with pytest.raises(WriteError):
+        append_album(FailingBucketWrites(), "Lorde", {"title": "Melodrama", "year": "2017"})
+    artist = db.artists.find_one({"name": "Lorde"})
+    assert artist["bucketed_albums"] == 1
+    assert "melodrama|2017" not in artist["album_keys"]
+    assert client.post(REGISTER, json={"title": "Melodrama", "year": "2017"}).status_code == 200
+    assert titles(album_page(db, db.artists.find_one({"name": "Lorde"}), 1, 5)) == \
+        ["Album 0", "Melodrama"]
+
+
+def test_album_pages_read_only_overlapping_buckets():
+    """Happy Path: offset and limit page across embedded and bucketed albums."""
+    register(5)
+    page = client.get("/artists/Lorde/albums", params={"offset": 2, "limit": 3}).json()["albums"]
+    assert titles(page) == ["Album 1", "Album 2", "Album 3"]
+    artist = db.artists.find_one({"name": "Lorde"}, {"albums": 1, "bucketed_albums": 1})
+    assert titles(album_page(db, artist, 0, 1)) == ["Pure Heroine"]
+    assert titles(album_page(db, artist, 5)) == ["Album 4"]
+    assert album_page(db, artist, 9, 2) == []
+    assert client.get("/artists/Lorde/albums", params={"limit": 0}).status_code == 400
+
+
+def test_artist_reads_include_bucketed_albums():
+    """Happy Path: Reads with albums get both kinds; the bucket count is never returned."""
+    register(3)
+    artist = client.get("/artists/Lorde").json()
+    assert titles(artist["albums"]) == ["Pure Heroine", "Album 0", "Album 1", "Album 2"]
+    assert "bucketed_albums" not in artist and "album_keys" not in artist
+    expanded = client.get("/artists/genre", params={"genre": "pop", "n": 5, "expand": "albums"})
+    albums = expanded.json()["results"][0]["albums"]
+    assert titles(albums) == titles(artist["albums"])
+    assert "tracks" not in albums[1]
+    names_only = client.get("/artists/Lorde", params={"fields": "name"}).json()
+    assert set(names_only) == {"_id", "name"}
+
+
+def test_bucketed_albums_are_found_by_title_and_runtime():
+    """Edge Case: Title and runtime lookups, and the backfill, cover the buckets."""
+    register(2)
+    assert client.get("/albums/album 1/description").json()["runtime_seconds"] == 120
+    albums = client.get("/albums", params={"min_minutes": 1.5}).json()["albums"]
+    assert [(album["artist"], album["title"]) for album in albums] == [("Lorde", "Album 1")]
+    db.artists.update_one({"name": "Lorde"}, {"$set": {"derived_version": 0}})
+    backfill_derived_fields(db)
+    with pytest.raises(DuplicateAlbum):
+        append_album(db, "Lorde", {"title": "Album 1", "year": "2020"})
+    assert append_album(db, "Nobody", {"title": "Album 1"}) is None
@@ -0,0 +1,83 @@
+"""
+Tests for the prefix autocomplete index and the /autocomplete endpoint.
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from database import db
+from main import app
+from services import autocomplete as autocomplete_module
+from services.artist_documents import prepare_artist_document
+from services.autocomplete import PrefixIndex, autocomplete
+
+client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def seeded():
+    """A few artists, with the indexes rebuilt from them."""
+    db.artists.drop()
+    db.artists.insert_many([prepare_artist_document(artist) for artist in [
+        {"name": "Bruce Springsteen", "genre": "rock", "location": "Long Branch, New Jersey, USA",
+         "albums": [{"title": "Born to Run"}, {"title": "Nebraska"}]},
+        {"name": "Bruno Mars", "genre": "pop", "location": "Honolulu, Hawaii, USA",
+         "albums": [{"title": "Doo-Wops & Hooligans"}]},
+        {"name": "Brian Eno", "genre": "ambient", "location": "London, England"},
+        {"name": "Lorde", "genre": "pop", "location": "London, England"},
+    ]])
+    autocomplete.load(db)
+    yield
+    db.artists.drop()
+    autocomplete.loaded = False
+
+
+def test_autocomplete_ranks_by_popularity():
+    """Happy Path: Prefix matches come back most popular first, case-insensitively."""
+    response = client.get("/autocomplete", params={"q": "BRU"})
+    assert response.status_code == 200
+    values = [item["value"] for item in response.json()["suggestions"]]
+    assert values == ["Bruce Springsteen", "Bruno Mars"]
+
+
+def test_autocomplete_locations_and_genres():
+    """Happy Path: Locations and genres are ranked by artist count."""
+    locations = client.get("/autocomplete", params={"q": "lo", "type": "location"}).json()
+    assert locations["suggestions"][0] == {"value": "London, England", "score": 2}
+    genres = client.get("/autocomplete", params={"q": "p", "type": "genre"}).json()
+    assert genres["suggestions"] == [{"value": "pop", "score": 2}]
+
+
+def test_autocomplete_updates_on_registration():
+    """Happy Path: Registered artists are suggested without a rebuild."""
+    client.post("/artists/register", json={
+        "name": "Brandi Carlile", "genre": "folk", "location": "Ravensdale, Washington, USA"
+    })
+    values = [item["value"] for item in client.get("/autocomplete", params={"q": "bran"}).json()["suggestions"]]
+    assert values == ["Brandi Carlile"]
+
+
+def test_no_suggestions_until_the_indexes_are_built(monkeypatch):
+    """Edge Case: Requests never build the indexes; they get no suggestions until startup has."""
+    autocomplete.loaded = False
+    monkeypatch.setattr(autocomplete, "load", lambda db: pytest.fail("built on a request"))
+    response = client.get("/autocomplete", params={"q": "bru"})
+    assert response.status_code == 200
+    assert response.json()["suggestions"] == []
+
+
+def test_autocomplete_rejects_unknown_type():
+    """Sad Path: Only artist, location and genre suggestions exist."""
+    assert client.get("/autocomplete", params={"q": "a", "type": "album"}).status_code == 400
+
+
+def test_prefix_index_precomputed_ranges(monkeypatch):
+    """Edge Case: Large ranges use precomputed top-k that registrations keep current."""
+    monkeypatch.setattr(autocomplete_module, "SCAN_LIMIT", 4)
+    index = PrefixIndex(top_k=3)
+    index.build((f"Artist {i:02d}", i) for i in range(20))
+    assert "artist" in index._top
+    assert [item["value"] for item in index.suggest("art")] == ["Artist 19", "Artist 18", "Artist 17"]
+    index.add("Artist 05", 100)
+    index.add("Artisan", 50)
+    assert [item["value"] for item in index.suggest("artis", limit=2)] == ["Artist 05", "Artisan"]
+    assert index.suggest("") == []
@@ -0,0 +1,125 @@
+"""
+Tests for the catalog changelog and cross-worker invalidation.
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+import services.catalog_changes as catalog_changes
+from database import db
+from main import app
+from services.album_buckets import ALBUM_BUCKET_COLLECTION, append_album
+from services.artist_documents import prepare_artist_document
+from services.catalog_changes import (
+    CATALOG_ID,
+    CHANGE_COLLECTION,
+    ChangeListener,
+    current_version,
+    publish_change,
+)
+from services.facets import facet_cache
+from services.snapshot import catalog_snapshot
+from utils.metrics import INVALIDATION_LAG
+from utils.response_cache import response_cache
+
+client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def catalog():
+    """A one-artist catalog, a loaded snapshot and an empty changelog."""
+    db.artists.drop()
+    db[CHANGE_COLLECTION].drop()
+    db[ALBUM_BUCKET_COLLECTION].drop()
+    db.artists.insert_one(prepare_artist_document({"name": "Lorde", "genre": "pop", "location": "Auckland"}))
+    catalog_snapshot.load(db)
+    response_cache.clear()
+    yield
+    db.artists.drop()
+    db[CHANGE_COLLECTION].drop()
+    db[ALBUM_BUCKET_COLLECTION].drop()
+    catalog_snapshot.loaded = False
+    response_cache.clear()
+
+
+def write_from_another_worker(monkeypatch, kind, artist):
+    """Publish a change as if another worker had made it."""
+    with monkeypatch.context() as patch:
+        patch.setattr(catalog_changes, "origin", lambda: "elsewhere:1")
+        return publish_change(db, kind, artist)
+
+
+def cache(path, query):
+    response_cache.put((path, query), 200, [], b"{}")
+
+
+def test_registration_publishes_change():
+    """Happy Path: Writes bump the version; the writing worker skips its own changes."""
+    listener = ChangeListener(1)
+    listener.sync(db)
+    client.post("/artists/register", json={"name": "Lana Del Rey", "genre": "pop", "location": "New York"})
+    client.post("/artists/register/discography?artist_name=Lorde", json={"title": "Melodrama", "year": "2017"})
+    assert current_version(db) == 2
+    changes = db[CHANGE_COLLECTION].find_one({"_id": CATALOG_ID})["changes"]
+    assert [(change["kind"], change["name"], change["genre"]) for change in changes] == [
+        ("artist_added", "Lana Del Rey", "pop"), ("album_added", "Lorde", "pop"),
+    ]
+    assert listener.sync(db) == 0
+    assert listener.version == 2
+
+
+def test_other_workers_changes_evict_affected_entries(monkeypatch):
+    """Happy Path: Only the changed genre's responses and the facets are evicted."""
+    listener = ChangeListener(1)
+    listener.sync(db)
+    cache("/artists/genre", b"genre=Rock&n=5")
+    cache("/artists/genre", b"genre=pop&n=5")
+    cache("/artists", b"genre=rock&country=usa")
+    cache("/artists", b"country=usa")
+    cache("/facets", b"")
+    facet_cache.facets(db)
+    lag_before = INVALIDATION_LAG.count()
+
+    document = prepare_artist_document({"name": "Nirvana", "genre": "rock", "location": "Aberdeen, USA"})
+    db.artists.insert_one(document)
+    write_from_another_worker(monkeypatch, "artist_added", document)
+
+    assert listener.sync(db) == 1
+    assert sorted(response_cache._entries) == [("/artists/genre", b"genre=pop&n=5")]
+    assert facet_cache._rows is None
+    assert catalog_snapshot.find_by_name("nirvana")["genre"] == "rock"
+    assert INVALIDATION_LAG.count() == lag_before + 1
+
+
+def test_other_workers_albums_reach_snapshot(monkeypatch):
+    """Happy Path: An album added elsewhere is re-read into the snapshot."""
+    listener = ChangeListener(1)
+    listener.sync(db)
+    artist = append_album(db, "Lorde", {"title": "Melodrama", "year": "2017"})
+    write_from_another_worker(monkeypatch, "album_added", artist)
+    assert listener.sync(db) == 1
+    albums = catalog_snapshot.find_by_name("lorde")["albums"]
+    assert [album["title"] for album in albums] == ["Melodrama"]
+
+
+def test_changelog_is_bounded(monkeypatch):
+    """Edge Case: The changelog keeps the newest entries; a worker further behind reloads."""
+    monkeypatch.setattr(catalog_changes, "CHANGELOG_LENGTH", 2)
+    artist = db.artists.find_one({"name": "Lorde"})
+    listener = ChangeListener(1)
+    listener.sync(db)
+    cache("/artists/genre", b"genre=rock&n=5")
+    for _ in range(3):
+        write_from_another_worker(monkeypatch, "album_added", artist)
+    assert len(db[CHANGE_COLLECTION].find_one({"_id": CATALOG_ID})["changes"]) == 2
+
+    assert listener.sync(db) == 0
+    assert listener.version == 3
+    assert len(response_cache) == 0
+
+
+def test_disabled_listener_does_not_start():
+    """Sad Path: CATALOG_POLL_SECONDS=0 turns the listener off."""
+    listener = ChangeListener(0)
+    listener.start(db)
+    assert listener.version is None
+    assert listener._threads == []
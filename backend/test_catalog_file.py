@@ -0,0 +1,142 @@
+"""
+Tests for the memory-mapped binary catalog file.
+"""
+import json
+import math
+
+import pytest
+from fastapi.testclient import TestClient
+
+from config import Config
+from database import db
+from main import app
+from services.album_buckets import ALBUM_BUCKET_COLLECTION
+from services.artist_documents import prepare_artist_document
+from services.catalog_changes import CHANGE_COLLECTION
+from services.catalog_file import (
+    CatalogFile,
+    CatalogFileError,
+    export_catalog,
+    json_catalog_documents,
+    stamp_catalog_version,
+    write_catalog_file,
+)
+from services.snapshot import catalog_snapshot
+
+client = TestClient(app)
+
+ARTISTS = [
+    {"name": "Lorde", "genre": "pop", "location": "Auckland, New Zealand", "summary": "Kiwi singer",
+     "coordinates": {"latitude": -36.85, "longitude": 174.76},
+     "albums": [{"title": "Pure Heroine", "year": "2013", "tracks": [{"title": "Royals", "duration": "3:10"}]}]},
+    {"name": "Björk", "genre": "electronic", "location": "Reykjavík, Iceland"},
+    {"name": "Unknown Genre"},
+]
+
+
+@pytest.fixture
+def catalog_path(tmp_path):
+    return str(tmp_path / "catalog.bin")
+
+
+@pytest.fixture
+def stored():
+    """The artists, stored; the changelog and buckets empty."""
+    db.artists.drop()
+    db[CHANGE_COLLECTION].drop()
+    db[ALBUM_BUCKET_COLLECTION].drop()
+    db.artists.insert_many([prepare_artist_document(artist) for artist in ARTISTS])
+    yield
+    db.artists.drop()
+    db[CHANGE_COLLECTION].drop()
+    db[ALBUM_BUCKET_COLLECTION].drop()
+    catalog_snapshot.loaded = False
+
+
+def test_columns_and_documents_round_trip(stored, catalog_path):
+    """Happy Path: Columns read without decoding; blobs decode to the stored documents."""
+    documents = list(db.artists.find().sort("_id", 1))
+    assert write_catalog_file(documents, catalog_path, catalog_version=7) == 3
+    catalog = CatalogFile(catalog_path)
+    try:
+        assert (len(catalog), catalog.catalog_version) == (3, 7)
+        assert [catalog.name(index) for index in range(3)] == ["Lorde", "Björk", "Unknown Genre"]
+        assert [catalog.genre(index) for index in range(3)] == ["pop", "electronic", None]
+        assert catalog.coordinates(0) == (-36.85, 174.76)
+        assert catalog.coordinates(1) is None and math.isnan(catalog.latitude[2])
+        assert catalog.id(1) == documents[1]["_id"]
+        assert catalog.document(0) == documents[0]
+        assert list(catalog.documents(batch_size=2)) == documents
+        assert [raw["name"] for raw in catalog.raw_documents(1)] == ["Björk", "Unknown Genre"]
+    finally:
+        catalog.close()
+
+
+def test_stamp_records_a_new_version(stored, catalog_path):
+    """Happy Path: Stamping rewrites only the catalog version."""
+    export_catalog(catalog_path, db=db)
+    stamp_catalog_version(catalog_path, 1234)
+    catalog = CatalogFile(catalog_path)
+    try:
+        assert (len(catalog), catalog.catalog_version) == (3, 1234)
+        assert catalog.name(2) == "Unknown Genre"
+    finally:
+        catalog.close()
+
+
+def test_rejects_other_files(tmp_path):
+    """Sad Path: Empty, short or foreign files are not catalog files."""
+    for content in (b"", b"CFYBCAT1", b"x" * 4096):
+        path = tmp_path / "other.bin"
+        path.write_bytes(content)
+        with pytest.raises(CatalogFileError):
+            CatalogFile(str(path))
+
+
+def test_json_catalogs_keep_an_artists_first_genre(tmp_path):
+    """Happy Path: Genre-keyed JSON and NDJSON both become stored documents, deduplicated by name."""
+    keyed = tmp_path / "catalog.json"
+    keyed.write_text(json.dumps({"rock": [{"name": "Nirvana"}], "grunge": [{"name": " nirvana"}]}, indent=4))
+    lines = tmp_path / "catalog.ndjson"
+    lines.write_text('{"name": "Nirvana", "genre": "rock"}\n\n{"name": "NIRVANA", "genre": "grunge"}\n')
+    for path in (keyed, lines):
+        documents = list(json_catalog_documents(str(path)))
+        assert [(document["name_normalized"], document["genre"]) for document in documents] == [
+            ("nirvana", "rock")
+        ]
+
+
+def test_snapshot_loads_from_file_and_replays_later_changes(stored, catalog_path, monkeypatch):
+    """Happy Path: Writes after the export are re-read; albums and summaries come from the file."""
+    assert export_catalog(catalog_path, db=db) == 3
+    client.post("/artists/register", json={"name": "Phoebe Bridgers", "genre": "indie", "location": "LA"})
+    client.post("/artists/register/discography?artist_name=Björk", json={"title": "Homogenic", "year": "1997"})
+    monkeypatch.setattr(Config, "CATALOG_FILE", catalog_path)
+    catalog_snapshot.load(db)
+    assert catalog_snapshot._file is not None and len(catalog_snapshot) == 4
+    lorde = catalog_snapshot.find_by_name("lorde")
+    assert lorde["summary"] == "Kiwi singer"
+    assert lorde["albums"][0]["tracks"][0]["duration_seconds"] == 190
+    assert [album["title"] for album in catalog_snapshot.find_by_name("björk")["albums"]] == ["Homogenic"]
+    assert catalog_snapshot.find_by_name("phoebe bridgers")["genre"] == "indie"
+    catalog_snapshot.record_album_added("Lorde", {"title": "Melodrama", "year": "2017"})
+    assert len(catalog_snapshot.find_by_name("lorde")["albums"]) == 2
+
+
+def test_snapshot_ignores_a_file_that_does_not_match(stored, catalog_path, monkeypatch):
+    """Edge Case: A file behind the database without changelog entries is not used."""
+    export_catalog(catalog_path, db=db)
+    db.artists.insert_one(prepare_artist_document({"name": "Seeded Later", "genre": "rock"}))
+    monkeypatch.setattr(Config, "CATALOG_FILE", catalog_path)
+    assert catalog_snapshot.load_file(db, catalog_path) is False
+    catalog_snapshot.load(db)
+    assert catalog_snapshot._file is None
+    assert catalog_snapshot.find_by_name("seeded later")["genre"] == "rock"
+
+
+def test_snapshot_ignores_a_file_with_other_ids(stored, catalog_path, tmp_path):
+    """Sad Path: An export of the same JSON has other _ids, so it does not match the database."""
+    source = tmp_path / "catalog.ndjson"
+    source.write_text("\n".join(json.dumps(artist) for artist in ARTISTS))
+    assert export_catalog(catalog_path, source=str(source)) == 3
+    assert catalog_snapshot.load_file(db, catalog_path) is False
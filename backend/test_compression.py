@@ -0,0 +1,121 @@
+"""
+Tests for negotiated response compression and the response cache.
+"""
+import gzip
+import json
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from main import app
+from utils.compression import CompressionMiddleware, negotiate
+from utils.metrics import COMPRESSED_RESPONSES
+from utils.response_cache import ResponseCache, ResponseCacheMiddleware
+
+client = TestClient(app)
+
+LARGE = {"results": [{"name": f"Artist {i}", "genre": "rock"} for i in range(200)]}
+
+
+def _app(cache=None):
+    """A small app with the compression (and optionally cache) middleware."""
+    calls = []
+    test_app = FastAPI()
+
+    @test_app.get("/large")
+    def large():
+        calls.append("large")
+        return LARGE
+
+    @test_app.get("/small")
+    def small():
+        return {"ok": True}
+
+    @test_app.post("/write")
+    def write():
+        return {"ok": True}
+
+    @test_app.post("/artists/batch")
+    def batch():
+        return {"results": {}}
+
+    if cache is not None:
+        test_app.add_middleware(ResponseCacheMiddleware, cache=cache, minimum_size=500)
+    test_app.add_middleware(CompressionMiddleware, minimum_size=500)
+    return TestClient(test_app), calls
+
+
+def test_negotiate_prefers_quality_then_server_order():
+    """Happy Path: The highest quality wins and gzip is always available."""
+    assert negotiate("gzip") == "gzip"
+    assert negotiate("gzip;q=0.5, identity") == "gzip"
+    assert negotiate("*") is not None
+    assert negotiate("gzip;q=0, deflate") is None
+    assert negotiate("") is None
+
+
+def test_large_json_is_gzipped():
+    """Happy Path: Bodies over the threshold are compressed and flagged."""
+    test_client, _ = _app()
+    response = test_client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert int(response.headers["content-length"]) < len(json.dumps(LARGE))
+    assert response.json() == LARGE
+
+
+def test_small_or_unaccepted_bodies_are_sent_as_is():
+    """Edge Case: Below the threshold or without Accept-Encoding, nothing changes."""
+    test_client, _ = _app()
+    small = test_client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+    plain = test_client.get("/large", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert plain.json() == LARGE
+
+
+def test_cached_response_is_compressed_once():
+    """Happy Path: Hits reuse the stored gzip variant instead of recompressing."""
+    cache = ResponseCache(ttl_seconds=60, max_entries=10, paths=["/large"])
+    test_client, calls = _app(cache)
+    before = COMPRESSED_RESPONSES.value("gzip", "cache")
+    first = test_client.get("/large", headers={"Accept-Encoding": "gzip"})
+    second = test_client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert calls == ["large"]
+    assert first.content == second.content
+    entry = cache.get(("/large", b""))
+    assert gzip.decompress(entry.variants["gzip"]) == entry.body
+    assert COMPRESSED_RESPONSES.value("gzip", "cache") == before + 2
+
+    plain = test_client.get("/large", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert plain.json() == LARGE
+    assert calls == ["large"]
+
+
+def test_writes_clear_the_response_cache():
+    """Edge Case: A successful write drops cached responses."""
+    cache = ResponseCache(ttl_seconds=60, max_entries=10, paths=["/large"])
+    test_client, calls = _app(cache)
+    test_client.get("/large")
+    test_client.post("/write")
+    test_client.get("/large")
+    assert calls == ["large", "large"]
+
+
+def test_batch_lookups_keep_the_response_cache():
+    """Edge Case: POST /artists/batch only reads, so cached GETs survive it."""
+    cache = ResponseCache(ttl_seconds=60, max_entries=10, paths=["/large"])
+    test_client, calls = _app(cache)
+    test_client.get("/large")
+    assert test_client.post("/artists/batch").status_code == 200
+    test_client.get("/large")
+    assert calls == ["large"]
+    assert len(cache) == 1
+
+
+def test_api_compresses_large_responses():
+    """Happy Path: The app itself negotiates compression."""
+    response = client.get("/openapi.json", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
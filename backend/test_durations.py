@@ -0,0 +1,49 @@
+"""
+Tests for duration parsing and the precomputed album runtimes.
+"""
+from services.artist_documents import normalize_album, prepare_artist_document
+from utils.durations import format_duration, parse_duration
+
+
+def test_parse_duration_formats():
+    """Happy Path: Seconds and m:ss / h:mm:ss strings parse to whole seconds."""
+    assert parse_duration(245) == 245
+    assert parse_duration(245.9) == 245
+    assert parse_duration("4:05") == 245
+    assert parse_duration(" 1:02:03 ") == 3723
+    assert parse_duration("75:00") == 4500
+
+
+def test_parse_duration_rejects_garbage():
+    """Sad Path: Unparseable, negative and out-of-range values give None."""
+    for value in (None, "", "n/a", "4:5x", "4:65", "1:2:3:4", -1, True, ":30"):
+        assert parse_duration(value) is None
+
+
+def test_format_duration():
+    """Happy Path: m:ss below an hour, h:mm:ss from an hour up."""
+    assert format_duration(245) == "4:05"
+    assert format_duration(3723) == "1:02:03"
+    assert format_duration(None) is None
+
+
+def test_normalize_album_precomputes_runtime():
+    """Happy Path: Tracks get both forms and the album its runtime and track count."""
+    album = normalize_album({"title": "Nebraska", "tracks": [
+        {"title": "Nebraska", "duration": "4:32"},
+        {"title": "Atlantic City", "duration": 236},
+        {"title": "Untimed"},
+    ]})
+    assert album["tracks"][1] == {"title": "Atlantic City", "duration": "3:56", "duration_seconds": 236}
+    assert album["tracks"][2]["duration_seconds"] is None
+    assert (album["runtime_seconds"], album["track_count"]) == (508, 3)
+    assert normalize_album(album) == album
+
+
+def test_prepare_artist_document_leaves_source_untouched():
+    """Edge Case: Shared source track dicts are copied, not mutated."""
+    track = {"title": "Jungleland", "duration": 574}
+    document = prepare_artist_document({"name": "Bruce", "albums": [{"title": "Born", "tracks": [track]}]})
+    assert document["albums"][0]["runtime_seconds"] == 574
+    assert track == {"title": "Jungleland", "duration": 574}
+    assert prepare_artist_document({"name": "Lorde"}).get("albums") is None
@@ -0,0 +1,91 @@
+"""
+Tests for the materialized facet counts and the /facets endpoint.
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from database import db
+from main import app
+from services.artist_documents import prepare_artist_document
+from services.facets import (
+    FACET_COLLECTION,
+    compute_facets,
+    ensure_facet_counts,
+    facet_cache,
+    rebuild_facet_counts,
+)
+
+client = TestClient(app)
+
+ARTISTS = [
+    {"name": "A", "genre": "rock", "location": "Seattle, Washington, USA"},
+    {"name": "B", "genre": "rock", "location": "Seattle, Washington, USA"},
+    {"name": "C", "genre": "rock", "location": "London, England"},
+    {"name": "D", "genre": "jazz", "location": "London, England"},
+    {"name": "E", "genre": "jazz", "location": "Tokyo, Japan"},
+]
+
+
+@pytest.fixture(autouse=True)
+def seeded():
+    """Seed a small catalog and materialize its facet counts."""
+    db.artists.drop()
+    db[FACET_COLLECTION].drop()
+    db.artists.insert_many([prepare_artist_document(artist) for artist in ARTISTS])
+    rebuild_facet_counts(db)
+    yield
+    db.artists.drop()
+    db[FACET_COLLECTION].drop()
+    facet_cache.invalidate()
+
+
+def test_facets_unfiltered():
+    """Happy Path: Every value is counted, most common first."""
+    response = client.get("/facets")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 5
+    assert data["genres"] == [{"genre": "rock", "count": 3}, {"genre": "jazz", "count": 2}]
+    assert data["countries"][0] == {"country": "united kingdom", "count": 2}
+    assert {"city": "seattle", "country": "united states", "count": 2} in data["cities"]
+
+
+def test_facets_exclude_their_own_filter():
+    """Happy Path: A genre filter narrows locations but still lists every genre."""
+    data = client.get("/facets", params={"genre": "Jazz", "country": "UK"}).json()
+    assert data["total"] == 1
+    assert data["genres"] == [{"genre": "jazz", "count": 1}, {"genre": "rock", "count": 1}]
+    assert data["countries"] == [
+        {"country": "japan", "count": 1}, {"country": "united kingdom", "count": 1}
+    ]
+    assert data["cities"] == [{"city": "london", "country": "united kingdom", "count": 1}]
+
+
+def test_registration_updates_facets():
+    """Happy Path: Registering an artist is reflected without a rebuild."""
+    assert client.get("/facets").json()["total"] == 5
+    response = client.post("/artists/register", json={
+        "name": "F", "genre": "Jazz", "location": "Tokyo, Japan"
+    })
+    assert response.status_code == 200
+    data = client.get("/facets", params={"city": "tokyo"}).json()
+    assert data["total"] == 2
+    assert data["genres"] == [{"genre": "jazz", "count": 2}]
+
+
+def test_ensure_facet_counts_builds_missing_collection():
+    """Edge Case: Startup materializes the counts only when they are missing."""
+    db[FACET_COLLECTION].drop()
+    ensure_facet_counts(db)
+    assert sum(doc["count"] for doc in db[FACET_COLLECTION].find()) == 5
+    db[FACET_COLLECTION].delete_many({"_id.genre": "jazz"})
+    ensure_facet_counts(db)
+    assert sum(doc["count"] for doc in db[FACET_COLLECTION].find()) == 3
+
+
+def test_compute_facets_skips_missing_values():
+    """Edge Case: Artists without a city or country count only toward the total."""
+    data = compute_facets([("rock", None, None, 2), ("rock", "japan", "tokyo", 1)])
+    assert data["total"] == 3
+    assert data["countries"] == [{"country": "japan", "count": 1}]
+    assert data["cities"] == [{"city": "tokyo", "country": "japan", "count": 1}]
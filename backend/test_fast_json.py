@@ -0,0 +1,46 @@
+"""
+Tests for the raw BSON to JSON response fast path.
+"""
+import json
+
+from bson import ObjectId
+
+from database import db
+from utils import fast_json
+from utils.fast_json import FastJSONResponse, dumps, find_documents
+
+
+def test_dumps_encodes_object_ids():
+    """Happy Path: ObjectIds are emitted as their hex string."""
+    object_id = ObjectId()
+    assert json.loads(dumps({"_id": object_id, "name": "Björk"})) == {
+        "_id": str(object_id), "name": "Björk"
+    }
+
+
+def test_dumps_without_orjson_matches(monkeypatch):
+    """Edge Case: The standard json fallback produces the same document."""
+    content = {"_id": ObjectId(), "results": [{"name": "Sigur Rós", "rating": 4.5}]}
+    fast = dumps(content)
+    monkeypatch.setattr(fast_json, "orjson", None)
+    assert json.loads(dumps(content)) == json.loads(fast)
+
+
+def test_find_documents_reads_raw_batches():
+    """Happy Path: Documents come back decoded, projected and limited."""
+    db.fast_json_test.drop()
+    db.fast_json_test.insert_many([{"name": f"Artist {i}", "secret": i} for i in range(250)])
+    try:
+        documents = find_documents(db.fast_json_test, {}, {"secret": 0}, limit=120)
+        assert len(documents) == 120
+        assert all(isinstance(doc["_id"], ObjectId) and "secret" not in doc for doc in documents)
+        assert len(find_documents(db.fast_json_test)) == 250
+    finally:
+        db.fast_json_test.drop()
+
+
+def test_fast_json_response_body():
+    """Happy Path: The response carries the encoded bytes as application/json."""
+    response = FastJSONResponse({"results": []})
+    assert response.body == b'{"results":[]}'
+    assert response.headers["content-type"] == "application/json"
@@ -0,0 +1,113 @@
+"""
+Test cases for federated search across the local database and cloud service.
+"""
+import time
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app, db
+from services.artist_documents import prepare_artist_document
+from services.cloud_service_client import CloudServiceConnectionError
+from services.federated_search import merge_artist_results
+
+client = TestClient(app)
+
+
+def insert_artist(document):
+    """Store an artist the way the app does, with its derived fields."""
+    db.artists.insert_one(prepare_artist_document(document))
+
+
+@pytest.fixture(autouse=True)
+def setup_teardown():
+    """Fixture to clear the database before and after each test."""
+    db.artists.delete_many({})
+    yield
+    db.artists.delete_many({})
+
+
+def test_merge_dedupes_by_normalized_name():
+    """Happy Path: Artists with the same normalized name are merged once."""
+    merged = merge_artist_results({
+        "local": [{"name": "Bruce Springsteen", "genre": "rock", "city": None}],
+        "cloud": [
+            {"name": "  bruce   SPRINGSTEEN ", "city": "Long Branch"},
+            {"name": "Madonna"},
+        ],
+    })
+    assert [artist["name"] for artist in merged] == ["Bruce Springsteen", "Madonna"]
+    assert merged[0]["sources"] == ["local", "cloud"]
+    assert merged[0]["genre"] == "rock"
+    assert merged[0]["city"] == "Long Branch"
+    assert merged[1]["sources"] == ["cloud"]
+
+
+def test_merge_skips_nameless_entries():
+    """Sad Path: Entries without a usable name are dropped."""
+    merged = merge_artist_results({"cloud": [{"name": ""}, {"city": "Gary"}, "junk"]})
+    assert merged == []
+
+
+@patch("config.config.AWS_URL", "https://test.example.com")
+@patch("config.config.AWS_TOKEN", "test-token")
+@patch("main.CloudServiceClient.get")
+def test_federated_merges_both_sources(mock_get):
+    """Happy Path: Local and cloud results are merged and not flagged partial."""
+    insert_artist({"name": "Bruce Springsteen", "genre": "rock"})
+    mock_get.return_value = {"results": [
+        {"name": "bruce springsteen", "country": "United States"},
+        {"name": "Pearl Jam", "country": "United States"},
+    ]}
+
+    response = client.get("/federated/artists?genre=rock")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["partial"] is False
+    assert data["sources"]["local"]["status"] == "ok"
+    assert data["sources"]["cloud"]["status"] == "ok"
+    names = sorted(artist["name"] for artist in data["results"])
+    assert names == ["Bruce Springsteen", "Pearl Jam"]
+
+
+@patch("config.config.AWS_URL", "https://test.example.com")
+@patch("config.config.AWS_TOKEN", "test-token")
+@patch("main.CloudServiceClient.get")
+def test_federated_returns_partial_on_deadline(mock_get):
+    """Sad Path: A cloud call that misses the deadline yields partial local results."""
+    insert_artist({"name": "Bruce Springsteen", "genre": "rock"})
+
+    def slow_get(*args, **kwargs):
+        time.sleep(1)
+        return {"results": [{"name": "Pearl Jam"}]}
+
+    mock_get.side_effect = slow_get
+
+    started = time.perf_counter()
+    response = client.get("/federated/artists?genre=rock&deadline_ms=200")
+    elapsed = time.perf_counter() - started
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["partial"] is True
+    assert data["sources"]["cloud"]["status"] == "timeout"
+    assert [artist["name"] for artist in data["results"]] == ["Bruce Springsteen"]
+    assert elapsed < 1
+
+
+@patch("config.config.AWS_URL", "https://test.example.com")
+@patch("config.config.AWS_TOKEN", "test-token")
+@patch("main.CloudServiceClient.get")
+def test_federated_returns_partial_on_cloud_error(mock_get):
+    """Sad Path: A failing cloud service yields partial local results."""
+    insert_artist({"name": "Bruce Springsteen", "genre": "rock"})
+    mock_get.side_effect = CloudServiceConnectionError("connection refused by internal-host:8443")
+
+    response = client.get("/federated/artists")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["partial"] is True
+    assert data["sources"]["cloud"] == {"status": "error", "count": 0, "error": "source_unavailable"}
+    assert "internal-host" not in response.text
+    assert len(data["results"]) == 1
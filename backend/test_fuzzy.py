@@ -0,0 +1,98 @@
+"""
+Tests for the trigram fuzzy name index, /artists/fuzzy and the did-you-mean
+header on artist 404s.
+"""
+from urllib.parse import unquote
+
+import pytest
+from fastapi.testclient import TestClient
+
+from database import db
+from main import app
+from services.artist_documents import prepare_artist_document
+from services.fuzzy import TrigramIndex, fuzzy_names, similarity, trigrams
+
+client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def seeded():
+    """A few artists, with the index rebuilt from them."""
+    db.artists.drop()
+    db.artists.insert_many([prepare_artist_document(artist) for artist in [
+        {"name": "Bruce Springsteen", "genre": "rock", "location": "Long Branch, New Jersey, USA"},
+        {"name": "Bruno Mars", "genre": "pop", "location": "Honolulu, Hawaii, USA"},
+        {"name": "Björk", "genre": "electronic", "location": "Reykjavík, Iceland"},
+        {"name": "Lorde", "genre": "pop", "location": "Auckland, New Zealand"},
+    ]])
+    fuzzy_names.load(db)
+    yield
+    db.artists.drop()
+    fuzzy_names.loaded = False
+
+
+def test_trigrams_match_pg_trgm():
+    """Happy Path: Words are padded like pg_trgm before splitting."""
+    assert trigrams("cat") == {"  c", " ca", "cat", "at "}
+    assert similarity(trigrams("bruce springsteen"), trigrams("bruce springsteen")) == 1.0
+
+
+def test_fuzzy_endpoint_finds_misspelled_name():
+    """Happy Path: A misspelled name finds the artist, best match first."""
+    response = client.get("/artists/fuzzy", params={"q": "Bruce Springstein"})
+    assert response.status_code == 200
+    matches = response.json()["matches"]
+    assert matches[0]["name"] == "Bruce Springsteen"
+    assert 0.5 < matches[0]["score"] < 1
+
+
+def test_fuzzy_matches_ignore_accents():
+    """Happy Path: Names are compared normalized."""
+    matches = client.get("/artists/fuzzy", params={"q": "bjork"}).json()["matches"]
+    assert matches == [{"name": "Björk", "score": 1.0}]
+
+
+def test_missing_artist_suggests_names():
+    """Happy Path: The 404 body is unchanged and the header carries suggestions."""
+    response = client.get("/artists/Bruce Springstein")
+    assert response.status_code == 404
+    assert response.json() == {"detail": "No artist found with name 'Bruce Springstein'!"}
+    suggestions = [unquote(name) for name in response.headers["x-did-you-mean"].split(",")]
+    assert suggestions[0] == "Bruce Springsteen"
+
+
+def test_fuzzy_updates_on_registration():
+    """Happy Path: Registered artists are matched without a rebuild."""
+    client.post("/artists/register", json={
+        "name": "Brandi Carlile", "genre": "folk", "location": "Ravensdale, Washington, USA"
+    })
+    matches = client.get("/artists/fuzzy", params={"q": "brandy carlisle"}).json()["matches"]
+    assert matches[0]["name"] == "Brandi Carlile"
+
+
+def test_fuzzy_without_close_names():
+    """Sad Path: Nothing similar enough gives no matches and no header."""
+    assert client.get("/artists/fuzzy", params={"q": "zzzz"}).json()["matches"] == []
+    assert "x-did-you-mean" not in client.get("/artists/zzzz").headers
+    assert client.get("/artists/fuzzy", params={"q": "bruno", "limit": 0}).status_code == 400
+
+
+def test_no_matches_until_the_index_is_built(monkeypatch):
+    """Edge Case: Requests never build the index; they get no matches until startup has."""
+    fuzzy_names.loaded = False
+    monkeypatch.setattr(fuzzy_names, "load", lambda db: pytest.fail("built on a request"))
+    assert client.get("/artists/fuzzy", params={"q": "Bruce Springstein"}).json()["matches"] == []
+    response = client.get("/artists/Bruce Springstein")
+    assert response.status_code == 404
+    assert "x-did-you-mean" not in response.headers
+
+
+def test_search_reads_bounded_postings(monkeypatch):
+    """Edge Case: Only the rarest lists are scanned, and the match is still found."""
+    from services import fuzzy
+
+    monkeypatch.setattr(fuzzy, "POSTING_BUDGET", 10)
+    index = TrigramIndex()
+    index.build([f"The Band {i}" for i in range(200)] + ["The Bangles"])
+    assert index.search("the bangels", limit=1)[0]["name"] == "The Bangles"
+    assert index.search("") == []
@@ -0,0 +1,86 @@
+"""
+Tests for the synthetic catalog generator.
+"""
+import io
+import json
+
+import pytest
+
+from resources.generate_catalog import (
+    CatalogModel,
+    NameDeduper,
+    duration_seconds,
+    generate_artists,
+    generate_lines,
+    write_catalog,
+)
+from utils.text import normalize_text
+
+
+@pytest.fixture
+def model():
+    """A small model learned from in-memory source artists."""
+    model = CatalogModel()
+    for index in range(30):
+        model.learn_artist("rock", {"name": f"The Band {index}", "country": "United States",
+                                    "city": "Seattle"})
+    for index in range(10):
+        model.learn_artist("jazz", {"name": f"Trio{index}", "location": "London, United Kingdom"})
+    return model
+
+
+def test_duration_seconds_parses_both_formats():
+    """Happy Path: Integer seconds and "m:ss" strings are both accepted."""
+    assert duration_seconds(245) == 245
+    assert duration_seconds("4:05") == 245
+    assert duration_seconds("") is None
+    assert duration_seconds("n/a") is None
+
+
+def test_generation_is_deterministic_by_seed(model):
+    """Happy Path: The same seed gives the same catalog, another seed does not."""
+    first = list(generate_lines(model, 200, seed=7, chunk_size=50))
+    assert first == list(generate_lines(model, 200, seed=7, chunk_size=50))
+    assert first != list(generate_lines(model, 200, seed=8, chunk_size=50))
+
+
+def test_genre_mix_and_places_follow_the_model(model):
+    """Happy Path: Genre counts are proportional and places come from the sources."""
+    artists = list(generate_artists(model, 400, seed=1))
+    genres = [artist["genre"] for artist in artists]
+    assert genres.count("rock") == 300
+    assert genres.count("jazz") == 100
+    assert {artist["location"] for artist in artists} == {
+        "Seattle, United States", "London, United Kingdom"
+    }
+    seattle = next(artist for artist in artists if artist["city"] == "Seattle")
+    assert abs(seattle["coordinates"]["latitude"] - 47.6062) < 0.1
+    for album in artists[0]["albums"]:
+        assert all(isinstance(track["duration"], int) for track in album["tracks"])
+
+
+def test_names_are_unique_after_normalization(model):
+    """Happy Path: Repeated names get a numeric suffix, in dicts and in encoded lines."""
+    lines = list(generate_lines(model, 500, seed=3))
+    names = [json.loads(line)["name"] for _, line in lines]
+    assert len({normalize_text(name) for name in names}) == 500
+    assert any(name.endswith(" (2)") for name in names)
+    assert names == [artist["name"] for artist in generate_artists(model, 500, seed=3)]
+
+
+def test_name_deduper_skips_taken_suffixes():
+    """Edge Case: A suffixed name already in use is skipped."""
+    deduper = NameDeduper()
+    assert deduper.unique("Prince (2)") is None
+    assert deduper.unique("Prince") is None
+    assert deduper.unique("PRINCE") == "PRINCE (3)"
+
+
+def test_json_format_is_keyed_by_genre(model):
+    """Happy Path: The JSON layout groups artists under their genre without a genre field."""
+    output = io.StringIO()
+    lines = generate_lines(model, 40, seed=2, include_genre=False)
+    assert write_catalog(lines, output, "json") == 40
+    catalog = json.loads(output.getvalue())
+    assert sorted(catalog) == ["jazz", "rock"]
+    assert "genre" not in catalog["rock"][0]
@@ -0,0 +1,123 @@
+"""
+Tests for race-free registration and Idempotency-Key replays.
+"""
+import pytest
+from pymongo.errors import ConnectionFailure
+from fastapi.testclient import TestClient
+
+from database import db
+from indexes import INDEXES, ensure_indexes, index_drift, unique_artist_names
+import main
+from main import app
+from services.album_buckets import ALBUM_BUCKET_COLLECTION
+from services.idempotency import IDEMPOTENCY_COLLECTION
+
+client = TestClient(app)
+
+ARTIST = {"genre": "Rock", "name": "The Replays", "location": "Austin, Texas, USA"}
+
+
+@pytest.fixture(autouse=True)
+def indexed():
+    """Empty, indexed artists and idempotency collections."""
+    db.artists.drop()
+    db[IDEMPOTENCY_COLLECTION].drop()
+    db[ALBUM_BUCKET_COLLECTION].drop()
+    ensure_indexes(db)
+    yield
+    db.artists.drop()
+    db[IDEMPOTENCY_COLLECTION].drop()
+    db[ALBUM_BUCKET_COLLECTION].drop()
+
+
+def test_register_response_built_from_inserted_document():
+    """Happy Path: The response is the stored document minus the derived fields."""
+    response = client.post("/artists/register", json=ARTIST)
+    assert response.status_code == 200
+    artist = response.json()["artist"]
+    stored = db.artists.find_one({"name": "The Replays"})
+    assert artist["_id"] == str(stored["_id"])
+    assert artist["genre"] == "rock"
+    assert artist["city"] == "austin"
+    assert "name_normalized" not in artist and "geo" not in artist
+
+
+def test_unique_index_rejects_duplicate_names():
+    """Sad Path: Names equal once normalized are rejected by the index itself."""
+    client.post("/artists/register", json=ARTIST)
+    response = client.post("/artists/register", json=dict(ARTIST, name="  the   REPLAYS "))
+    assert response.status_code == 409
+    assert db.artists.count_documents({}) == 1
+
+
+def test_duplicate_names_rejected_without_the_unique_index(monkeypatch):
+    """Sad Path: While the unique index is missing, names are checked before inserting."""
+    db.artists.drop_index("name_normalized")
+    monkeypatch.setattr(unique_artist_names, "confirmed", False)
+    client.post("/artists/register", json=ARTIST)
+    response = client.post("/artists/register", json=dict(ARTIST, name="THE REPLAYS"))
+    assert response.status_code == 409
+    assert db.artists.count_documents({}) == 1
+    assert not unique_artist_names.confirmed
+
+    ensure_indexes(db)
+    assert client.post("/artists/register", json=dict(ARTIST, name="the replays")).status_code == 409
+    assert unique_artist_names.confirmed
+
+
+def test_retry_with_idempotency_key_replays_result():
+    """Happy Path: A retried POST returns the first result instead of a 409."""
+    headers = {"Idempotency-Key": "register-1"}
+    first = client.post("/artists/register", json=ARTIST, headers=headers)
+    retry = client.post("/artists/register", json=ARTIST, headers=headers)
+    assert retry.status_code == 200
+    assert retry.json() == first.json()
+
+    album = {"title": "Again", "year": "2024"}
+    for _ in range(2):
+        response = client.post("/artists/register/discography?artist_name=The Replays",
+                               json=album, headers={"Idempotency-Key": "album-1"})
+        assert response.status_code == 200
+    assert len(client.get("/artists/The Replays/albums").json()["albums"]) == 1
+
+
+def test_reused_idempotency_key_is_rejected():
+    """Sad Path: The same key with a different body is a 422."""
+    headers = {"Idempotency-Key": "register-2"}
+    client.post("/artists/register", json=ARTIST, headers=headers)
+    response = client.post("/artists/register", json=dict(ARTIST, name="Someone Else"), headers=headers)
+    assert response.status_code == 422
+    assert db.artists.count_documents({}) == 1
+
+
+def test_failed_requests_are_not_stored():
+    """Edge Case: A retry of a failed request runs again."""
+    headers = {"Idempotency-Key": "album-2"}
+    album = {"title": "Early", "year": "2020"}
+    url = "/artists/register/discography?artist_name=The Replays"
+    assert client.post(url, json=album, headers=headers).status_code == 404
+    client.post("/artists/register", json=ARTIST)
+    assert client.post(url, json=album, headers=headers).status_code == 200
+
+
+def test_changelog_failure_keeps_the_stored_response(monkeypatch):
+    """Sad Path: A committed write whose changelog publish fails still answers and replays."""
+    def unavailable(db, kind, artist):
+        raise ConnectionFailure("changelog unavailable")
+
+    monkeypatch.setattr(main, "publish_change", unavailable)
+    headers = {"Idempotency-Key": "register-3"}
+    first = client.post("/artists/register", json=ARTIST, headers=headers)
+    assert first.status_code == 200
+    retry = client.post("/artists/register", json=ARTIST, headers=headers)
+    assert retry.json() == first.json()
+    assert client.post("/artists/register/discography?artist_name=The Replays",
+                       json={"title": "Later", "year": "2025"}).status_code == 200
+
+
+def test_drift_compares_unique_and_ttl_options():
+    """Edge Case: An index on the right keys without its options is mismatched."""
+    db.artists.drop_index("name_normalized")
+    db.artists.create_index([("name_normalized", 1)], name="name_normalized")
+    assert index_drift(db)["artists"]["mismatched"] == ["name_normalized"]
+    assert INDEXES["idempotency_keys"][0].options["expireAfterSeconds"] > 0
@@ -0,0 +1,86 @@
+"""
+Tests for the declarative index spec and the derived artist fields.
+"""
+import pytest
+
+from database import db
+from indexes import INDEXES, apply_index_spec, duplicate_keys, ensure_indexes, index_drift
+from services.artist_documents import album_key, prepare_artist_document
+
+
+@pytest.fixture(autouse=True)
+def clean_collection():
+    """Start every test from an empty, unindexed collection."""
+    db.artists.drop()
+    yield
+    db.artists.drop()
+
+
+def test_prepare_artist_document_sets_derived_fields():
+    """Happy Path: Normalized name, album titles and a GeoJSON point are derived."""
+    document = prepare_artist_document({
+        "name": "  Bruce   SPRINGSTEEN ",
+        "albums": [{"title": "Born to Run"}, {"title": "born  to run"}],
+        "coordinates": {"latitude": 40.3, "longitude": -74.0},
+    })
+    assert document["name_normalized"] == "bruce springsteen"
+    assert document["album_titles_normalized"] == ["born to run"]
+    assert document["geo"] == {"type": "Point", "coordinates": [-74.0, 40.3]}
+
+
+def test_prepare_artist_document_skips_unusable_coordinates():
+    """Edge Case: Missing or out-of-range coordinates produce no geo point."""
+    assert "geo" not in prepare_artist_document({"name": "A"})
+    assert "geo" not in prepare_artist_document(
+        {"name": "A", "coordinates": {"latitude": 123, "longitude": 0}})
+
+
+def test_album_keys_are_title_and_year():
+    """Happy Path: Albums are keyed by normalized title and year."""
+    document = prepare_artist_document({"name": "A", "albums": [
+        {"title": "Nebraska ", "year": 1982}, {"title": "nebraska", "year": "1982"},
+    ]})
+    assert document["album_keys"] == ["nebraska|1982"]
+    assert album_key({"title": "Nebraska"}) == "nebraska|"
+
+
+def test_ensure_indexes_is_idempotent():
+    """Happy Path: The first run creates every declared index, the second none."""
+    created = ensure_indexes(db)
+    assert sorted(created["artists"]) == sorted(index.name for index in INDEXES["artists"])
+    assert ensure_indexes(db) == {}
+    assert index_drift(db) == {}
+
+
+def test_index_drift_reports_missing_mismatched_and_unexpected():
+    """Sad Path: Drift lists undeclared, missing and changed indexes."""
+    db.artists.create_index([("genre", 1)], name="genre_region")
+    db.artists.create_index([("summary", 1)], name="summary_1")
+    drift = index_drift(db)["artists"]
+    assert drift["mismatched"] == ["genre_region"]
+    assert drift["unexpected"] == ["summary_1"]
+    assert "name_normalized" in drift["missing"]
+
+
+def test_apply_index_spec_backfills_existing_documents():
+    """Happy Path: Documents stored before the derived fields existed are backfilled."""
+    db.artists.insert_one({"name": "Old Artist", "albums": [{"title": "First"}]})
+    apply_index_spec(db)
+    stored = db.artists.find_one({"name_normalized": "old artist"})
+    assert stored["album_titles_normalized"] == ["first"]
+
+
+def test_duplicate_names_skip_only_the_unique_index(caplog):
+    """Sad Path: Stored duplicates block the unique name index, not the others."""
+    db.artists.insert_many([prepare_artist_document({"name": name})
+                            for name in ("Nirvana", "nirvana ", "NIRVANA", "Enya", "Enya", "Björk")])
+    created = ensure_indexes(db)
+    assert "name_normalized" not in created["artists"]
+    assert index_drift(db)["artists"] == {"missing": ["name_normalized"], "mismatched": [], "unexpected": []}
+    name_index = next(index for index in INDEXES["artists"] if index.name == "name_normalized")
+    assert duplicate_keys(db, "artists", name_index) == ["nirvana", "enya"]
+    assert "nirvana, enya" in caplog.text
+
+    db.artists.delete_many({"name": {"$in": ["nirvana ", "NIRVANA"]}})
+    db.artists.delete_one({"name": "Enya"})
+    assert ensure_indexes(db) == {"artists": ["name_normalized"]}
@@ -0,0 +1,98 @@
+"""
+Tests for startup, readiness and the import-time budget.
+"""
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+import lifecycle
+from config import Config
+from main import app
+
+# Generous enough for slow CI machines; a typical import takes well under 1s.
+IMPORT_BUDGET_SECONDS = 3.0
+
+# Only needed by rarely used paths or by the dev server, so never at import.
+LAZY_MODULES = ["geopy", "aiohttp", "uvicorn"]
+
+IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import main
+import database
+print(json.dumps({
+    "seconds": time.perf_counter() - started,
+    "loaded": [name for name in %r if name in sys.modules],
+    "client_created": database._client is not None,
+}))
+""" % (LAZY_MODULES,)
+
+
+def test_import_stays_within_budget():
+    """Happy Path: Importing main is fast, lazy and does not connect to Mongo."""
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE],
+        cwd=Path(__file__).parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    probe = json.loads(output.strip().splitlines()[-1])
+    assert probe["loaded"] == []
+    assert probe["client_created"] is False
+    assert probe["seconds"] < IMPORT_BUDGET_SECONDS
+
+
+def test_not_ready_before_startup():
+    """Sad Path: /ready returns 503 until the lifespan has warmed up."""
+    lifecycle.readiness.mark_not_ready("starting")
+    response = TestClient(app).get("/ready")
+    assert response.status_code == 503
+    assert response.json()["reason"] == "starting"
+
+
+def test_ready_after_startup():
+    """Happy Path: Running the lifespan warms up and marks the worker ready."""
+    with TestClient(app) as client:
+        response = client.get("/ready")
+        assert response.status_code == 200
+        assert "cfyby_boot_seconds{phase=\"startup\"}" in client.get("/metrics").text
+    assert lifecycle.readiness.ready is False
+
+
+def test_failed_warmup_leaves_worker_not_ready(monkeypatch):
+    """Sad Path: A failing warmup keeps the worker up but out of rotation."""
+    def broken_warm_up():
+        raise RuntimeError("no primary available")
+
+    monkeypatch.setattr(lifecycle, "warm_up", broken_warm_up)
+    with TestClient(app) as client:
+        response = client.get("/ready")
+    assert response.status_code == 503
+    assert "no primary available" in response.json()["reason"]
+
+
+def test_failed_warmup_is_retried_until_ready(monkeypatch):
+    """Happy Path: A worker that booted during an outage becomes ready once warmup succeeds."""
+    attempts = []
+    real_warm_up = lifecycle.warm_up
+
+    def flaky_warm_up():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RuntimeError("no primary available")
+        real_warm_up()
+
+    monkeypatch.setattr(lifecycle, "warm_up", flaky_warm_up)
+    monkeypatch.setattr(Config, "WARMUP_RETRY_SECONDS", 0.01)
+    with TestClient(app) as client:
+        deadline = time.monotonic() + 5
+        while not lifecycle.readiness.ready and time.monotonic() < deadline:
+            time.sleep(0.01)
+        response = client.get("/ready")
+    assert response.status_code == 200
+    assert len(attempts) == 3
@@ -0,0 +1,56 @@
+"""
+Tests for location parsing and the location filters built from it.
+"""
+import pytest
+
+from utils.locations import location_filter, location_parts, parse_location
+
+
+@pytest.mark.parametrize("location, expected", [
+    ("Atlanta, Georgia, USA", ("atlanta", "georgia", "united states")),
+    ("Athens, Georgia", ("athens", "georgia", "united states")),
+    ("Georgia", (None, None, "georgia")),
+    ("Los Angeles, CA", ("los angeles", "california", "united states")),
+    ("Abbotsford, British Columbia, CA", ("abbotsford", "british columbia", "canada")),
+    ("Banff, Aberdeenshire, Scotland, UK", ("banff", "scotland", "united kingdom")),
+    ("London, England,", ("london", "england", "united kingdom")),
+    ("Jacksonville, Texas, U.S.", ("jacksonville", "texas", "united states")),
+    ("San Juan, Porto Rico", ("san juan", None, "puerto rico")),
+    ("New York, New York, USA", ("new york", "new york", "united states")),
+    ("Tokyo, Japan", ("tokyo", None, "japan")),
+    ("Münster", ("münster", None, None)),
+])
+def test_parse_location(location, expected):
+    """Happy Path: Source location strings split into normalized parts."""
+    parsed = parse_location(location)
+    assert (parsed["city"], parsed["region"], parsed["country"]) == expected
+
+
+def test_location_parts_from_separate_fields():
+    """Edge Case: Sources with separate or repeated fields are joined first."""
+    assert location_parts({"city": "Philadelphia", "country": "Philadelphia"}) == {
+        "city": "philadelphia", "region": None, "country": None
+    }
+    assert location_parts({"city": None, "country": "Seattle, USA"})["city"] == "seattle"
+    assert location_parts({"city": "Kutaisi", "country": "Georgia"}) == {
+        "city": "kutaisi", "region": None, "country": "georgia"
+    }
+
+
+def test_location_filter_is_exact():
+    """Happy Path: Query parameters become exact matches with aliases resolved."""
+    assert location_filter(country="USA") == {"country": "united states"}
+    assert location_filter(country="Georgia", city="Tbilisi") == {
+        "$and": [{"country": "georgia"}, {"city": "tbilisi"}]
+    }
+    assert location_filter(location="Seattle, Washington, USA") == {
+        "city": "seattle", "region": "washington", "country": "united states"
+    }
+    assert location_filter() == {}
+
+
+def test_single_place_location_tries_every_field():
+    """Edge Case: A one-word location may be a city, region or country."""
+    assert location_filter(location="Georgia") == {"$or": [
+        {"city": "georgia"}, {"region": "georgia"}, {"country": "georgia"}
+    ]}
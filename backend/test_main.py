@@ -5,16 +5,25 @@ import pytest
 from fastapi.testclient import TestClient
 
 # Assuming pytest is run from the project root, which is the parent of 'backend'
+from indexes import ensure_indexes
 from main import app, db
+from services.artist_documents import prepare_artist_document
 
 client = TestClient(app)
 
+
+def insert_artist(document):
+    """Store an artist the way the app does, with its derived fields."""
+    db.artists.insert_one(prepare_artist_document(document))
+
 @pytest.fixture(autouse=True)
 def setup_teardown():
     """Fixture to clear the database before and after each test."""
     db.artists.delete_many({})
+    db.album_buckets.delete_many({})
     yield
     db.artists.delete_many({})
+    db.album_buckets.delete_many({})
 
 
 def test_get_root():
@@ -41,7 +50,7 @@ def test_get_root():
 # Tests for the /artists endpoint
 def test_get_artists_no_filters():
     """Happy Path: Tests fetching all artists without any filters."""
-    db.artists.insert_one({"name": "Test Artist", "genre": "rock"})
+    insert_artist({"name": "Test Artist", "genre": "rock"})
     response = client.get("/artists")
     assert response.status_code == 200
     data = response.json()
@@ -52,8 +61,8 @@ def test_get_artists_no_filters():
 
 def test_get_artists_by_valid_genre():
     """Happy Path: Tests filtering artists by a valid genre."""
-    db.artists.insert_one({"name": "Artist 1", "genre": "rock"})
-    db.artists.insert_one({"name": "Artist 2", "genre": "pop"})
+    insert_artist({"name": "Artist 1", "genre": "rock"})
+    insert_artist({"name": "Artist 2", "genre": "pop"})
     response = client.get("/artists?genre=rock")
     assert response.status_code == 200
     data = response.json()
@@ -71,13 +80,13 @@ def test_get_artists_by_invalid_genre():
 def test_get_artists_by_location():
     """Happy Path: Tests filtering artists by location with radius and coordinates."""
     # Insert artists with coordinates
-    db.artists.insert_one({
+    insert_artist({
         "name": "Artist 1",
         "location": "Seattle, Washington, USA",
         "genre": "rock",
         "coordinates": {"latitude": 47.6062, "longitude": -122.3321}
     })
-    db.artists.insert_one({
+    insert_artist({
         "name": "Artist 2",
         "location": "Portland, Oregon, USA",
         "genre": "rock",
@@ -106,6 +115,19 @@ def test_get_artists_by_location():
     assert len(data["results"]) == 2
 
 
+def test_get_artists_country_does_not_match_region():
+    """Happy Path: country=Georgia matches the country, not the US state."""
+    insert_artist({"name": "Atlanta Artist", "genre": "rock", "location": "Atlanta, Georgia, USA"})
+    insert_artist({"name": "Kutaisi Artist", "genre": "rock", "country": "Georgia", "city": "Kutaisi"})
+
+    response = client.get("/artists?country=Georgia")
+    assert response.status_code == 200
+    assert [artist["name"] for artist in response.json()["results"]] == ["Kutaisi Artist"]
+
+    response = client.get("/artists?country=USA")
+    assert [artist["name"] for artist in response.json()["results"]] == ["Atlanta Artist"]
+
+
 def test_get_artists_by_invalid_location():
     """Sad Path: Tests filtering artists by an invalid location and radius with no matches."""
     # Test 1: Original behavior - invalid location string returns 404
@@ -116,7 +138,7 @@ def test_get_artists_by_invalid_location():
     }
     
     # Test 2: Radius filtering with coordinates but no artists in range
-    db.artists.insert_one({
+    insert_artist({
         "name": "Artist Far Away",
         "location": "Tokyo, Japan",
         "genre": "rock",
@@ -137,7 +159,7 @@ def test_get_artists_no_results_found():
     assert response.json() == {"results": []}
     
     # Test 2: Genre filter with radius - artist exists but wrong genre
-    db.artists.insert_one({
+    insert_artist({
         "name": "Pop Artist",
         "location": "Seattle, Washington, USA",
         "genre": "pop",
@@ -148,7 +170,7 @@ def test_get_artists_no_results_found():
     assert response.json() == {"results": []}  # No rock artists near Seattle
     
     # Test 3: Artist without coordinates falls back to location string match when using radius
-    db.artists.insert_one({
+    insert_artist({
         "name": "No Coords Artist",
         "location": "Seattle, Washington, USA",
         "genre": "jazz"
@@ -164,7 +186,7 @@ def test_get_artists_no_results_found():
 # Tests for /artists/{name}
 def test_get_artist_info_happy_path():
     """Happy Path: Tests fetching a specific artist by name."""
-    db.artists.insert_one({"name": "Bruce Springsteen", "summary": "A summary", "albums": []})
+    insert_artist({"name": "Bruce Springsteen", "summary": "A summary", "albums": []})
     response = client.get("/artists/Bruce Springsteen")
     assert response.status_code == 200
     data = response.json()
@@ -175,7 +197,7 @@ def test_get_artist_info_happy_path():
 
 def test_get_artist_info_case_insensitive():
     """Happy Path: Tests that artist name matching is case-insensitive."""
-    db.artists.insert_one({"name": "Bruce Springsteen"})
+    insert_artist({"name": "Bruce Springsteen"})
     response = client.get("/artists/bruce springsteen")
     assert response.status_code == 200
     assert response.json()["name"] == "Bruce Springsteen"
@@ -193,7 +215,7 @@ def test_get_artist_info_not_found():
 # Tests for /artists/{name}/description
 def test_get_artist_description_happy_path():
     """Happy Path: Tests fetching the description of a specific artist."""
-    db.artists.insert_one({"name": "Bruce Springsteen", "summary": "A summary"})
+    insert_artist({"name": "Bruce Springsteen", "summary": "A summary"})
     response = client.get("/artists/Bruce Springsteen/description")
     assert response.status_code == 200
     data = response.json()
@@ -213,7 +235,7 @@ def test_get_artist_description_not_found():
 # Tests for /artists/{name}/image
 def test_get_artist_image_happy_path():
     """Happy Path: Tests fetching the image URL of a specific artist."""
-    db.artists.insert_one({"name": "Bruce Springsteen", "image": "http://example.com/image.jpg"})
+    insert_artist({"name": "Bruce Springsteen", "image": "http://example.com/image.jpg"})
     response = client.get("/artists/Bruce Springsteen/image")
     assert response.status_code == 200
     data = response.json()
@@ -233,7 +255,7 @@ def test_get_artist_image_not_found():
 # Tests for /artists/{name}/albums
 def test_get_artist_albums_happy_path():
     """Happy Path: Tests fetching albums for a specific artist."""
-    db.artists.insert_one({"name": "Bruce Springsteen", "albums": [{"title": "Born to Run"}]})
+    insert_artist({"name": "Bruce Springsteen", "albums": [{"title": "Born to Run"}]})
     response = client.get("/artists/Bruce Springsteen/albums")
     assert response.status_code == 200
     data = response.json()
@@ -255,7 +277,7 @@ def test_get_artist_albums_not_found():
 # Tests for /albums/{title}/description
 def test_get_album_description_happy_path():
     """Happy Path: Tests fetching information for a specific album by title."""
-    db.artists.insert_one({"name": "Bruce Springsteen", "albums": [{"title": "Born to Run", "year": 1975, "tracks": []}]})
+    insert_artist({"name": "Bruce Springsteen", "albums": [{"title": "Born to Run", "year": 1975, "tracks": []}]})
     response = client.get("/albums/Born to Run/description")
     assert response.status_code == 200
     data = response.json()
@@ -266,7 +288,7 @@ def test_get_album_description_happy_path():
 
 def test_get_album_description_case_insensitive():
     """Happy Path: Tests that album title matching is case-insensitive."""
-    db.artists.insert_one({"name": "Bruce Springsteen", "albums": [{"title": "Born to Run", "year": 1975, "tracks": []}]})
+    insert_artist({"name": "Bruce Springsteen", "albums": [{"title": "Born to Run", "year": 1975, "tracks": []}]})
     response = client.get("/albums/born to run/description")
     assert response.status_code == 200
     assert response.json()["title"] == "Born to Run"
@@ -306,6 +328,7 @@ def test_register_artist_duplicate_fails():
         "summary": "Test artist summary",
         "image": "http://example.com/image.jpg",
     }
+    ensure_indexes(db)
     client.post("/artists/register", json=test_artist)
     response = client.post("/artists/register", json=test_artist)
     assert response.status_code == 409
@@ -316,7 +339,7 @@ def test_register_artist_duplicate_fails():
 
 def test_register_discography():
     """Happy Path: Tests that the post end point passes without error and updates the JSON database with a new discography entry."""
-    db.artists.insert_one({"name": "Vaporwave Guy", "genre": "vaporwave", "albums": []})
+    insert_artist({"name": "Vaporwave Guy", "genre": "vaporwave", "albums": []})
     test_discography = {
         "title": "Vaporwave Vol. 1",
         "year": "1999",
@@ -333,9 +356,45 @@ def test_register_discography():
     )
     assert response.status_code == 200
     
-    artist = db.artists.find_one({"name": "Vaporwave Guy"})
-    assert len(artist["albums"]) == 1
-    assert artist["albums"][0]["title"] == "Vaporwave Vol. 1"
+    albums = client.get("/artists/Vaporwave Guy/albums").json()["albums"]
+    assert len(albums) == 1
+    assert albums[0]["title"] == "Vaporwave Vol. 1"
+
+
+def test_register_discography_normalizes_durations():
+    """Happy Path: Durations are stored as seconds and the album gets its runtime."""
+    insert_artist({"name": "Vaporwave Guy", "genre": "vaporwave", "albums": []})
+    response = client.post("/artists/register/discography?artist_name=Vaporwave Guy", json={
+        "title": "Vaporwave Vol. 1", "year": "1999",
+        "tracks": [{"title": "Vapors", "duration": "3:30"}, {"title": "Mist", "duration": 95}],
+    })
+    assert response.status_code == 200
+    album = client.get("/artists/Vaporwave Guy/albums").json()["albums"][0]
+    assert [track["duration_seconds"] for track in album["tracks"]] == [210, 95]
+    assert [track["duration"] for track in album["tracks"]] == ["3:30", "1:35"]
+    assert (album["runtime_seconds"], album["track_count"]) == (305, 2)
+
+
+def test_register_discography_rejects_bad_duration():
+    """Sad Path: Durations that are neither seconds nor m:ss are rejected."""
+    insert_artist({"name": "Vaporwave Guy", "genre": "vaporwave", "albums": []})
+    response = client.post("/artists/register/discography?artist_name=Vaporwave Guy", json={
+        "title": "Vaporwave Vol. 1", "year": "1999", "tracks": [{"title": "Vapors", "duration": "long"}],
+    })
+    assert response.status_code == 422
+
+
+def test_get_albums_by_runtime():
+    """Happy Path: Albums are filtered by their precomputed runtime."""
+    insert_artist({"name": "Bruce Springsteen", "genre": "rock", "albums": [
+        {"title": "Nebraska", "tracks": [{"title": "Nebraska", "duration": "34:00"}]},
+        {"title": "The River", "tracks": [{"title": "The River", "duration": "1:23:00"}]},
+    ]})
+    albums = client.get("/albums", params={"max_minutes": 40}).json()["albums"]
+    assert [(album["title"], album["runtime_seconds"]) for album in albums] == [("Nebraska", 2040)]
+    albums = client.get("/albums", params={"min_minutes": 40}).json()["albums"]
+    assert [album["title"] for album in albums] == ["The River"]
+    assert client.get("/albums").status_code == 400
 
 
 def test_register_discography_artist_not_found():
@@ -356,4 +415,90 @@ def test_register_discography_artist_not_found():
     )
 
     assert response.status_code == 404
-    assert response.json()["detail"] == "Artist 'NonExistent' does not exist in our data"
\ No newline at end of file
+    assert response.json()["detail"] == "Artist 'NonExistent' does not exist in our data"
+
+# Tests for the /artists/batch endpoint
+def test_get_artists_batch_by_name_and_id():
+    """Happy Path: Names and ids resolve in one request, keyed as requested."""
+    insert_artist({"name": "Bruce Springsteen", "genre": "rock"})
+    insert_artist({"name": "Miles Davis", "genre": "jazz"})
+    miles_id = str(db.artists.find_one({"name": "Miles Davis"})["_id"])
+    response = client.post("/artists/batch", json={
+        "names": ["bruce  SPRINGSTEEN", "Nobody"], "ids": [miles_id, "not-an-id"],
+    })
+    assert response.status_code == 200
+    data = response.json()
+    assert data["results"]["bruce  SPRINGSTEEN"]["name"] == "Bruce Springsteen"
+    assert "name_normalized" not in data["results"]["bruce  SPRINGSTEEN"]
+    assert data["results"][miles_id]["_id"] == miles_id
+    assert data["results"]["Nobody"] is None
+    assert data["not_found"] == ["Nobody", "not-an-id"]
+
+
+def test_get_artists_batch_with_fields():
+    """Happy Path: Only the requested fields are returned."""
+    insert_artist({"name": "Bruce Springsteen", "genre": "rock", "summary": "The Boss"})
+    response = client.post("/artists/batch", json={
+        "names": ["Bruce Springsteen"], "fields": ["genre", "name_normalized"],
+    })
+    artist = response.json()["results"]["Bruce Springsteen"]
+    assert set(artist) == {"_id", "genre"}
+
+
+def test_get_artists_batch_limits():
+    """Edge Case: Empty and oversized batches are rejected."""
+    assert client.post("/artists/batch", json={}).status_code == 400
+    names = [f"Artist {i}" for i in range(1000)]
+    assert client.post("/artists/batch", json={"names": names}).status_code == 400
+
+
+# Tests for the fields and expand parameters
+FULL_ARTIST = {
+    "name": "Bruce Springsteen", "genre": "rock", "summary": "The Boss",
+    "location": "Long Branch, New Jersey, USA",
+    "coordinates": {"latitude": 40.3, "longitude": -74.0},
+    "albums": [{"title": "Born to Run", "year": 1975,
+                "tracks": [{"title": "Thunder Road", "duration": 290}]}],
+}
+
+
+def test_get_artists_fields_and_expand():
+    """Happy Path: Only requested fields come back; albums only when expanded."""
+    insert_artist(FULL_ARTIST)
+    artist = client.get("/artists", params={"fields": "name,genre"}).json()["results"][0]
+    assert set(artist) == {"_id", "name", "genre"}
+
+    artist = client.get("/local/audio", params={"expand": "albums"}).json()["results"][0]
+    assert artist["summary"] == "The Boss"
+    assert artist["albums"] == [
+        {"title": "Born to Run", "year": 1975, "runtime_seconds": 290, "track_count": 1}
+    ]
+
+    artist = client.get("/artists/Bruce Springsteen",
+                        params={"fields": "name", "expand": "tracks"}).json()
+    assert set(artist) == {"_id", "name", "albums"}
+    assert artist["albums"][0]["tracks"][0]["title"] == "Thunder Road"
+
+
+def test_get_artists_without_fields_returns_full_document():
+    """Happy Path: Without fields or expand the legacy full document is returned."""
+    insert_artist(FULL_ARTIST)
+    artist = client.get("/artists/genre", params={"genre": "rock", "n": 1}).json()["results"][0]
+    assert artist["albums"][0]["tracks"]
+    assert artist["summary"] == "The Boss"
+
+
+def test_get_artists_radius_with_fields():
+    """Edge Case: Radius search still works when coordinates are not requested."""
+    insert_artist(FULL_ARTIST)
+    response = client.get("/artists", params={
+        "latitude": 40.3, "longitude": -74.0, "radius": 10, "fields": "name",
+    })
+    artist = response.json()["results"][0]
+    assert set(artist) == {"_id", "name", "distance_mi"}
+
+
+def test_get_artists_unknown_expand_fails():
+    """Sad Path: Unknown expansions are rejected."""
+    response = client.get("/local/audio", params={"expand": "biography"})
+    assert response.status_code == 400
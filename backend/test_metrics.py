@@ -0,0 +1,100 @@
+"""
+Tests for the metrics registry and the /metrics endpoint.
+"""
+import json
+import os
+import subprocess
+import sys
+
+from fastapi.testclient import TestClient
+
+from main import app
+from utils.metrics import (
+    Counter,
+    Histogram,
+    MetricsRegistry,
+    SharedMetrics,
+    record_cache_lookup,
+    render_metrics,
+)
+
+client = TestClient(app)
+
+
+def test_histogram_renders_cumulative_buckets():
+    """Happy Path: Histogram buckets are cumulative and end with +Inf."""
+    histogram = Histogram("test_seconds", "test", ("route",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, "/a")
+    histogram.observe(0.5, "/a")
+    histogram.observe(5.0, "/a")
+
+    lines = list(histogram.render())
+    assert 'test_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{route="/a",le="1"} 2' in lines
+    assert 'test_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{route="/a"} 3' in lines
+    assert histogram.count("/a") == 3
+
+
+def test_counter_escapes_label_values():
+    """Happy Path: Label values are escaped in the exposition format."""
+    counter = Counter("test_total", "test", ("name",))
+    counter.inc('say "hi"')
+    assert list(counter.render()) == ['test_total{name="say \\"hi\\""} 1']
+
+
+def test_cache_hit_ratio_is_exposed():
+    """Happy Path: Cache lookups are exposed as a hit ratio gauge."""
+    record_cache_lookup("test-cache", True)
+    record_cache_lookup("test-cache", False)
+    assert 'cfyby_cache_hit_ratio{cache="test-cache"} 0.5' in render_metrics()
+
+
+def test_metrics_endpoint_records_route_templates():
+    """Happy Path: Requests are counted per route template, not raw path."""
+    client.get("/")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert "# TYPE cfyby_http_request_duration_seconds histogram" in body
+    assert 'cfyby_http_requests_total{method="GET",route="/",status="200"}' in body
+
+
+def _exited_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_shared_metrics_sum_every_worker(tmp_path):
+    """Happy Path: /metrics sums counters and histograms over the workers' files."""
+    registry = MetricsRegistry()
+    requests = registry.counter("test_requests_total", "test", ("route",))
+    latency = registry.histogram("test_seconds", "test", buckets=(0.1, 1.0))
+    version = registry.gauge("test_version", "test")
+    requests.inc("/a", amount=2)
+    latency.observe(0.05)
+    version.set(7)
+
+    recycled = _exited_pid()
+    (tmp_path / f"metrics-{recycled}.json").write_text(json.dumps({
+        "test_requests_total": [[["/a"], 3], [["/b"], 1]],
+        "test_seconds": [[[], [0, 1, 0, 0.5]]],
+        "test_version": [[[], 3]],
+    }))
+    shared = SharedMetrics(registry)
+    shared.start(str(tmp_path), interval=60)
+    try:
+        lines = shared.render().splitlines()
+    finally:
+        shared.stop()
+
+    assert 'test_requests_total{route="/a"} 5' in lines
+    assert 'test_requests_total{route="/b"} 1' in lines
+    assert 'test_seconds_bucket{le="1"} 2' in lines
+    assert "test_seconds_count 2" in lines
+    # Gauges are per worker, and an exited worker's gauges are dropped.
+    assert [line for line in lines if line.startswith("test_version{")] == [
+        f'test_version{{pid="{os.getpid()}"}} 7'
+    ]
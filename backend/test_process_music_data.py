@@ -0,0 +1,132 @@
+"""
+Tests for the parallel MusicBrainz CSV ingest.
+"""
+import io
+import json
+
+import pytest
+
+from database import db
+from indexes import ensure_indexes, unique_artist_names
+from services.catalog_changes import CHANGE_COLLECTION, CHANGELOG_LENGTH, current_version
+from services.facets import FACET_COLLECTION
+from services.process_music_data import chunk_ranges, ingest, main, read_header, write_mongo, write_ndjson
+
+ROWS = [
+    ("1", "Nirvana", "rock", "United States", "Aberdeen"),
+    ("2", "Nirvana", "pop", "United States", "Aberdeen"),
+    ("3", "Miles Davis", "jazz", "United States", ""),
+    ("4", "Enya", "new age", "Ireland", "Gweedore"),
+    ("5", "  nirvana ", "techno", "", ""),
+    ("6", "Kraftwerk", "Techno", "Germany", "Düsseldorf"),
+    ("7", 'The "Quoted", Band', "country", "", "Nashville"),
+]
+
+
+@pytest.fixture
+def dump(tmp_path):
+    """A small dump, repeated so it spans many byte ranges."""
+    lines = ["id,name,tag,area_name,begin_area_name"]
+    for repeat in range(20):
+        for row_id, name, tag, country, city in ROWS:
+            name = name if repeat == 0 else f"{name} {repeat}"
+            quoted = '"' + name.replace('"', '""') + '"' if '"' in name or "," in name else name
+            lines.append(",".join([row_id, quoted, tag, country, city]))
+    path = tmp_path / "dump.csv"
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def ndjson(filename, **options):
+    output = io.StringIO()
+    write_ndjson(ingest(filename, "ndjson", **options), output)
+    return [json.loads(line) for line in output.getvalue().split("\n") if line]
+
+
+def test_ranges_end_on_line_boundaries(dump):
+    """Happy Path: Ranges cover the data rows and each ends after a newline."""
+    columns, _, start = read_header(dump)
+    assert columns == ["id", "name", "tag", "area_name", "begin_area_name"]
+    ranges = chunk_ranges(dump, start, chunk_bytes=100)
+    assert len(ranges) > 5
+    data = open(dump, "rb").read()
+    assert ranges[0][0] == start and ranges[-1][1] == len(data)
+    assert all(end == next_start for (_, end), (next_start, _) in zip(ranges, ranges[1:]))
+    assert all(data[end - 1:end] == b"\n" for _, end in ranges)
+
+
+def test_filters_genres_and_keeps_first_row_per_name(dump):
+    """Happy Path: Unknown tags are dropped and a name's first allowed tag wins."""
+    artists = ndjson(dump, workers=1)[:5]
+    assert artists == [
+        {"name": "Nirvana", "genre": "rock", "country": "United States", "city": "Aberdeen"},
+        {"name": "Miles Davis", "genre": "jazz", "country": "United States"},
+        {"name": "Kraftwerk", "genre": "techno", "country": "Germany", "city": "Düsseldorf"},
+        {"name": 'The "Quoted", Band', "genre": "country", "city": "Nashville"},
+        {"name": "Nirvana 1", "genre": "rock", "country": "United States", "city": "Aberdeen"},
+    ]
+
+
+def test_parallel_output_matches_serial(dump):
+    """Happy Path: Any number of workers and range size gives the same artists."""
+    serial = ndjson(dump, workers=1)
+    assert len(serial) == 4 * 20
+    assert ndjson(dump, workers=3, chunk_bytes=64) == serial
+
+
+def test_mongo_writes_skip_stored_names(dump):
+    """Edge Case: A second ingest inserts nothing; the unique index skips every name."""
+    db.artists.drop()
+    ensure_indexes(db)
+    try:
+        assert write_mongo(db, ingest(dump, "documents", workers=2, chunk_bytes=200), batch_size=7) == 80
+        stored = db.artists.find_one({"name": "Kraftwerk"})
+        assert (stored["name_normalized"], stored["city"]) == ("kraftwerk", "düsseldorf")
+        assert write_mongo(db, ingest(dump, "documents", workers=1)) == 0
+        assert db.artists.count_documents({}) == 80
+    finally:
+        db.artists.drop()
+
+
+def test_mongo_writes_skip_stored_names_without_the_unique_index(dump, monkeypatch):
+    """Sad Path: Without the unique index, each batch is checked against the stored names."""
+    db.artists.drop()
+    monkeypatch.setattr(unique_artist_names, "confirmed", False)
+    try:
+        assert write_mongo(db, ingest(dump, "documents", workers=1), batch_size=7) == 80
+        assert write_mongo(db, ingest(dump, "documents", workers=2, chunk_bytes=200), batch_size=7) == 0
+        assert db.artists.count_documents({}) == 80
+    finally:
+        db.artists.drop()
+
+
+def test_mongo_ingest_refreshes_derived_collections_and_workers(dump):
+    """Happy Path: --mongo rebuilds the facets and moves every worker past the changelog."""
+    for collection in ("artists", FACET_COLLECTION, CHANGE_COLLECTION):
+        db[collection].drop()
+    try:
+        main([dump, "--mongo", "--workers", "1"])
+        assert db.artists.count_documents({}) == 80
+        assert db[FACET_COLLECTION].find_one({"_id.genre": "jazz"})["count"] == 20
+        assert current_version(db) == CHANGELOG_LENGTH + 1
+        assert db[CHANGE_COLLECTION].find_one()["changes"] == []
+    finally:
+        for collection in ("artists", FACET_COLLECTION, CHANGE_COLLECTION):
+            db[collection].drop()
+
+
+def test_names_keep_unicode_line_separators(tmp_path):
+    """Edge Case: Only newlines end a row; U+2028 and U+0085 inside a name do not."""
+    path = tmp_path / "separators.csv"
+    path.write_text("id,name,tag\n1,Line\u2028Break,rock\n2,Next\x85Line,jazz\n", encoding="utf-8")
+    assert [artist["name"] for artist in ndjson(str(path), workers=1)] == ["Line\u2028Break", "Next\x85Line"]
+
+
+def test_rejects_unknown_format_and_missing_columns(tmp_path):
+    """Sad Path: A bad output format or a CSV without name/tag columns raises."""
+    path = tmp_path / "bad.csv"
+    path.write_text("id,title\n1,Nevermind\n", encoding="utf-8")
+    with pytest.raises(ValueError):
+        next(ingest(str(path), "xml"))
+    with pytest.raises(ValueError):
+        next(ingest(str(path), "ndjson", workers=1))
@@ -0,0 +1,186 @@
+"""
+Tests for the slow-query log and explain capture.
+"""
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from database import get_client
+from indexes import ensure_indexes
+from main import app, db
+from services.artist_documents import prepare_artist_document
+from utils.query_diagnostics import (
+    QueryDiagnostics,
+    capture_queries,
+    plan_flags,
+    query_shape,
+)
+
+COLLSCAN_EXPLAIN = {
+    "queryPlanner": {
+        "winningPlan": {
+            "stage": "SORT",
+            "inputStage": {"stage": "COLLSCAN"},
+        }
+    }
+}
+
+IXSCAN_EXPLAIN = {
+    "queryPlanner": {
+        "winningPlan": {
+            "queryPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}
+        }
+    }
+}
+
+
+class FakeClient:
+    """Stands in for MongoClient, answering explain commands."""
+
+    def __init__(self, explain):
+        self.explain = explain
+        self.commands = []
+
+    def __getitem__(self, name):
+        return SimpleNamespace(command=self._command)
+
+    def _command(self, command):
+        self.commands.append(command)
+        return self.explain
+
+
+def run_query(recorder, command, duration_micros=500, request_id=1):
+    """Feed a started/succeeded event pair through the listener."""
+    event = SimpleNamespace(
+        command_name=next(iter(command)),
+        command=dict(command, **{"$db": "cfyby", "lsid": {"id": "x"}}),
+        database_name="cfyby",
+        connection_id=("localhost", 27017),
+        request_id=request_id,
+        duration_micros=duration_micros,
+    )
+    recorder.started(event)
+    recorder.succeeded(event)
+
+
+def test_query_shape_replaces_literals():
+    """Happy Path: Literal values collapse to type placeholders."""
+    assert query_shape({"name": "Prince", "year": {"$gte": 1980}}) == {
+        "name": "<str>", "year": {"$gte": "<int>"}
+    }
+    assert query_shape({"genre": {"$in": ["rock", "pop"]}}) == {"genre": {"$in": ["?"]}}
+
+
+def test_plan_flags_detect_collscan_and_sort():
+    """Happy Path: COLLSCAN and in-memory SORT stages are flagged."""
+    assert plan_flags(COLLSCAN_EXPLAIN) == ["COLLSCAN", "SORT"]
+    assert plan_flags(IXSCAN_EXPLAIN) == []
+
+
+def test_same_shape_is_aggregated():
+    """Happy Path: Queries differing only in values share one shape entry."""
+    recorder = QueryDiagnostics(enabled=True, slow_ms=1000)
+    run_query(recorder, {"find": "artists", "filter": {"name": "Prince"}}, request_id=1)
+    run_query(recorder, {"find": "artists", "filter": {"name": "Madonna"}}, request_id=2)
+
+    shapes = recorder.shapes()
+    assert len(shapes) == 1
+    assert shapes[0].count == 2
+    assert shapes[0].collection == "artists"
+
+
+def test_disabled_recorder_records_nothing():
+    """Sad Path: Nothing is recorded unless diagnostics are enabled."""
+    recorder = QueryDiagnostics(enabled=False)
+    run_query(recorder, {"find": "artists", "filter": {}})
+    assert recorder.shapes() == []
+
+
+def test_slow_shapes_are_explained_without_driver_fields():
+    """Happy Path: Slow shapes are explained lazily and flagged."""
+    recorder = QueryDiagnostics(enabled=True, slow_ms=1)
+    fake = FakeClient(COLLSCAN_EXPLAIN)
+    recorder.attach_client(fake)
+    run_query(recorder, {"find": "artists", "filter": {"genre": "rock"}}, duration_micros=5000)
+    assert fake.commands == []
+
+    report = recorder.report()
+    assert len(fake.commands) == 1
+    explained = fake.commands[0]["explain"]
+    assert "$db" not in explained and "lsid" not in explained
+    assert report["flagged"][0]["flags"] == ["COLLSCAN", "SORT"]
+
+
+def test_bulk_writes_explain_only_the_shaped_statement():
+    """Edge Case: A multi-statement update is explained with its first statement only."""
+    recorder = QueryDiagnostics(enabled=True, slow_ms=1)
+    fake = FakeClient(IXSCAN_EXPLAIN)
+    recorder.attach_client(fake)
+    updates = [{"q": {"name_normalized": name}, "u": {"$set": {"x": 1}}} for name in ("a", "b", "c")]
+    run_query(recorder, {"update": "artists", "updates": updates, "ordered": False},
+              duration_micros=5000)
+    recorder.report()
+    assert fake.commands[0]["explain"]["updates"] == updates[:1]
+    assert fake.commands[0]["explain"]["ordered"] is False
+
+
+def test_capture_queries_fails_on_collscan():
+    """Sad Path: The test helper raises when a captured query scans the collection."""
+    recorder = QueryDiagnostics(enabled=False)
+    recorder.attach_client(FakeClient(COLLSCAN_EXPLAIN))
+    with capture_queries(recorder) as captured:
+        run_query(recorder, {"find": "artists", "filter": {"name": {"$regex": "^x$"}}})
+    assert recorder.enabled is False
+    with pytest.raises(AssertionError, match="COLLSCAN"):
+        captured.assert_indexed("artists")
+
+
+def test_capture_queries_passes_on_index_scan():
+    """Happy Path: The test helper passes when captured queries use an index."""
+    recorder = QueryDiagnostics(enabled=False)
+    recorder.attach_client(FakeClient(IXSCAN_EXPLAIN))
+    with capture_queries(recorder) as captured:
+        run_query(recorder, {"find": "artists", "filter": {"name_normalized": "x"}})
+    captured.assert_indexed("artists")
+
+
+ARTISTS = [
+    {"name": "Nirvana", "genre": "rock", "location": "Aberdeen, Washington, United States",
+     "coordinates": {"latitude": 46.97, "longitude": -123.81}},
+    {"name": "Pearl Jam", "genre": "rock", "location": "Seattle, Washington, United States",
+     "coordinates": {"latitude": 47.61, "longitude": -122.33}},
+    {"name": "Enya", "genre": "new age", "location": "Gweedore, Ireland"},
+]
+
+ENDPOINTS = [
+    "/artists/Nirvana",
+    "/artists/genre?genre=rock&n=10",
+    "/artists/location?genre=rock&location=Seattle&n=10",
+    "/artists/location?genre=rock&location=Seattle, Washington&n=10",
+    "/artists?genre=rock&latitude=47.6062&longitude=-122.3321&radius=100",
+]
+
+
+@pytest.fixture
+def indexed_catalog():
+    """
+    A small catalog with every declared index. Explain plans come from the
+    server, so these tests need a real MongoDB (MONGO_URL).
+    """
+    if not type(get_client()).__module__.startswith("pymongo"):
+        pytest.skip("needs a MongoDB server to explain queries")
+    db.artists.drop()
+    ensure_indexes(db, background=False)
+    db.artists.insert_many([prepare_artist_document(artist) for artist in ARTISTS])
+    yield TestClient(app)
+    db.artists.drop()
+
+
+@pytest.mark.parametrize("path", ENDPOINTS)
+def test_read_endpoints_use_indexes(indexed_catalog, path):
+    """Happy Path: Name, genre, location and radius lookups never scan the collection."""
+    with capture_queries() as captured:
+        assert indexed_catalog.get(path).status_code == 200
+    assert any(stats.collection == "artists" for stats in captured.shapes)
+    captured.assert_indexed("artists")
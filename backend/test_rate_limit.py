@@ -0,0 +1,83 @@
+"""
+Tests for the per-client rate limiter.
+"""
+from fastapi.testclient import TestClient
+from starlette.responses import PlainTextResponse
+
+from utils.rate_limit import RateLimitMiddleware, TokenBuckets, budget_name, parse_budget
+
+
+async def ok(scope, receive, send):
+    await PlainTextResponse("ok")(scope, receive, send)
+
+
+def limited_client(api_keys=("a", "b"), **budgets):
+    buckets = {name: TokenBuckets(rate, burst, 100) for name, (rate, burst) in budgets.items()}
+    return TestClient(RateLimitMiddleware(ok, buckets, enabled=True, api_keys=api_keys))
+
+
+def test_rejects_with_retry_after_once_bucket_is_empty():
+    """Happy Path: The burst is allowed, then 429 with Retry-After."""
+    client = limited_client(default=(0.5, 2))
+    assert [client.get("/artists/genre").status_code for _ in range(2)] == [200, 200]
+    response = client.get("/artists/genre")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "2"
+    assert response.json() == {"detail": "Rate limit exceeded for default requests"}
+
+
+def test_expensive_routes_have_their_own_budget():
+    """Happy Path: Exhausting the radius budget leaves other requests alone."""
+    client = limited_client(default=(100, 100), radius=(0.1, 1), register=(0.1, 1))
+    assert client.get("/artists", params={"genre": "rock", "radius": 10}).status_code == 200
+    assert client.get("/artists", params={"radius": 10, "genre": "rock"}).status_code == 429
+    assert client.get("/artists", params={"genre": "rock"}).status_code == 200
+    assert client.post("/artists/register").status_code == 200
+    assert client.post("/artists/register/discography").status_code == 429
+
+
+def test_clients_are_keyed_by_api_key():
+    """Happy Path: Each known API key has its own buckets."""
+    client = limited_client(default=(0.1, 1))
+    assert client.get("/", headers={"X-API-Key": "a"}).status_code == 200
+    assert client.get("/", headers={"X-API-Key": "a"}).status_code == 429
+    assert client.get("/", headers={"X-API-Key": "b"}).status_code == 200
+
+
+def test_unknown_api_keys_share_the_address_budget():
+    """Sad Path: Rotating unknown keys from one address does not escape the limit."""
+    client = limited_client(default=(0.1, 2))
+    assert client.get("/", headers={"X-API-Key": "random-1"}).status_code == 200
+    assert client.get("/", headers={"X-API-Key": "random-2"}).status_code == 200
+    assert client.get("/", headers={"X-API-Key": "random-3"}).status_code == 429
+    assert client.get("/").status_code == 429
+    assert client.get("/", headers={"X-API-Key": "a"}).status_code == 200
+
+
+def test_health_checks_are_exempt():
+    """Sad Path: /ready and /metrics are never limited."""
+    client = limited_client(default=(0.1, 1))
+    assert {client.get("/ready").status_code for _ in range(5)} == {200}
+    assert budget_name({"path": "/metrics", "method": "GET"}) is None
+    assert budget_name({"path": "/artists", "method": "GET", "query_string": b"noradius=1"}) == "default"
+
+
+def test_encoded_radius_uses_the_radius_budget():
+    """Sad Path: Percent-encoding the parameter name does not dodge the radius budget."""
+    for query_string in (b"genre=rock&%72adius=10", b"genre=rock;x=1&r%61dius=", b"radius"):
+        scope = {"path": "/artists", "method": "GET", "query_string": query_string}
+        assert budget_name(scope) == "radius"
+
+
+def test_buckets_refill_and_drop_full():
+    """Edge Case: Tokens come back at the rate; full buckets are dropped when crowded."""
+    buckets = TokenBuckets(rate=2, burst=1, max_clients=2)
+    assert buckets.acquire("a", now=0.0) == 0
+    assert buckets.acquire("a", now=0.25) == 0.25
+    assert buckets.acquire("a", now=0.5) == 0
+    buckets.acquire("b", now=0.5)
+    buckets.acquire("c", now=10.0)
+    assert len(buckets) == 1
+    assert parse_budget("2:5") == (2.0, 5.0)
+    assert parse_budget("3") == (3.0, 3.0)
+    assert parse_budget("0") is None
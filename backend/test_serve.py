@@ -0,0 +1,69 @@
+"""
+Tests for the multi-process server mode and fork safety.
+"""
+import multiprocessing
+import os
+
+import pytest
+
+import database
+import lifecycle
+import serve
+from config import Config
+
+
+def test_worker_count_defaults_to_cpus():
+    """Happy Path: 0 means one worker per usable CPU; explicit counts are kept."""
+    assert serve.worker_count(3) == 3
+    assert serve.worker_count(0) >= 1
+
+
+def test_server_options_follow_config(monkeypatch):
+    """Happy Path: Recycling and shutdown settings come from Config."""
+    monkeypatch.setattr(Config, "WEB_WORKERS", 2)
+    monkeypatch.setattr(Config, "WEB_MAX_REQUESTS", 0)
+    options = serve.server_options()
+    assert options["workers"] == 2
+    assert options["limit_max_requests"] is None
+    assert options["timeout_graceful_shutdown"] == Config.WEB_GRACEFUL_TIMEOUT
+
+    monkeypatch.setattr(Config, "WEB_MAX_REQUESTS", 1000)
+    assert serve.server_options()["limit_max_requests"] == 1000
+
+
+def test_metrics_dir_is_shared_with_workers(monkeypatch, tmp_path):
+    """Happy Path: Several workers share a cleared metrics directory through the environment."""
+    monkeypatch.setattr(Config, "METRICS_DIR", "")
+    monkeypatch.delenv("METRICS_DIR", raising=False)
+    assert serve.prepare_metrics_dir(1) == ""
+
+    stale = tmp_path / "metrics-1.json"
+    stale.write_text("{}")
+    monkeypatch.setattr(Config, "METRICS_DIR", str(tmp_path))
+    assert serve.prepare_metrics_dir(4) == str(tmp_path)
+    assert os.environ["METRICS_DIR"] == str(tmp_path)
+    assert not stale.exists()
+
+def _report_inherited_state(queue):
+    queue.put((database._client is None, lifecycle.get_http_session() is None,
+               lifecycle.readiness.ready))
+
+
+@pytest.mark.skipif(not hasattr(os, "register_at_fork"), reason="needs os.register_at_fork")
+def test_forked_child_drops_parent_clients():
+    """Edge Case: A forked worker does not reuse the parent's clients."""
+    database.get_client()
+    lifecycle.open_http_session()
+    lifecycle.readiness.mark_ready()
+    try:
+        context = multiprocessing.get_context("fork")
+        queue = context.Queue()
+        child = context.Process(target=_report_inherited_state, args=(queue,))
+        child.start()
+        result = queue.get(timeout=10)
+        child.join(timeout=10)
+        assert result == (True, True, False)
+        assert database._client is not None
+    finally:
+        lifecycle.close_http_session()
+        lifecycle.readiness.mark_not_ready("starting")
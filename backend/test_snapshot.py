@@ -0,0 +1,132 @@
+"""
+Tests for the in-process catalog snapshot and the endpoints served from it.
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from config import Config
+from database import db
+from main import app
+from services.album_buckets import ALBUM_BUCKET_COLLECTION
+from services.artist_documents import PUBLIC_PROJECTION, prepare_artist_document, response_projection
+from services.snapshot import ArtistRecord, apply_projection, catalog_snapshot
+from utils.locations import location_filter
+
+client = TestClient(app)
+
+ARTISTS = [
+    {"name": "Bruce Springsteen", "genre": "rock", "location": "Long Branch, New Jersey, USA",
+     "coordinates": {"latitude": 40.3043, "longitude": -73.9924}, "summary": "The Boss",
+     "albums": [{"title": "Born to Run", "year": 1975,
+                 "tracks": [{"title": "Jungleland", "duration": 574}]}]},
+    {"name": "Bon Jovi", "genre": "rock", "location": "Sayreville, New Jersey, USA",
+     "coordinates": {"latitude": 40.4590, "longitude": -74.3610}},
+    {"name": "Nirvana", "genre": "rock", "location": "Aberdeen, Washington, USA",
+     "coordinates": {"latitude": 46.9754, "longitude": -123.8157}},
+    {"name": "Jersey Garage Band", "genre": "rock", "location": "Newark, New Jersey, USA"},
+    {"name": "Lorde", "genre": "pop", "location": "Auckland, New Zealand"},
+]
+
+
+@pytest.fixture(autouse=True)
+def snapshot(monkeypatch):
+    """Seed a small catalog and serve it from a loaded snapshot."""
+    db.artists.drop()
+    db[ALBUM_BUCKET_COLLECTION].drop()
+    db.artists.insert_many([prepare_artist_document(artist) for artist in ARTISTS])
+    monkeypatch.setattr(Config, "CATALOG_SNAPSHOT", True)
+    catalog_snapshot.load(db)
+    yield catalog_snapshot
+    db.artists.drop()
+    db[ALBUM_BUCKET_COLLECTION].drop()
+    catalog_snapshot.loaded = False
+
+
+def database_results(query, projection=PUBLIC_PROJECTION, limit=0):
+    return [
+        {key: value for key, value in document.items()}
+        for document in db.artists.find(query, projection).limit(limit)
+    ]
+
+
+@pytest.mark.parametrize("query", [
+    {"genre": "rock"},
+    dict({"genre": "rock"}, **location_filter(location="New Jersey")),
+    dict({"genre": "rock"}, **location_filter(city="Aberdeen")),
+    location_filter(country="New Zealand"),
+])
+@pytest.mark.parametrize("fields, expand", [(None, None), ("name,genre", None), (None, "albums")])
+def test_snapshot_matches_database(snapshot, query, fields, expand):
+    """Happy Path: The snapshot returns what the database does, for any projection."""
+    projection = response_projection(fields, expand)
+    assert snapshot.find(query, projection) == database_results(query, projection)
+
+
+def test_genre_and_name_endpoints_use_snapshot():
+    """Happy Path: Reads are answered from memory once the snapshot is loaded."""
+    db.artists.drop()
+    results = client.get("/artists/genre", params={"genre": "Rock", "n": 2}).json()["results"]
+    assert [artist["name"] for artist in results] == ["Bruce Springsteen", "Bon Jovi"]
+    artist = client.get("/artists/bruce springsteen", params={"expand": "tracks"}).json()
+    assert artist["albums"][0]["tracks"][0]["duration_seconds"] == 574
+    assert isinstance(artist["_id"], str)
+    results = client.get("/artists/location", params={"genre": "rock", "location": "Washington", "n": 5})
+    assert [artist["name"] for artist in results.json()["results"]] == ["Nirvana"]
+
+
+def test_radius_search_from_snapshot():
+    """Happy Path: Nearest first with distances; uncoordinated artists match on location."""
+    db.artists.drop()
+    response = client.get("/artists", params={
+        "genre": "rock", "latitude": 40.3, "longitude": -74.0, "radius": 50, "location": "New Jersey",
+    })
+    results = response.json()["results"]
+    assert [artist["name"] for artist in results] == ["Bruce Springsteen", "Bon Jovi", "Jersey Garage Band"]
+    assert results[0]["distance_mi"] < results[1]["distance_mi"]
+    assert "distance_mi" not in results[2]
+
+
+def test_writes_update_snapshot():
+    """Happy Path: Registrations through the worker are visible without a reload."""
+    client.post("/artists/register", json={"name": "Lana Del Rey", "genre": "pop", "location": "New York, USA"})
+    client.post("/artists/register/discography?artist_name=Lorde", json={
+        "title": "Melodrama", "year": "2017", "tracks": [{"title": "Green Light", "duration": "3:54"}],
+    })
+    db.artists.drop()
+    results = client.get("/artists/genre", params={"genre": "pop", "n": 5}).json()["results"]
+    assert [artist["name"] for artist in results] == ["Lorde", "Lana Del Rey"]
+    assert results[0]["albums"][0]["runtime_seconds"] == 234
+
+
+def test_artists_sharing_a_name_keep_their_records(snapshot):
+    """Edge Case: A second artist with the same name is added, and replaced only by its own _id."""
+    first = db.artists.find_one({"name": "Lorde"}, {"_id": 1})["_id"]
+    namesake = prepare_artist_document({"name": "LORDE", "genre": "folk", "location": "Oslo, Norway"})
+    namesake["_id"] = "namesake"
+    snapshot.record_artist_added(namesake)
+    snapshot.record_artist_added(dict(namesake, genre="jazz"))
+
+    assert len(snapshot) == len(ARTISTS) + 1
+    assert snapshot.find_by_name("lorde")["_id"] == first
+    assert snapshot.find({"genre": "folk"}) == []
+    assert [artist["_id"] for artist in snapshot.find({"genre": "jazz"})] == ["namesake"]
+    assert [artist["name"] for artist in snapshot.find({"genre": "pop"})] == ["Lorde"]
+
+
+def test_database_used_until_loaded(snapshot):
+    """Sad Path: Without a loaded snapshot the database answers."""
+    snapshot.loaded = False
+    db.artists.delete_many({"name": "Lorde"})
+    assert client.get("/artists/Lorde").status_code == 404
+
+
+def test_record_is_compact():
+    """Edge Case: Records have no __dict__, share strings and keep odd fields."""
+    document = prepare_artist_document({"name": "X", "genre": "".join(["ro", "ck"]), "label": "Sub Pop",
+                                        "coordinates": {"latitude": 1.0}})
+    document["_id"] = 1
+    record = ArtistRecord(document, None)
+    assert not hasattr(record, "__dict__")
+    assert record.genre is "rock"  # noqa: F632 - interned
+    assert record.extra == {"label": "Sub Pop", "coordinates": {"latitude": 1.0}}
+    assert apply_projection({"_id": 1, "a": {"b": 1, "c": 2}}, {"a.b": 1}) == {"_id": 1, "a": {"b": 1}}
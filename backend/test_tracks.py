@@ -0,0 +1,120 @@
+"""
+Tests for the flattened tracks collection and the /tracks/search endpoint.
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from database import db
+from main import app
+from services.album_buckets import ALBUM_BUCKET_COLLECTION
+from services.artist_documents import DERIVED_VERSION, prepare_artist_document
+from services.tracks import TRACK_COLLECTION, ensure_tracks, rebuild_tracks, search_tracks
+
+client = TestClient(app)
+
+ARTISTS = [
+    {"name": "Bruce Springsteen", "genre": "rock", "albums": [
+        {"title": "Greetings from Asbury Park, N.J.", "year": "1973", "tracks": [
+            {"title": "Blinded by the Light", "duration": "5:06"},
+        ]},
+        {"title": "Born to Run", "year": "1975", "tracks": [
+            {"title": "Thunder Road", "duration": "4:49"},
+            {"title": "Born to Run", "duration": "4:31"},
+            {"title": "Jungleland", "duration": "9:34"},
+        ]},
+    ]},
+    {"name": "Manfred Mann's Earth Band", "genre": "rock", "albums": [
+        {"title": "The Roaring Silence", "year": "1976", "tracks": [
+            {"title": "Blinded by the Light", "duration": "7:08"},
+        ]},
+    ]},
+    {"name": "Lorde", "genre": "pop"},
+]
+
+
+@pytest.fixture(autouse=True)
+def seeded():
+    """Seed a small catalog and flatten its tracks."""
+    db.artists.drop()
+    db[TRACK_COLLECTION].drop()
+    db[ALBUM_BUCKET_COLLECTION].drop()
+    db.artists.insert_many([prepare_artist_document(artist) for artist in ARTISTS])
+    rebuild_tracks(db)
+    yield
+    db.artists.drop()
+    db[TRACK_COLLECTION].drop()
+    db[ALBUM_BUCKET_COLLECTION].drop()
+
+
+def test_rebuild_flattens_every_track():
+    """Happy Path: One document per track, pointing at its album and artist."""
+    assert db[TRACK_COLLECTION].count_documents({}) == 5
+    track = db[TRACK_COLLECTION].find_one({"title": "Jungleland"})
+    springsteen = db.artists.find_one({"name": "Bruce Springsteen"})
+    assert track["artist_id"] == springsteen["_id"]
+    assert (track["album"], track["album_index"], track["track_number"]) == ("Born to Run", 1, 3)
+
+
+def test_search_tracks_exact_then_prefix_then_words():
+    """Happy Path: Exact titles rank before prefixes, and prefixes before word matches."""
+    response = client.get("/tracks/search", params={"q": "born to run"})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [(track["title"], track["match"]) for track in results] == [("Born to Run", "exact")]
+    assert results[0]["artist"] == "Bruce Springsteen"
+    assert "title_words" not in results[0]
+
+    matches = [(track["title"], track["match"]) for track in search_tracks(db, "Jungle")]
+    assert matches == [("Jungleland", "prefix")]
+    matches = [(track["artist"], track["match"]) for track in search_tracks(db, "the light")]
+    assert matches == [("Bruce Springsteen", "text"), ("Manfred Mann's Earth Band", "text")]
+
+
+def test_search_tracks_single_match_type():
+    """Happy Path: match= restricts the kind of match."""
+    results = client.get("/tracks/search", params={"q": "blinded", "match": "exact"}).json()["results"]
+    assert results == []
+    results = client.get("/tracks/search", params={"q": "BLINDED", "match": "prefix", "limit": 1}).json()
+    assert [track["artist"] for track in results["results"]] == ["Bruce Springsteen"]
+
+
+def test_registered_discography_is_searchable():
+    """Happy Path: Registering an album adds its tracks without a rebuild."""
+    client.post("/artists/register/discography?artist_name=Lorde", json={
+        "title": "Melodrama", "year": "2017",
+        "tracks": [{"title": "Green Light", "duration": "3:54"}],
+    })
+    results = client.get("/tracks/search", params={"q": "green light"}).json()["results"]
+    assert [(track["artist"], track["album"], track["album_index"]) for track in results] == [
+        ("Lorde", "Melodrama", 0)
+    ]
+    # A rebuild finds it in the album buckets, at the same index.
+    rebuild_tracks(db)
+    assert client.get("/tracks/search", params={"q": "green light"}).json()["results"] == results
+
+
+def test_search_tracks_rejects_bad_parameters():
+    """Sad Path: Unknown match types and out-of-range limits are rejected."""
+    assert client.get("/tracks/search", params={"q": "a", "match": "fuzzy"}).status_code == 400
+    assert client.get("/tracks/search", params={"q": "a", "limit": 0}).status_code == 400
+    assert client.get("/tracks/search", params={"q": "   "}).json()["results"] == []
+
+
+def test_ensure_tracks_only_when_empty():
+    """Edge Case: Startup rebuilds a missing collection and leaves an existing one alone."""
+    db[TRACK_COLLECTION].drop()
+    ensure_tracks(db)
+    assert db[TRACK_COLLECTION].count_documents({}) == 5
+    db[TRACK_COLLECTION].delete_one({"title": "Jungleland"})
+    ensure_tracks(db)
+    assert db[TRACK_COLLECTION].count_documents({}) == 4
+
+
+def test_ensure_tracks_rebuilds_rows_from_an_older_version():
+    """Edge Case: Rows built under an older derived version are rebuilt with the new fields."""
+    db[TRACK_COLLECTION].update_many({}, {"$set": {"duration": "190"}, "$unset": {"derived_version": "",
+                                                                                  "duration_seconds": ""}})
+    ensure_tracks(db)
+    rows = list(db[TRACK_COLLECTION].find())
+    assert len(rows) == 5
+    assert all(row["derived_version"] == DERIVED_VERSION and row["duration_seconds"] for row in rows)
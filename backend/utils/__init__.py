@@ -1,4 +1,3 @@
 """
-Geolocation utilities for the backend.
+Utility modules for the backend.
 """
-
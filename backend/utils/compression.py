@@ -0,0 +1,181 @@
+"""
+Negotiated response compression.
+
+``CompressionMiddleware`` picks the best encoding the client accepts
+(zstd, then brotli, then gzip) and compresses JSON and text bodies of at
+least ``Config.COMPRESSION_MIN_BYTES``. gzip is always available; brotli and
+zstd are used when the ``brotli`` and ``zstandard`` packages are installed.
+
+Responses that already carry a ``Content-Encoding`` (the response cache
+serves precompressed variants, see ``utils.response_cache``) pass through
+untouched. CPU time per compression, bytes in and out, and bytes saved are
+exported on ``/metrics``.
+"""
+import gzip
+import time
+from typing import Dict, List, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from config import Config
+from utils.metrics import COMPRESSED_RESPONSES, COMPRESSION_BYTES, COMPRESSION_SECONDS
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - depends on the environment
+    zstandard = None
+
+# (per-request level, level for cached bodies that are compressed only once)
+LEVELS: Dict[str, Tuple[int, int]] = {
+    "zstd": (3, 12),
+    "br": (4, 9),
+    "gzip": (6, 9),
+}
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+
+
+def available_encodings() -> List[str]:
+    """Supported encodings in order of preference."""
+    encodings = []
+    if zstandard is not None:
+        encodings.append("zstd")
+    if brotli is not None:
+        encodings.append("br")
+    encodings.append("gzip")
+    return encodings
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Choose a response encoding from an ``Accept-Encoding`` header.
+
+    Args:
+        accept_encoding: Header value, e.g. ``"gzip, br;q=0.9"``
+
+    Returns:
+        The supported encoding with the highest quality (ties go to the
+        server's preference), or None to send the body as is
+    """
+    if not accept_encoding:
+        return None
+    qualities: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[name.strip().lower()] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in available_encodings():
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body: bytes, encoding: str, cached: bool = False) -> bytes:
+    """
+    Compress a response body, recording CPU time and sizes.
+
+    Args:
+        body: Uncompressed bytes
+        encoding: One of ``available_encodings()``
+        cached: Use the higher level meant for bodies stored in the cache
+
+    Returns:
+        The compressed bytes
+    """
+    level = LEVELS[encoding][1 if cached else 0]
+    started = time.process_time()
+    if encoding == "zstd":
+        compressed = zstandard.ZstdCompressor(level=level).compress(body)
+    elif encoding == "br":
+        compressed = brotli.compress(body, quality=level)
+    else:
+        compressed = gzip.compress(body, compresslevel=level, mtime=0)
+    COMPRESSION_SECONDS.observe(time.process_time() - started, encoding,
+                                "cache" if cached else "response")
+    COMPRESSION_BYTES.inc(encoding, "in", amount=len(body))
+    COMPRESSION_BYTES.inc(encoding, "out", amount=len(compressed))
+    return compressed
+
+
+def is_compressible(headers: Headers, size: int, minimum_size: int) -> bool:
+    """Whether a response of this type and size is worth compressing."""
+    if size < minimum_size or "content-encoding" in headers:
+        return False
+    return headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+
+
+def encode_headers(headers: MutableHeaders, encoding: str, length: int) -> None:
+    """Mark response headers as carrying a body in ``encoding``."""
+    headers["Content-Encoding"] = encoding
+    headers["Content-Length"] = str(length)
+    vary = headers.get("vary")
+    if not vary:
+        headers["Vary"] = "Accept-Encoding"
+    elif "accept-encoding" not in vary.lower():
+        headers["Vary"] = f"{vary}, Accept-Encoding"
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing response bodies with the negotiated encoding.
+
+    The body is buffered so its size is known before choosing; streamed
+    responses (more than one body message) are sent uncompressed.
+    """
+
+    def __init__(self, app, minimum_size: Optional[int] = None):
+        self.app = app
+        self.minimum_size = Config.COMPRESSION_MIN_BYTES if minimum_size is None else minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        streaming = False
+
+        async def send_wrapper(message):
+            nonlocal start, streaming
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or streaming:
+                await send(message)
+                return
+            body = message.get("body", b"")
+            if message.get("more_body", False):
+                streaming = True
+                await send(start)
+                await send(message)
+                return
+
+            headers = MutableHeaders(raw=start["headers"])
+            if is_compressible(headers, len(body), self.minimum_size):
+                compressed = compress(body, encoding)
+                if len(compressed) < len(body):
+                    encode_headers(headers, encoding, len(compressed))
+                    COMPRESSED_RESPONSES.inc(encoding, "response")
+                    body = compressed
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,63 @@
+"""
+Track durations as integer seconds.
+
+Sources give durations as integer seconds (``expanded_schema.json``), as
+"m:ss" or "h:mm:ss" strings (the AudioDB scraper, registrations), or not at
+all. Stored tracks keep ``duration_seconds`` as the value to sort, sum and
+filter on, and ``duration`` as the "m:ss" display string derived from it.
+"""
+from typing import Optional
+
+
+def parse_duration(value) -> Optional[int]:
+    """
+    Parse a duration given as seconds or as an "m:ss" / "h:mm:ss" string.
+
+    Parameters
+    ----------
+    value : int | float | str | None
+        Raw duration
+
+    Returns
+    -------
+    int | None
+        Whole seconds, or None if the value is missing, negative or unparseable
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value) if value >= 0 else None
+    if not isinstance(value, str) or not value.strip():
+        return None
+    parts = value.strip().split(":")
+    if len(parts) > 3:
+        return None
+    seconds = 0
+    for index, part in enumerate(parts):
+        if not part.isdigit() or (index and int(part) >= 60):
+            return None
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+
+def format_duration(seconds: Optional[int]) -> Optional[str]:
+    """
+    Format seconds for display: "m:ss", or "h:mm:ss" from an hour up.
+
+    Parameters
+    ----------
+    seconds : int | None
+        Whole seconds
+
+    Returns
+    -------
+    str | None
+        The display string, or None for a missing duration
+    """
+    if seconds is None:
+        return None
+    hours, rest = divmod(int(seconds), 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
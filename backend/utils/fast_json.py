@@ -0,0 +1,133 @@
+"""
+Fast path from MongoDB results to JSON response bytes.
+
+The default path decodes BSON into dicts, rewrites ``_id`` with
+``serialize_doc``, walks everything again in FastAPI's ``jsonable_encoder``
+and once more in ``json.dumps``. For large result sets those walks dominate
+the request. Here the cursor returns raw BSON batches that are decoded in C
+with ``bson.decode_all``, and the documents go straight to ``orjson``
+(``ObjectId`` becomes its hex string on the way out), wrapped in a response
+class that FastAPI sends as is.
+
+orjson is optional: without it the standard ``json`` module is used with the
+same output, so only speed differs. Run ``python -m utils.fast_json`` to
+compare the two paths.
+"""
+import datetime
+import json
+from typing import Any, Dict, List, Optional
+
+import bson
+from bson import ObjectId
+from bson.codec_options import CodecOptions
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+_CODEC_OPTIONS = CodecOptions(document_class=dict)
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Encode a value as compact UTF-8 JSON.
+
+    Args:
+        content: JSON-compatible value, possibly containing ObjectIds
+
+    Returns:
+        The encoded bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(
+        content, default=_default, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def find_documents(
+    collection,
+    filter: Optional[Dict[str, Any]] = None,
+    projection: Optional[Dict[str, Any]] = None,
+    limit: int = 0,
+    max_time_ms: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Run a find and decode the results from raw BSON batches.
+
+    Args:
+        collection: pymongo Collection
+        filter: Query filter
+        projection: Fields to include or exclude
+        limit: Maximum number of documents (0 for no limit)
+        max_time_ms: Server-side time limit (None for no limit)
+
+    Returns:
+        The matching documents; ``_id`` is left as an ObjectId for ``dumps``
+    """
+    documents = []
+    options = {} if max_time_ms is None else {"max_time_ms": max_time_ms}
+    for batch in collection.find_raw_batches(filter or {}, projection, limit=limit, **options):
+        documents.extend(bson.decode_all(batch, _CODEC_OPTIONS))
+    return documents
+
+
+class FastJSONResponse(Response):
+    """JSON response encoded with ``dumps``, skipping ``jsonable_encoder``."""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def _benchmark(count: int = 2000, repeat: int = 5) -> None:
+    import time
+
+    from fastapi.encoders import jsonable_encoder
+
+    document = {
+        "_id": ObjectId(), "name": "Benchmark Artist", "genre": "rock",
+        "location": "Seattle, Washington, USA",
+        "coordinates": {"latitude": 47.6, "longitude": -122.3},
+        "albums": [
+            {"title": f"Album {a}", "year": "1999",
+             "tracks": [{"title": f"Track {t}", "duration": "3:45"} for t in range(12)]}
+            for a in range(4)
+        ],
+    }
+    raw = b"".join(bson.encode(dict(document, _id=ObjectId())) for _ in range(count))
+
+    def current():
+        documents = bson.decode_all(raw, _CODEC_OPTIONS)
+        for doc in documents:
+            doc["_id"] = str(doc["_id"])
+        return json.dumps(jsonable_encoder({"results": documents})).encode("utf-8")
+
+    def fast():
+        return dumps({"results": bson.decode_all(raw, _CODEC_OPTIONS)})
+
+    assert json.loads(current()) == json.loads(fast())
+    for name, path in (("current", current), ("fast", fast)):
+        best = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            path()
+            best = min(best, time.perf_counter() - started)
+        print(f"{name:>8}: {best * 1000:8.1f} ms for {count} documents "
+              f"({count / best:,.0f} docs/s)")
+    print(f"encoder: {'orjson' if orjson is not None else 'json'}")
+
+
+if __name__ == "__main__":
+    _benchmark()
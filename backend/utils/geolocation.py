@@ -3,21 +3,40 @@ Geolocation utility functions for geocoding and distance calculations.
 """
 import logging
 from typing import Optional, Tuple
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut, GeocoderServiceError, GeocoderUnavailable
 import time
 
+from config import Config
+from utils.metrics import GEOCODER_LATENCY, GEOCODER_RETRIES
+
 logger = logging.getLogger(__name__)
 
+# Mean Earth radius in miles, the unit of every distance in the API.
+EARTH_RADIUS_MI = 3958.8
+
 # Initialize geocoder with a user agent
 _geocoder = None
 
 
+def __getattr__(name):
+    # geopy pulls in aiohttp; only pay for it once a search needs geocoding.
+    if name == "Nominatim":
+        from geopy.geocoders import Nominatim
+
+        globals()["Nominatim"] = Nominatim
+        return Nominatim
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 def _get_geocoder():
     """Get or create the geocoder instance."""
     global _geocoder
     if _geocoder is None:
-        _geocoder = Nominatim(user_agent="cfyby-artist-search")
+        Nominatim = globals().get("Nominatim") or __getattr__("Nominatim")
+        options = {}
+        if Config.GEOCODER_DOMAIN:
+            # Self-hosted Nominatim (or a local stand-in for benchmarks)
+            options = {"domain": Config.GEOCODER_DOMAIN, "scheme": Config.GEOCODER_SCHEME}
+        _geocoder = Nominatim(user_agent="cfyby-artist-search", **options)
     return _geocoder
 
 
@@ -43,15 +62,27 @@ def geocode_location(location_string: str, retries: int = 3, delay: float = 1.0)
         logger.warning(f"Empty location string provided")
         return None
     
+    from geopy.exc import GeocoderTimedOut, GeocoderServiceError, GeocoderUnavailable
+
     geocoder = _get_geocoder()
     
     for attempt in range(retries):
         try:
             # Add delay to respect rate limits (except first attempt)
             if attempt > 0:
+                GEOCODER_RETRIES.inc()
                 time.sleep(delay * attempt)
             
-            location = geocoder.geocode(location_string, timeout=10)
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                location = geocoder.geocode(location_string, timeout=10)
+                outcome = "ok" if location else "not_found"
+            except GeocoderTimedOut:
+                outcome = "timeout"
+                raise
+            finally:
+                GEOCODER_LATENCY.observe(time.perf_counter() - started, outcome)
             
             if location:
                 return (location.latitude, location.longitude)
@@ -84,7 +115,7 @@ creds to @SecretNation
     """
     import math
     
-    R = 3958.8
+    R = EARTH_RADIUS_MI
     
     phi1 = math.radians(lat1)
     phi2 = math.radians(lat2)
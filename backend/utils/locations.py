@@ -0,0 +1,267 @@
+"""
+Parsing of free-text artist locations into normalized city/region/country.
+
+Source locations look like "Atlanta, Georgia, USA", "London, England",
+"Los Angeles, CA" or just "Japan". ``parse_location`` splits them into
+``normalize_text``-ed parts and resolves country aliases ("USA", "U.S.",
+"UK", "Porto Rico"...) to one canonical name, so queries can match the
+parts exactly (and use indexes) instead of running substring regexes over
+the whole string, where "Georgia" matches both the US state and the country.
+"""
+import re
+from typing import Dict, List, Optional
+
+from utils.text import normalize_text
+
+UNITED_STATES = "united states"
+UNITED_KINGDOM = "united kingdom"
+CANADA = "canada"
+
+US_STATES = {
+    "alabama": "al", "alaska": "ak", "arizona": "az", "arkansas": "ar", "california": "ca",
+    "colorado": "co", "connecticut": "ct", "delaware": "de", "florida": "fl", "georgia": "ga",
+    "hawaii": "hi", "idaho": "id", "illinois": "il", "indiana": "in", "iowa": "ia",
+    "kansas": "ks", "kentucky": "ky", "louisiana": "la", "maine": "me", "maryland": "md",
+    "massachusetts": "ma", "michigan": "mi", "minnesota": "mn", "mississippi": "ms",
+    "missouri": "mo", "montana": "mt", "nebraska": "ne", "nevada": "nv", "new hampshire": "nh",
+    "new jersey": "nj", "new mexico": "nm", "new york": "ny", "north carolina": "nc",
+    "north dakota": "nd", "ohio": "oh", "oklahoma": "ok", "oregon": "or", "pennsylvania": "pa",
+    "rhode island": "ri", "south carolina": "sc", "south dakota": "sd", "tennessee": "tn",
+    "texas": "tx", "utah": "ut", "vermont": "vt", "virginia": "va", "washington": "wa",
+    "west virginia": "wv", "wisconsin": "wi", "wyoming": "wy", "district of columbia": "dc",
+}
+_US_STATE_BY_ABBREVIATION = {abbreviation: state for state, abbreviation in US_STATES.items()}
+
+CANADIAN_PROVINCES = {
+    "alberta": "ab", "british columbia": "bc", "manitoba": "mb", "new brunswick": "nb",
+    "newfoundland and labrador": "nl", "nova scotia": "ns", "ontario": "on",
+    "prince edward island": "pe", "quebec": "qc", "saskatchewan": "sk",
+    "northwest territories": "nt", "nunavut": "nu", "yukon": "yt",
+}
+_PROVINCE_BY_ABBREVIATION = {abbreviation: name for name, abbreviation in CANADIAN_PROVINCES.items()}
+
+UK_NATIONS = {"england", "scotland", "wales", "northern ireland"}
+
+# Alternative spellings resolved to one canonical country name.
+COUNTRY_ALIASES = {
+    "usa": UNITED_STATES, "us": UNITED_STATES, "u.s.": UNITED_STATES, "u.s.a.": UNITED_STATES,
+    "u.s": UNITED_STATES, "united states of america": UNITED_STATES, "america": UNITED_STATES,
+    "uk": UNITED_KINGDOM, "u.k.": UNITED_KINGDOM, "great britain": UNITED_KINGDOM,
+    "britain": UNITED_KINGDOM,
+    "porto rico": "puerto rico",
+    "west germany": "germany", "east germany": "germany",
+    "holland": "netherlands", "the netherlands": "netherlands",
+    "ussr": "soviet union",
+}
+
+COUNTRIES = {
+    UNITED_STATES, UNITED_KINGDOM, CANADA, "argentina", "australia", "austria", "barbados",
+    "belgium", "brazil", "chile", "china", "colombia", "cuba", "czech republic", "denmark",
+    "finland", "france", "georgia", "germany", "greece", "haiti", "hungary", "iceland",
+    "india", "ireland", "israel", "italy", "jamaica", "japan", "mexico", "netherlands",
+    "new zealand", "nigeria", "norway", "poland", "portugal", "puerto rico", "romania",
+    "russia", "senegal", "south africa", "south korea", "soviet union", "spain", "sweden",
+    "switzerland", "trinidad and tobago", "turkey", "ukraine",
+}
+
+LOCATION_FIELDS = ("city", "region", "country")
+
+_SEPARATORS = re.compile(r"\s*,\s*")
+
+
+def canonical_country(value: Optional[str]) -> Optional[str]:
+    """
+    Resolve a country name or alias to its canonical normalized form.
+
+    Parameters
+    ----------
+    value : str | None
+        Country as written in the source ("USA", "U.K.", "England"...)
+
+    Returns
+    -------
+    str | None
+        Canonical country, or None if ``value`` is not a known country
+    """
+    key = normalize_text(value)
+    if key in COUNTRY_ALIASES:
+        return COUNTRY_ALIASES[key]
+    if key in UK_NATIONS:
+        return UNITED_KINGDOM
+    return key if key in COUNTRIES else None
+
+
+def _split(location: str) -> List[str]:
+    parts = (part.strip(" .") for part in _SEPARATORS.split(normalize_text(location)))
+    return [part for part in parts if part]
+
+
+def _is_province(part: str) -> bool:
+    return part in CANADIAN_PROVINCES or part in _PROVINCE_BY_ABBREVIATION
+
+
+def parse_location(location: Optional[str]) -> Dict[str, Optional[str]]:
+    """
+    Split a free-text location into normalized city, region and country.
+
+    The last part is taken as the country when it is a known country or
+    alias, then the new last part as the region. US states and Canadian
+    provinces (names or postal abbreviations) imply their country when none
+    is given. "Georgia" after a city with no country is read as the US state,
+    and on its own as the country.
+
+    Parameters
+    ----------
+    location : str | None
+        Location as written, e.g. "Athens, Georgia, USA"
+
+    Returns
+    -------
+    dict
+        ``city``, ``region`` and ``country``, each a normalized string or None
+    """
+    parsed = {"city": None, "region": None, "country": None}
+    parts = _split(location or "")
+    if not parts:
+        return parsed
+
+    last = parts[-1]
+    if last == "ca" and len(parts) > 1 and _is_province(parts[-2]):
+        # "Abbotsford, British Columbia, CA": CA is Canada, not California.
+        parsed["country"] = CANADA
+        parts.pop()
+    elif last in UK_NATIONS:
+        # "London, England": England is both the region and implies the country.
+        parsed["country"] = UNITED_KINGDOM
+    elif not (len(parts) > 1 and last in US_STATES):
+        country = canonical_country(last)
+        if country:
+            parsed["country"] = country
+            parts.pop()
+
+    if parts and (len(parts) > 1 or parsed["country"]):
+        region = parts[-1]
+        if parsed["country"] in (None, UNITED_STATES) and region in _US_STATE_BY_ABBREVIATION:
+            region = _US_STATE_BY_ABBREVIATION[region]
+        elif parsed["country"] in (None, CANADA) and region in _PROVINCE_BY_ABBREVIATION:
+            region = _PROVINCE_BY_ABBREVIATION[region]
+        if len(parts) > 1 or region in US_STATES or region in CANADIAN_PROVINCES \
+                or region in UK_NATIONS:
+            parsed["region"] = region
+            parts.pop()
+
+    if parsed["country"] is None:
+        if parsed["region"] in US_STATES:
+            parsed["country"] = UNITED_STATES
+        elif parsed["region"] in CANADIAN_PROVINCES:
+            parsed["country"] = CANADA
+    if parts:
+        parsed["city"] = parts[0]
+    return parsed
+
+
+def location_text(document: Dict) -> str:
+    """
+    The free-text location of an artist document.
+
+    Uses the ``location`` string, or failing that joins whatever
+    ``city``/``region``/``country`` fields the source provided (some sources
+    put a whole location string in ``country``).
+
+    Parameters
+    ----------
+    document : dict
+        Artist document
+
+    Returns
+    -------
+    str
+        Location as written, or an empty string
+    """
+    if document.get("location"):
+        return document["location"]
+    parts = []
+    for field in LOCATION_FIELDS:
+        value = document.get(field)
+        # Some sources repeat the city as the country ("Philadelphia").
+        if value and (not parts or normalize_text(parts[-1]) != normalize_text(value)):
+            parts.append(str(value))
+    return ", ".join(parts)
+
+
+def location_parts(document: Dict) -> Dict[str, Optional[str]]:
+    """
+    Normalized city/region/country for an artist document.
+
+    Documents whose ``country`` field is a known country keep their fields;
+    otherwise the location text is parsed.
+
+    Parameters
+    ----------
+    document : dict
+        Artist document
+
+    Returns
+    -------
+    dict
+        ``city``, ``region`` and ``country`` as from ``parse_location``
+    """
+    country = canonical_country(document.get("country"))
+    if country:
+        # Separate fields naming a known country are taken as given, so
+        # country "Georgia" is never re-read as the US state.
+        return {
+            "city": normalize_text(document.get("city")) or None,
+            "region": normalize_text(document.get("region")) or None,
+            "country": country,
+        }
+    return parse_location(location_text(document))
+
+
+def location_filter(
+    country: Optional[str] = None,
+    city: Optional[str] = None,
+    location: Optional[str] = None,
+) -> Dict:
+    """
+    Build an exact-match Mongo filter on the normalized location fields.
+
+    ``country`` and ``city`` match their field (country aliases resolved).
+    A free-text ``location`` is parsed like stored locations; when it names a
+    single place ("Seattle", "Georgia") it may be a city, region or country,
+    so all three fields are tried.
+
+    Parameters
+    ----------
+    country : str | None
+        Country name or alias
+    city : str | None
+        City name
+    location : str | None
+        Free-text location
+
+    Returns
+    -------
+    dict
+        Mongo filter, empty when no parameter is given
+    """
+    clauses = []
+    if country:
+        clauses.append({"country": canonical_country(country) or normalize_text(country)})
+    if city:
+        clauses.append({"city": normalize_text(city)})
+    if location:
+        parsed = {field: value for field, value in parse_location(location).items() if value}
+        parts = _split(location)
+        if len(parts) == 1:
+            place = parts[0]
+            clauses.append({"$or": [
+                {"city": place},
+                {"region": _US_STATE_BY_ABBREVIATION.get(place, place)},
+                {"country": canonical_country(place) or place},
+            ]})
+        elif parsed:
+            clauses.append(parsed)
+    if not clauses:
+        return {}
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
@@ -0,0 +1,325 @@
+"""
+Opt-in Mongo query diagnostics: a slow-query log with explain capture.
+
+When enabled (``QUERY_DIAGNOSTICS=true``), every query the app issues is
+recorded by *shape* (the filter/sort structure with literal values replaced
+by type placeholders) together with its call count and timings. Shapes that
+run slower than ``SLOW_QUERY_MS`` get their ``explain()`` plan captured, and
+plans that scan the whole collection (COLLSCAN) or sort in memory (SORT) are
+flagged.
+
+Explains are run lazily when a report is requested, never from inside the
+pymongo listener callback, so diagnostics add no round trips to requests.
+
+The same machinery backs the ``/debug/queries`` endpoint and the
+``capture_queries()`` test helper, which lets a test fail loudly when an
+index regression turns a lookup into a collection scan.
+"""
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from pymongo import monitoring
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Commands whose plans can be explained, mapped to where their filter lives.
+_EXPLAINABLE_COMMANDS = {
+    "find": "filter",
+    "count": "query",
+    "distinct": "query",
+    "findAndModify": "query",
+    "aggregate": "pipeline",
+    "update": "updates",
+    "delete": "deletes",
+}
+
+# Driver-added fields that must not be sent back inside an explain.
+_DRIVER_FIELDS = {
+    "$db", "lsid", "$clusterTime", "txnNumber", "$readPreference",
+    "readConcern", "writeConcern", "startTransaction", "autocommit",
+    "apiVersion", "apiStrict", "apiDeprecationErrors", "cursor",
+}
+
+_MAX_SHAPES = 500
+
+
+def query_shape(value: Any) -> Any:
+    """
+    Reduce a filter (or pipeline) to its shape.
+
+    Operator and field names are kept; literal values are replaced by their
+    type name so that ``{"name": "Prince"}`` and ``{"name": "Madonna"}``
+    share one shape.
+    """
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        if value and all(isinstance(item, dict) for item in value):
+            return [query_shape(item) for item in value]
+        return ["?"]
+    return f"<{type(value).__name__}>"
+
+
+def plan_stages(plan: Any) -> Set[str]:
+    """Collect every stage name appearing in an explain plan tree."""
+    stages: Set[str] = set()
+    if isinstance(plan, dict):
+        stage = plan.get("stage")
+        if isinstance(stage, str):
+            stages.add(stage)
+        for key, item in plan.items():
+            if key in ("inputStage", "inputStages", "queryPlan", "winningPlan",
+                       "queryPlanner", "shards", "stages", "$cursor"):
+                stages |= plan_stages(item)
+    elif isinstance(plan, list):
+        for item in plan:
+            stages |= plan_stages(item)
+    return stages
+
+
+def plan_flags(explain: Dict[str, Any]) -> List[str]:
+    """Flag full collection scans and in-memory sorts in an explain result."""
+    stages = plan_stages(explain)
+    flags = []
+    if "COLLSCAN" in stages:
+        flags.append("COLLSCAN")
+    if "SORT" in stages:
+        flags.append("SORT")
+    return flags
+
+
+def _shape_of_command(command_name: str, command: Dict[str, Any]) -> Any:
+    field = _EXPLAINABLE_COMMANDS[command_name]
+    target = command.get(field)
+    if command_name in ("update", "delete"):
+        # Bulk write commands carry a list of statements; their "q" is the filter.
+        target = [statement.get("q", {}) for statement in target or []][:1]
+    shape = {field: query_shape(target)}
+    if command.get("sort"):
+        shape["sort"] = query_shape(command["sort"])
+    if command.get("projection"):
+        shape["projection"] = sorted(command["projection"])
+    return shape
+
+
+def _sample_command(command_name: str, command: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The command to explain for a shape: bulk updates and deletes are cut to
+    their first statement, the one ``_shape_of_command`` describes.
+    """
+    if command_name in ("update", "delete"):
+        field = _EXPLAINABLE_COMMANDS[command_name]
+        return dict(command, **{field: list(command.get(field) or [])[:1]})
+    return command
+
+
+class QueryShapeStats:
+    """Timings and plan information for one query shape."""
+
+    def __init__(self, database: str, collection: str, command_name: str, shape: Any):
+        self.database = database
+        self.collection = collection
+        self.command_name = command_name
+        self.shape = shape
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.last_seen = 0.0
+        self.sample_command: Optional[Dict[str, Any]] = None
+        self.explain: Optional[Dict[str, Any]] = None
+        self.flags: List[str] = []
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "database": self.database,
+            "collection": self.collection,
+            "command": self.command_name,
+            "shape": self.shape,
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "explained": self.explain is not None,
+            "flags": self.flags,
+            "winning_plan_stages": sorted(plan_stages(self.explain)) if self.explain else [],
+        }
+
+
+class QueryDiagnostics(monitoring.CommandListener):
+    """
+    pymongo command listener recording query shapes and timings.
+
+    Attach it to a ``MongoClient`` through ``event_listeners`` and call
+    ``attach_client()`` so that explains can be issued later.
+    """
+
+    def __init__(self, enabled: bool = False, slow_ms: float = 100.0):
+        self.enabled = enabled
+        self.slow_ms = slow_ms
+        self._client = None
+        self._lock = threading.Lock()
+        self._inflight: Dict[Tuple[Any, int], Tuple[str, str, Dict[str, Any]]] = {}
+        self._shapes: Dict[str, QueryShapeStats] = {}
+
+    def attach_client(self, client) -> None:
+        """Client used to run explain commands for slow shapes."""
+        self._client = client
+
+    def reset(self) -> None:
+        """Forget every recorded shape."""
+        with self._lock:
+            self._inflight.clear()
+            self._shapes.clear()
+
+    # -- pymongo listener callbacks -------------------------------------
+
+    def started(self, event):
+        if not self.enabled or event.command_name not in _EXPLAINABLE_COMMANDS:
+            return
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            return
+        command = {
+            key: value for key, value in event.command.items()
+            if key not in _DRIVER_FIELDS
+        }
+        with self._lock:
+            self._inflight[(event.connection_id, event.request_id)] = (
+                event.database_name, collection, command
+            )
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event)
+
+    def _finish(self, event):
+        if not self._inflight:
+            return
+        with self._lock:
+            entry = self._inflight.pop((event.connection_id, event.request_id), None)
+        if entry is None:
+            return
+
+        database, collection, command = entry
+        duration_ms = event.duration_micros / 1000
+        shape = _shape_of_command(event.command_name, command)
+        key = json.dumps([database, collection, event.command_name, shape],
+                         sort_keys=True, default=str)
+
+        with self._lock:
+            stats = self._shapes.get(key)
+            if stats is None:
+                if len(self._shapes) >= _MAX_SHAPES:
+                    return
+                stats = self._shapes[key] = QueryShapeStats(
+                    database, collection, event.command_name, shape
+                )
+            stats.count += 1
+            stats.total_ms += duration_ms
+            stats.max_ms = max(stats.max_ms, duration_ms)
+            stats.last_seen = time.time()
+            if duration_ms >= self.slow_ms and stats.explain is None:
+                stats.sample_command = _sample_command(event.command_name, command)
+
+    # -- reporting --------------------------------------------------------
+
+    def explain_pending(self) -> None:
+        """Run explain for every slow shape that has not been explained yet."""
+        if self._client is None:
+            return
+        with self._lock:
+            pending = [stats for stats in self._shapes.values()
+                       if stats.sample_command is not None and stats.explain is None]
+        for stats in pending:
+            try:
+                explain = self._client[stats.database].command(
+                    {"explain": stats.sample_command, "verbosity": "queryPlanner"}
+                )
+            except Exception as e:
+                logger.warning(f"Could not explain {stats.command_name} on "
+                               f"{stats.collection}: {e}")
+                continue
+            stats.explain = explain
+            stats.flags = plan_flags(explain)
+            stats.sample_command = None
+            if stats.flags:
+                logger.warning(
+                    f"Query on '{stats.collection}' uses {', '.join(stats.flags)}: "
+                    f"{json.dumps(stats.shape, default=str)}"
+                )
+
+    def shapes(self) -> List[QueryShapeStats]:
+        with self._lock:
+            return list(self._shapes.values())
+
+    def report(self) -> Dict[str, Any]:
+        """Explain pending slow shapes and return every recorded shape."""
+        self.explain_pending()
+        shapes = sorted(self.shapes(), key=lambda stats: stats.total_ms, reverse=True)
+        return {
+            "enabled": self.enabled,
+            "slow_ms": self.slow_ms,
+            "shapes": [stats.to_dict() for stats in shapes],
+            "flagged": [stats.to_dict() for stats in shapes if stats.flags],
+        }
+
+
+diagnostics = QueryDiagnostics(
+    enabled=Config.QUERY_DIAGNOSTICS, slow_ms=Config.SLOW_QUERY_MS
+)
+
+
+class QueryCapture:
+    """Result of ``capture_queries()``: the shapes recorded inside the block."""
+
+    def __init__(self, recorder: QueryDiagnostics):
+        self._recorder = recorder
+
+    @property
+    def shapes(self) -> List[QueryShapeStats]:
+        self._recorder.explain_pending()
+        return self._recorder.shapes()
+
+    def flagged(self, collection: Optional[str] = None) -> List[QueryShapeStats]:
+        return [stats for stats in self.shapes
+                if stats.flags and (collection is None or stats.collection == collection)]
+
+    def assert_indexed(self, collection: Optional[str] = None) -> None:
+        """Fail if any captured query used a COLLSCAN or in-memory SORT."""
+        flagged = self.flagged(collection)
+        if flagged:
+            details = "\n".join(
+                f"  {stats.command_name} {stats.collection} {stats.flags}: "
+                f"{json.dumps(stats.shape, default=str)}"
+                for stats in flagged
+            )
+            raise AssertionError(f"Unindexed queries detected:\n{details}")
+
+
+@contextmanager
+def capture_queries(recorder: QueryDiagnostics = diagnostics) -> Iterator[QueryCapture]:
+    """
+    Record and explain every query issued inside the ``with`` block.
+
+    Intended for tests::
+
+        with capture_queries() as captured:
+            client.get("/artists/Prince")
+        captured.assert_indexed("artists")
+    """
+    previous = (recorder.enabled, recorder.slow_ms)
+    recorder.reset()
+    recorder.enabled, recorder.slow_ms = True, 0.0
+    try:
+        yield QueryCapture(recorder)
+    finally:
+        recorder.explain_pending()
+        recorder.enabled, recorder.slow_ms = previous
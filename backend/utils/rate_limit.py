@@ -0,0 +1,209 @@
+"""
+Per-client token-bucket rate limiting.
+
+``RateLimitMiddleware`` gives every client one token bucket per budget and
+answers ``429 Too Many Requests`` with a ``Retry-After`` header once a
+bucket is empty. Clients are identified by their ``X-API-Key`` header when
+it is one of ``Config.RATE_LIMIT_API_KEYS``, or by their address otherwise:
+an unverified key would let a client skip its budgets (and grow the bucket
+table) by sending a new key with every request. Requests fall into one of these budgets:
+
+- ``radius``: ``GET /artists`` with a ``radius`` (a geocode and a geo query)
+- ``cloud``: ``/cloud/artists`` and ``/federated/artists`` (upstream calls)
+- ``register``: ``POST /artists/register`` and ``/artists/register/discography``
+- ``default``: everything else, except ``/ready`` and ``/metrics``
+
+Each budget is ``"rate:burst"`` in ``Config``: tokens refilled per second,
+and the bucket size. ``0`` leaves the budget unlimited. Buckets are plain
+lists updated on the event loop thread, so an allowed request costs a dict
+lookup and a little arithmetic. Idle buckets that have refilled completely
+are dropped once there are more than ``Config.RATE_LIMIT_MAX_CLIENTS``, since
+a full bucket behaves exactly like a new one.
+
+Buckets live in each worker process and are not shared, so with ``serve.py``
+running N workers a client that spreads its requests over them gets up to N
+times each budget's rate and burst. Set the budgets per worker accordingly.
+
+Run ``python -m utils.rate_limit`` to measure the per-request overhead.
+"""
+import math
+import time
+from typing import AbstractSet, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+from starlette.responses import JSONResponse
+
+from config import Config
+from utils.metrics import RATE_LIMITED
+
+# Health checks and scrapes are never limited.
+EXEMPT_PATHS = frozenset({"/ready", "/metrics"})
+
+
+def parse_budget(value: str) -> Optional[Tuple[float, float]]:
+    """
+    Parse a ``"rate:burst"`` budget.
+
+    Args:
+        value: Tokens per second and bucket size, e.g. ``"2:5"``; the burst
+            defaults to the rate
+
+    Returns:
+        ``(rate, burst)``, or None for an unlimited budget
+    """
+    rate, _, burst = value.strip().partition(":")
+    rate_value = float(rate or 0)
+    if rate_value <= 0:
+        return None
+    return rate_value, max(float(burst or rate_value), 1.0)
+
+
+def budget_name(scope) -> Optional[str]:
+    """The budget a request draws from, or None when it is exempt."""
+    path = scope["path"]
+    if path in EXEMPT_PATHS:
+        return None
+    if path.startswith("/artists/register") and scope["method"] == "POST":
+        return "register"
+    if path in ("/cloud/artists", "/federated/artists"):
+        return "cloud"
+    if path == "/artists" and scope.get("query_string"):
+        # Decoded as the app decodes it, so "%72adius=" still counts as a radius.
+        query = parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True)
+        if any(name == "radius" for name, _ in query):
+            return "radius"
+    return "default"
+
+
+def client_key(scope, api_keys: AbstractSet[str] = frozenset()) -> str:
+    """The API key if the request has a known one, else the client address."""
+    if api_keys:
+        for name, value in scope.get("headers", ()):
+            if name == b"x-api-key" and value:
+                key = value.decode("latin-1")
+                if key in api_keys:
+                    return "key:" + key
+                break
+    client = scope.get("client")
+    return "addr:" + (client[0] if client else "unknown")
+
+
+class TokenBuckets:
+    """One budget's buckets, keyed by client."""
+
+    def __init__(self, rate: float, burst: float, max_clients: int):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        # client -> [tokens, monotonic time of the last update]
+        self._buckets: Dict[str, List[float]] = {}
+        # Size at which full buckets are next dropped; grows when few are, so
+        # many active clients do not make every new one pay for a sweep.
+        self._sweep_at = max_clients
+
+    def acquire(self, client: str, now: float) -> float:
+        """
+        Take a token for ``client``.
+
+        Returns:
+            0 if the request may proceed, else the seconds until a token is available
+        """
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            if len(self._buckets) >= self._sweep_at:
+                self._drop_full(now)
+            self._buckets[client] = [self.burst - 1, now]
+            return 0.0
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0.0
+        bucket[0] = tokens
+        return (1 - tokens) / self.rate
+
+    def _drop_full(self, now: float) -> None:
+        self._buckets = {
+            client: bucket for client, bucket in self._buckets.items()
+            if bucket[0] + (now - bucket[1]) * self.rate < self.burst
+        }
+        self._sweep_at = max(self.max_clients, 2 * len(self._buckets))
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+def configured_budgets() -> Dict[str, TokenBuckets]:
+    """Token buckets for every limited budget in ``Config``."""
+    budgets = {}
+    for name, value in (("default", Config.RATE_LIMIT_DEFAULT), ("radius", Config.RATE_LIMIT_RADIUS),
+                        ("cloud", Config.RATE_LIMIT_CLOUD), ("register", Config.RATE_LIMIT_REGISTER)):
+        parsed = parse_budget(value)
+        if parsed is not None:
+            budgets[name] = TokenBuckets(*parsed, Config.RATE_LIMIT_MAX_CLIENTS)
+    return budgets
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware enforcing the per-client budgets.
+
+    Install it inside ``CORSMiddleware`` so 429 responses carry CORS headers
+    and browsers can read ``Retry-After``.
+    """
+
+    def __init__(self, app, budgets: Optional[Dict[str, TokenBuckets]] = None,
+                 enabled: Optional[bool] = None, api_keys: Optional[Iterable[str]] = None):
+        self.app = app
+        self.budgets = configured_budgets() if budgets is None else budgets
+        self.enabled = Config.RATE_LIMIT_ENABLED if enabled is None else enabled
+        self.api_keys = Config.RATE_LIMIT_API_KEYS if api_keys is None else frozenset(api_keys)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+        name = budget_name(scope)
+        buckets = self.budgets.get(name) if name else None
+        if buckets is not None:
+            wait = buckets.acquire(client_key(scope, self.api_keys), time.monotonic())
+            if wait:
+                RATE_LIMITED.inc(name)
+                response = JSONResponse(
+                    {"detail": f"Rate limit exceeded for {name} requests"},
+                    status_code=429,
+                    headers={"Retry-After": str(math.ceil(wait))},
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+def _measure_overhead(iterations: int = 50_000) -> None:
+    """Print the per-request cost of the middleware on allowed requests."""
+    import asyncio
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def noop_send(message):
+        pass
+
+    async def run(target, count):
+        scope = {"type": "http", "method": "GET", "path": "/artists/genre",
+                 "query_string": b"genre=rock&n=10", "client": ("10.0.0.1", 5000),
+                 "headers": [(b"host", b"localhost"), (b"accept-encoding", b"gzip")]}
+        began = time.perf_counter()
+        for _ in range(count):
+            await target(dict(scope), None, noop_send)
+        return (time.perf_counter() - began) / count
+
+    limited = RateLimitMiddleware(app, {"default": TokenBuckets(1e9, 1e9, 10_000)}, enabled=True)
+    bare = asyncio.run(run(app, iterations))
+    wrapped = asyncio.run(run(limited, iterations))
+    print(f"middleware overhead: {(wrapped - bare) * 1e6:.2f} us per allowed request")
+
+
+if __name__ == "__main__":
+    _measure_overhead()
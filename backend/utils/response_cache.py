@@ -0,0 +1,201 @@
+"""
+Per-worker cache of hot GET responses, stored with their compressed variants.
+
+``ResponseCacheMiddleware`` keeps the body of successful GET responses on
+``Config.RESPONSE_CACHE_PATHS`` for ``Config.RESPONSE_CACHE_SECONDS``, keyed
+by path and query string. Each entry also keeps one compressed copy per
+encoding, made the first time a client asks for it (at the higher "cached"
+level, since it is paid once), so a popular query is compressed once rather
+than on every hit. Any successful write through the worker clears the cache
+(POST routes in ``READ_ONLY_POSTS`` are lookups, not writes, and leave it);
+writes through other workers evict the entries they affect when this worker
+picks them up from the catalog changelog (see ``services/catalog_changes.py``).
+
+The cache is off by default (``RESPONSE_CACHE_SECONDS=0``).
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from config import Config
+from utils.compression import compress, encode_headers, is_compressible, negotiate
+from utils.metrics import COMPRESSED_RESPONSES, record_cache_lookup
+
+Key = Tuple[str, bytes]
+
+WRITE_METHODS = frozenset({"POST", "PUT", "PATCH", "DELETE"})
+
+# POST routes that only read, taking their input in the body because it is
+# too large for a query string.
+READ_ONLY_POSTS = frozenset({"/artists/batch"})
+
+
+class CachedResponse:
+    """A response body with its headers and compressed variants."""
+
+    __slots__ = ("status", "headers", "body", "route", "expires", "variants", "_lock")
+
+    def __init__(self, status: int, headers: List[Tuple[bytes, bytes]], body: bytes,
+                 route, expires: float):
+        self.status = status
+        self.headers = [(name, value) for name, value in headers if name.lower() != b"content-length"]
+        self.body = body
+        # The matched route, so hits are still labelled by route in metrics.
+        self.route = route
+        self.expires = expires
+        self.variants: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def variant(self, encoding: Optional[str], minimum_size: int) -> Tuple[Optional[str], bytes]:
+        """
+        The body to send for a negotiated encoding.
+
+        Returns:
+            The encoding actually applied (None when sent as is) and the bytes
+        """
+        if encoding is None or not is_compressible(
+            Headers(raw=self.headers), len(self.body), minimum_size
+        ):
+            return None, self.body
+        with self._lock:
+            compressed = self.variants.get(encoding)
+            if compressed is None:
+                compressed = compress(self.body, encoding, cached=True)
+                if len(compressed) >= len(self.body):
+                    # Not worth it; remember to send this encoding uncompressed.
+                    compressed = self.body
+                self.variants[encoding] = compressed
+        if compressed is self.body:
+            return None, self.body
+        return encoding, compressed
+
+
+class ResponseCache:
+    """Bounded TTL cache of responses, least recently used evicted first."""
+
+    def __init__(self, ttl_seconds: float, max_entries: int, paths: Sequence[str]):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.paths = frozenset(paths)
+        self._entries: "OrderedDict[Key, CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 and self.max_entries > 0
+
+    def get(self, key: Key) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: Key, status: int, headers, body: bytes, route=None) -> CachedResponse:
+        entry = CachedResponse(status, headers, body, route, time.monotonic() + self.ttl_seconds)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def evict(self, predicate: Callable[[Key], bool]) -> int:
+        """Drop the entries whose key matches ``predicate``; returns how many."""
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                del self._entries[key]
+        return len(keys)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+response_cache = ResponseCache(
+    Config.RESPONSE_CACHE_SECONDS, Config.RESPONSE_CACHE_MAX_ENTRIES, Config.RESPONSE_CACHE_PATHS
+)
+
+
+class ResponseCacheMiddleware:
+    """
+    ASGI middleware serving cached GET responses.
+
+    Install it inside ``CompressionMiddleware``: cached responses leave with
+    their ``Content-Encoding`` set, so they are not compressed again.
+    """
+
+    def __init__(self, app, cache: Optional[ResponseCache] = None,
+                 minimum_size: Optional[int] = None):
+        self.app = app
+        self.cache = response_cache if cache is None else cache
+        self.minimum_size = Config.COMPRESSION_MIN_BYTES if minimum_size is None else minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.cache.enabled:
+            await self.app(scope, receive, send)
+            return
+        if scope["method"] in WRITE_METHODS and scope["path"] not in READ_ONLY_POSTS:
+            await self._write_through(scope, receive, send)
+            return
+        if scope["method"] != "GET" or scope["path"] not in self.cache.paths:
+            await self.app(scope, receive, send)
+            return
+
+        key = (scope["path"], scope.get("query_string", b""))
+        entry = self.cache.get(key)
+        record_cache_lookup("responses", entry is not None)
+        if entry is None:
+            messages = []
+
+            async def capture(message):
+                messages.append(message)
+
+            await self.app(scope, receive, capture)
+            start, bodies = messages[0], messages[1:]
+            if start["status"] != 200 or len(bodies) != 1 or bodies[0].get("more_body"):
+                for message in messages:
+                    await send(message)
+                return
+            entry = self.cache.put(key, start["status"], start["headers"],
+                                   bodies[0].get("body", b""), scope.get("route"))
+        elif entry.route is not None:
+            scope["route"] = entry.route
+
+        encoding, body = entry.variant(
+            negotiate(Headers(scope=scope).get("accept-encoding")), self.minimum_size
+        )
+        headers = MutableHeaders(raw=list(entry.headers))
+        if encoding:
+            encode_headers(headers, encoding, len(body))
+            COMPRESSED_RESPONSES.inc(encoding, "cache")
+        else:
+            headers["Content-Length"] = str(len(body))
+        await send({"type": "http.response.start", "status": entry.status, "headers": headers.raw})
+        await send({"type": "http.response.body", "body": body})
+
+    async def _write_through(self, scope, receive, send):
+        """Run a write and clear the cache if it succeeded."""
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if status[0] < 400:
+                self.cache.clear()
@@ -0,0 +1,54 @@
+"""
+Text normalization helpers shared by lookups, dedupe and indexing.
+"""
+import re
+import unicodedata
+from typing import Optional
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(value: Optional[str]) -> str:
+    """
+    Normalize a free-text value (artist name, city, genre...) for comparison.
+
+    Applies Unicode NFKC folding, case folding and whitespace collapsing so
+    that "  Bruce   SPRINGSTEEN " and "bruce springsteen" compare equal.
+
+    Parameters
+    ----------
+    value : str | None
+        Raw text to normalize
+
+    Returns
+    -------
+    str
+        Normalized text, or an empty string for empty input
+    """
+    if not value:
+        return ""
+    value = unicodedata.normalize("NFKC", value).casefold()
+    return _WHITESPACE.sub(" ", value).strip()
+
+
+def prefix_end(prefix: str) -> str:
+    """
+    The smallest string greater than every string starting with ``prefix``.
+
+    ``[prefix, prefix_end(prefix))`` is the range of strings with that
+    prefix, for bisection or an indexed ``$gte``/``$lt`` query.
+
+    Parameters
+    ----------
+    prefix : str
+        Non-empty prefix
+
+    Returns
+    -------
+    str
+        Exclusive upper bound of the prefix range
+    """
+    last = ord(prefix[-1])
+    if last >= 0x10FFFF:
+        return prefix + "\U0010FFFF"
+    return prefix[:-1] + chr(last + 1)